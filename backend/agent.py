@@ -3,24 +3,66 @@ Ticket analysis using LangChain + Groq (Llama 3.1 70B).
 
 OPTIMISATION:  Analysis + draft reply are produced in a **single** LLM call
 so each email costs only 1 API request (Groq free tier = 30 req/min).
+
+ROUTING:  A local pre-classification (urgency rules / trained model) sends
+clearly low-risk mail to a cheap 8B model with a short draft budget; High
+and Fraud — and anything the pre-classifier is unsure about — stay on 70B.
+
+ENGINE:  LangChain structured output by default; AGENT_ENGINE=native calls
+Groq directly in JSON mode with a compact schema (native_agent.py).
+
+LAZY DRAFTS:  write_draft() writes the reply alone, as plain text, for a
+ticket that was created from the analysis-only call (DRAFT_MODE=lazy);
+astream_draft() streams it piece by piece for the SSE endpoint.
+
+DEGRADED MODE:  Every Groq call goes through circuit_breaker.groq_breaker.
+While it is open the public functions raise CircuitOpenError immediately
+and callers use degraded_analysis() — local triage + a template draft.
 """
 
 import os
-import hashlib
-from functools import lru_cache
+import re
+import json
+import time
+import asyncio
+import groq
+from dataclasses import dataclass
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
 
-from schemas import TicketAnalysis, TicketAnalysisWithDraft
+from schemas import TicketAnalysis, TicketAnalysisWithDraft, BatchTicketAnalysis
+from result_cache import ResultCache
+from persistent_cache import llm_store, make_key, prompt_version
+from single_flight import SingleFlight
+from rate_limiter import limiter, build_http_client, build_async_http_client, RateLimitExceeded
+from tokens import estimate_tokens, estimate_prompt_tokens
+from fake_llm import FAKE_LLM, fake_chains, fake_draft_chain, fake_summary_chain, cache_model
+from urgency_classifier import local_verdict, offline_verdict, get_parent_category
+from preprocess import preprocess_email, split_header
+from chunking import MapReducer, SUMMARY_SYSTEM_PROMPT, SUMMARY_HUMAN_PROMPT, CHUNK_SUMMARY_MAX_TOKENS
+from usage import track, record_hit
+from circuit_breaker import groq_breaker, CircuitOpenError
+from hedging import hedger, Attempt
+from timing import in_scope
+from metrics import LLM_FIRST_TOKEN_SECONDS
+import native_agent
+from native_agent import native_prompt
+from json_repair import (
+    StructuredOutputError, structured_output, rejected_output, coerce_enums, repair_json,
+    with_retries, awith_retries,
+)
 
 # ── Load env ──
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-if not GROQ_API_KEY:
+if not GROQ_API_KEY and not FAKE_LLM:
     raise ValueError(
         "GROQ_API_KEY is not set. "
         "Add it to your .env file: GROQ_API_KEY=gsk_..."
@@ -28,24 +70,64 @@ if not GROQ_API_KEY:
 
 # ────────────────────── LLM Setup ──────────────────────
 
+MODEL_NAME = "llama-3.3-70b-versatile"
+
 llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    api_key=GROQ_API_KEY,
+    model=MODEL_NAME,
+    api_key=GROQ_API_KEY or "unused-offline",  # LLM_BACKEND=fake never calls Groq
     temperature=0,            # deterministic for classification
     max_tokens=2048,          # enough for analysis + full draft
     request_timeout=60,
+    # Report Groq's x-ratelimit-* headers to the shared limiter
+    http_client=build_http_client(),
+    http_async_client=build_async_http_client(),
 )
 
 # Structured output — forces the LLM to return valid JSON matching
-# our Pydantic schema (analysis + draft combined).
-structured_llm = llm.with_structured_output(TicketAnalysisWithDraft)
+# our Pydantic schema (analysis + draft combined). include_raw=True keeps
+# the raw tool call when validation fails so json_repair.py can fix it.
+structured_llm = llm.with_structured_output(TicketAnalysisWithDraft, include_raw=True)
 
 # Also keep an analysis-only structured LLM for the /analyze endpoint
-structured_llm_analysis_only = llm.with_structured_output(TicketAnalysis)
+structured_llm_analysis_only = llm.with_structured_output(TicketAnalysis, include_raw=True)
 
 # ────────────────────── Combined Prompt ──────────────────────
 # One prompt that asks for BOTH analysis AND draft reply in a single call.
 
+# Draft-writing rules — shared by the combined prompt and the draft-only
+# prompt used for lazy drafts (DRAFT_MODE=lazy in main.py).
+DRAFT_RULES = """\
+═══ PART B — DRAFT REPLY RULES ═══
+
+Write a professional, empathetic plain-text email reply (80-150 words).
+
+1. GREETING — "Dear <customer_name>," (or "Dear Valued Customer," if unknown).
+
+2. TONE BY CATEGORY:
+   • Fraud:
+     – Express urgent concern and empathy
+     – Assure account security is top priority
+     – State fraud/security team is investigating
+     – Advise "We have temporarily secured your account"
+     – Provide hotline: 1-800-FRAUD-HELP
+   • Payment Issue:
+     – Acknowledge inconvenience with empathy
+     – Payment/billing team is reviewing
+     – Reference number: [REF-XXXXXX]
+     – Resolution: 2-3 business days
+   • General:
+     – Polite, warm, professional
+     – Helpful and informative
+     – Offer further assistance
+
+3. CLOSING — End with:
+   "Best regards,
+   Finance Support Team
+   finance-support@company.com"
+
+4. Do NOT use markdown. Plain text only.
+"""
+
 COMBINED_SYSTEM_PROMPT = """\
 You are a senior financial support triage agent AND a professional customer \
 support writer. You will analyse an incoming customer email and produce:
@@ -90,36 +172,7 @@ CATEGORY:
 
 SUMMARY — Concise 1-2 sentence summary for the support agent.
 
-═══ PART B — DRAFT REPLY RULES ═══
-
-Write a professional, empathetic plain-text email reply (80-150 words).
-
-1. GREETING — "Dear <customer_name>," (or "Dear Valued Customer," if unknown).
-
-2. TONE BY CATEGORY:
-   • Fraud:
-     – Express urgent concern and empathy
-     – Assure account security is top priority
-     – State fraud/security team is investigating
-     – Advise "We have temporarily secured your account"
-     – Provide hotline: 1-800-FRAUD-HELP
-   • Payment Issue:
-     – Acknowledge inconvenience with empathy
-     – Payment/billing team is reviewing
-     – Reference number: [REF-XXXXXX]
-     – Resolution: 2-3 business days
-   • General:
-     – Polite, warm, professional
-     – Helpful and informative
-     – Offer further assistance
-
-3. CLOSING — End with:
-   "Best regards,
-   Finance Support Team
-   finance-support@company.com"
-
-4. Do NOT use markdown. Plain text only.
-
+""" + DRAFT_RULES + """
 Return ALL fields in a single JSON response.
 """
 
@@ -151,41 +204,562 @@ analysis_only_prompt = ChatPromptTemplate.from_messages([
     ("human", "Analyse the following customer email:\n\n{email_body}"),
 ])
 
+# Draft-only prompt (lazy drafts): the triage is already done, so the model
+# gets its fields and writes the reply as plain text — no schema, no tool call.
+DRAFT_SYSTEM_PROMPT = """\
+You are a professional customer support writer for a financial services \
+company. Write the reply to the customer email below, using the triage \
+details you are given.
+
+""" + DRAFT_RULES + """
+Return only the reply text.
+"""
+
+draft_prompt = ChatPromptTemplate.from_messages([
+    ("system", DRAFT_SYSTEM_PROMPT),
+    ("human", (
+        "Triage: category={category}, priority={priority}, customer_name={customer_name}, "
+        "intent={intent}, transaction_id={transaction_id}, amount={amount}\n\n"
+        "Write the reply to the following customer email:\n\n{email_body}"
+    )),
+])
+
+# ────────────────────── Batch Prompt ──────────────────────
+# Several short emails in ONE call: the large system prompt is sent once
+# per batch instead of once per email.
+
+BATCH_MAX_EMAILS = int(os.getenv("BATCH_MAX_EMAILS", "5"))
+BATCH_MAX_EMAIL_CHARS = int(os.getenv("BATCH_MAX_EMAIL_CHARS", "1500"))  # longer → single call
+BATCH_MAX_TOKENS = 4096
+
+BATCH_SYSTEM_PROMPT = COMBINED_SYSTEM_PROMPT + """
+═══ BATCH MODE ═══
+
+You will receive several customer emails, each introduced by "EMAIL [n]".
+Treat every email independently — never carry names, amounts or IDs from
+one email to another. Apply PART A and PART B to each one and return one
+entry in "items" per email, with "index" set to its n.
+"""
+
+batch_prompt = ChatPromptTemplate.from_messages([
+    ("system", BATCH_SYSTEM_PROMPT),
+    ("human", "Analyse and draft a reply for each of the following customer emails:\n\n{emails}"),
+])
+
+# include_raw=True: if one item is malformed we still get the raw tool call
+# and can salvage every other item instead of losing the whole batch.
+structured_llm_batch = llm.model_copy(update={"max_tokens": BATCH_MAX_TOKENS}).with_structured_output(
+    BatchTicketAnalysis, include_raw=True,
+)
+
 # ────────────────────── Chains ──────────────────────
 
 combined_chain = combined_prompt | structured_llm
 analysis_only_chain = analysis_only_prompt | structured_llm_analysis_only
+batch_chain = batch_prompt | structured_llm_batch
+draft_chain = draft_prompt | llm | StrOutputParser()
+
+# ────────────────────── Engine ──────────────────────
+# AGENT_ENGINE=native sends the three structured calls straight to Groq in
+# JSON mode (native_agent.py) instead of through the chains above: no tool
+# schema in the prompt and no LangChain overhead per call. Same prompts,
+# schemas, routing, caching and limits. The plain-text draft call (lazy
+# drafts) has no JSON to save on and always goes through its chain.
+
+AGENT_ENGINE = os.getenv("AGENT_ENGINE", "langchain").strip().lower()
+if AGENT_ENGINE not in ("langchain", "native"):
+    raise ValueError("AGENT_ENGINE must be 'langchain' or 'native'.")
+
+_NATIVE_PROMPTS = {
+    "analyze_and_draft": native_prompt(
+        "combined", COMBINED_SYSTEM_PROMPT, combined_prompt.messages[-1].prompt.template, TicketAnalysisWithDraft,
+    ),
+    "analyze_ticket": native_prompt(
+        "analysis", ANALYSIS_ONLY_SYSTEM_PROMPT, analysis_only_prompt.messages[-1].prompt.template, TicketAnalysis,
+    ),
+    "batch": native_prompt(
+        "batch", BATCH_SYSTEM_PROMPT, batch_prompt.messages[-1].prompt.template, BatchTicketAnalysis,
+    ),
+}
+
+# ────────────────────── Model routing ──────────────────────
+# Per-email choice of model + output budget. Each model has its own Groq
+# quota, so moving thank-you notes and statement requests to 8B frees 70B
+# capacity for the tickets that need it.
+
+AGENT_ROUTING_ENABLED = os.getenv("AGENT_ROUTING_ENABLED", "true").lower() == "true"
+AGENT_CHEAP_MODEL = os.getenv("AGENT_CHEAP_MODEL", "llama-3.1-8b-instant")
+AGENT_CHEAP_MAX_TOKENS = int(os.getenv("AGENT_CHEAP_MAX_TOKENS", "768"))
+AGENT_CHEAP_ROUTES = os.getenv("AGENT_CHEAP_ROUTES", "Low:General")  # urgency:category pairs
+AGENT_ROUTE_MIN_CONFIDENCE = float(os.getenv("AGENT_ROUTE_MIN_CONFIDENCE", "0.85"))
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str
+    max_tokens: int
+
+
+STANDARD_ROUTE = Route("standard", MODEL_NAME, 2048)
+CHEAP_ROUTE = Route("cheap", AGENT_CHEAP_MODEL, AGENT_CHEAP_MAX_TOKENS)
+
+_CHEAP_PAIRS = {
+    tuple(part.strip() for part in pair.split(":", 1))
+    for pair in AGENT_CHEAP_ROUTES.split(",") if ":" in pair
+}
+
+_cheap_llm = llm.model_copy(update={"model_name": CHEAP_ROUTE.model, "max_tokens": CHEAP_ROUTE.max_tokens})
+
+# route name → namespace → chain
+_ROUTE_CHAINS = {
+    STANDARD_ROUTE.name: {
+        "analyze_and_draft": combined_chain,
+        "analyze_ticket": analysis_only_chain,
+        "batch": batch_chain,
+        "write_draft": draft_chain,
+    },
+    CHEAP_ROUTE.name: {
+        "analyze_and_draft": combined_prompt | _cheap_llm.with_structured_output(
+            TicketAnalysisWithDraft, include_raw=True,
+        ),
+        "analyze_ticket": analysis_only_prompt | _cheap_llm.with_structured_output(TicketAnalysis, include_raw=True),
+        "batch": batch_prompt | _cheap_llm.model_copy(update={"max_tokens": BATCH_MAX_TOKENS}).with_structured_output(
+            BatchTicketAnalysis, include_raw=True,
+        ),
+        "write_draft": draft_prompt | _cheap_llm | StrOutputParser(),
+    },
+}
+
+if FAKE_LLM:
+    # Offline stand-in for load tests — same interface, no quota (fake_llm.py)
+    combined_chain, analysis_only_chain, batch_chain = fake_chains()
+    draft_chain = fake_draft_chain()
+    for _route_chains in _ROUTE_CHAINS.values():
+        _route_chains.update(zip(("analyze_and_draft", "analyze_ticket", "batch"), fake_chains()))
+        _route_chains["write_draft"] = fake_draft_chain()
+
+_route_counts = {STANDARD_ROUTE.name: 0, CHEAP_ROUTE.name: 0}
+
+# Hedged requests (hedging.py, HEDGING_ENABLED): a call that overruns its
+# latency percentile gets a duplicate on this route — "cheap" (8B, usually
+# the fastest) or "same" (the email's own route).
+AGENT_HEDGE_ROUTE = os.getenv("AGENT_HEDGE_ROUTE", "cheap").strip().lower()
+
+if AGENT_HEDGE_ROUTE not in ("cheap", "same"):
+    raise ValueError("AGENT_HEDGE_ROUTE must be 'cheap' or 'same'.")
+
+
+def hedge_route(route: Route) -> Route:
+    """Route a hedge for a call on `route` goes to."""
+    return CHEAP_ROUTE if AGENT_HEDGE_ROUTE == "cheap" else route
+
+# ────────────────────── Long emails (map-reduce) ──────────────────────
+# Oversized bodies are summarised chunk by chunk on the cheap model before
+# the normal chain runs on the reduced text — see chunking.py.
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", SUMMARY_SYSTEM_PROMPT),
+    ("human", SUMMARY_HUMAN_PROMPT),
+])
+summary_chain = (
+    fake_summary_chain() if FAKE_LLM
+    else summary_prompt | _cheap_llm.model_copy(update={"max_tokens": CHUNK_SUMMARY_MAX_TOKENS}) | StrOutputParser()
+)
+_reducer = MapReducer(summary_chain, CHEAP_ROUTE.model, usage_model=cache_model(CHEAP_ROUTE.model))
+
+
+def chunking_stats() -> dict:
+    """Long emails reduced by map-reduce, chunks summarised and tokens saved."""
+    return _reducer.stats()
+
+
+def route_for(clean: str) -> Route:
+    """
+    Pick the model for one email. Only a confident local verdict listed in
+    AGENT_CHEAP_ROUTES goes to the cheap model — never High or Fraud.
+    """
+    route = STANDARD_ROUTE
+    if AGENT_ROUTING_ENABLED:
+        verdict = local_verdict(clean)
+        if verdict is not None and verdict["confidence"] >= AGENT_ROUTE_MIN_CONFIDENCE:
+            urgency, category = verdict["urgency"], get_parent_category(verdict["subcategory"])
+            if urgency != "High" and category != "Fraud" and (
+                (urgency, category) in _CHEAP_PAIRS or (urgency, "*") in _CHEAP_PAIRS
+            ):
+                route = CHEAP_ROUTE
+    _route_counts[route.name] += 1
+    return route
+
+
+def routing_stats() -> dict:
+    total = sum(_route_counts.values())
+    return {
+        "enabled": AGENT_ROUTING_ENABLED,
+        "routes": {
+            route.name: {
+                "model": route.model,
+                "max_tokens": route.max_tokens,
+                "emails": _route_counts[route.name],
+                "share": round(_route_counts[route.name] / total, 4) if total else 0.0,
+            }
+            for route in (STANDARD_ROUTE, CHEAP_ROUTE)
+        },
+        "cheap_routes": sorted(f"{u}:{c}" for u, c in _CHEAP_PAIRS),
+        "min_confidence": AGENT_ROUTE_MIN_CONFIDENCE,
+    }
+
+
+def model_used(result: TicketAnalysis) -> str | None:
+    """Name of the model that produced an analysis (None if unknown)."""
+    return result._model_used
+
+# ────────────────────── Result cache ──────────────────────
+# Two tiers, one key:
+#   1. In-memory LRU + TTL (bounded) — prevents re-analysing the same body
+#      within one process.
+#   2. Persistent SQLite store — survives restarts and is shared by workers.
+# Keys include the model and a prompt version, so editing a prompt or the
+# output schema invalidates old entries automatically.
+_cache = ResultCache("agent")
+
+# Identical emails arriving together (poller + dashboard + ingestion script)
+# wait on one in-flight LLM call instead of each sending their own.
+_flight = SingleFlight("agent")
+
+_COMBINED_NS = "analyze_and_draft"
+_ANALYSIS_NS = "analyze_ticket"
+_DRAFT_NS = "write_draft"
+# (engine, namespace) → prompt version; the two engines prompt differently
+_VERSIONS = {
+    ("langchain", _COMBINED_NS): prompt_version(
+        COMBINED_SYSTEM_PROMPT,
+        str(combined_prompt.messages[-1].prompt.template),
+        str(TicketAnalysisWithDraft.model_json_schema()),
+    ),
+    ("langchain", _ANALYSIS_NS): prompt_version(
+        ANALYSIS_ONLY_SYSTEM_PROMPT,
+        str(analysis_only_prompt.messages[-1].prompt.template),
+        str(TicketAnalysis.model_json_schema()),
+    ),
+    **{
+        ("native", namespace): prompt_version(_NATIVE_PROMPTS[namespace].system, _NATIVE_PROMPTS[namespace].human)
+        for namespace in (_COMBINED_NS, _ANALYSIS_NS)
+    },
+    # Drafts are plain text on the same chain under either engine
+    **{
+        (engine, _DRAFT_NS): prompt_version(DRAFT_SYSTEM_PROMPT, str(draft_prompt.messages[-1].prompt.template))
+        for engine in ("langchain", "native")
+    },
+}
+
+
+# ────────────────────── Rate-limit budgeting ──────────────────────
+# Tokens reserved per call on top of the email itself: system prompt,
+# structured-output tool schema (~300; the native engine's compact JSON
+# shape is part of its system prompt) and a typical completion.
+_EXPECTED_OUTPUT_TOKENS = {_COMBINED_NS: 600, _ANALYSIS_NS: 250, _DRAFT_NS: 250}
+_SCHEMAS = {_COMBINED_NS: TicketAnalysisWithDraft, _ANALYSIS_NS: TicketAnalysis}
+_RESERVED_TOKENS = {
+    "langchain": {
+        _COMBINED_NS: estimate_prompt_tokens(COMBINED_SYSTEM_PROMPT) + 300 + _EXPECTED_OUTPUT_TOKENS[_COMBINED_NS],
+        _ANALYSIS_NS: estimate_prompt_tokens(ANALYSIS_ONLY_SYSTEM_PROMPT) + 300 + _EXPECTED_OUTPUT_TOKENS[_ANALYSIS_NS],
+    },
+    "native": {
+        namespace: _NATIVE_PROMPTS[namespace].tokens + _EXPECTED_OUTPUT_TOKENS[namespace]
+        for namespace in (_COMBINED_NS, _ANALYSIS_NS)
+    },
+}
+for _engine_tokens in _RESERVED_TOKENS.values():
+    _engine_tokens[_DRAFT_NS] = (
+        estimate_prompt_tokens(DRAFT_SYSTEM_PROMPT, str(draft_prompt.messages[-1].prompt.template))
+        + _EXPECTED_OUTPUT_TOKENS[_DRAFT_NS]
+    )
+_BATCH_PROMPT_TOKENS = {
+    "langchain": estimate_prompt_tokens(BATCH_SYSTEM_PROMPT) + 350,
+    "native": _NATIVE_PROMPTS["batch"].tokens,
+}
+_BATCH_TOKENS_PER_EMAIL = 600
+_BATCH_OP = "analyze_and_draft_batch"  # usage-log operation name for one batched call
+
+# Worker threads for analyze_ticket_batch() (the sync lazy-draft ingest path),
+# shared by every request — the rate limiter, not the pool, bounds Groq load
+_analysis_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="analysis")
 
-# ────────────────────── In-memory cache ──────────────────────
-# Prevents re-analysing the exact same email body within one server session.
-_cache: dict[str, TicketAnalysisWithDraft] = {}
 
+def _request_tokens(namespace: str, clean: str) -> int:
+    return _RESERVED_TOKENS[AGENT_ENGINE][namespace] + estimate_tokens(clean)
 
-def _cache_key(text: str) -> str:
-    return hashlib.sha256(text.encode()).hexdigest()
+
+def _cache_key(text: str, namespace: str = _COMBINED_NS, model: str = MODEL_NAME) -> str:
+    version = _VERSIONS[(AGENT_ENGINE, namespace)]
+    return make_key(namespace, cache_model(model), version, text)
+
+
+def _promote(key: str, stored: str, schema: type[TicketAnalysis], model: str):
+    """Decode a disk hit and promote it to memory (None for a stale shape)."""
+    try:
+        cached = schema.model_validate_json(stored)
+    except ValueError:
+        return None  # stale shape — treat as a miss
+    cached._model_used = model  # the key is per model
+    _cache.set(key, cached)
+    record_hit(_COMBINED_NS if schema is TicketAnalysisWithDraft else _ANALYSIS_NS, cache_model(model))
+    return cached
+
+
+def _cache_get(key: str, schema: type[TicketAnalysis], model: str = MODEL_NAME):
+    """Look up a result in memory, then on disk (promoting disk hits to memory)."""
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    stored = llm_store.get(key)
+    return _promote(key, stored, schema, model) if stored is not None else None
+
+
+async def _acache_get(key: str, schema: type[TicketAnalysis], model: str = MODEL_NAME):
+    """_cache_get() with the disk lookup off the event loop."""
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    stored = await llm_store.aget(key)
+    return _promote(key, stored, schema, model) if stored is not None else None
+
+
+def _cache_put(key: str, namespace: str, result: TicketAnalysis, model: str = MODEL_NAME) -> None:
+    version = _VERSIONS[(AGENT_ENGINE, namespace)]
+    result._model_used = model
+    _cache.set(key, result)
+    llm_store.set(key, result.model_dump_json(), namespace, cache_model(model), version)
+
+
+async def _acache_put(key: str, namespace: str, result: TicketAnalysis, model: str = MODEL_NAME) -> None:
+    version = _VERSIONS[(AGENT_ENGINE, namespace)]
+    result._model_used = model
+    _cache.set(key, result)
+    await llm_store.aset(key, result.model_dump_json(), namespace, cache_model(model), version)
+
+
+def _draft_cache_get(key: str, model: str) -> str | None:
+    """_cache_get() for plain-text drafts."""
+    cached = _cache.get(key)
+    if cached is None:
+        cached = llm_store.get(key)
+        if cached is not None:
+            _cache.set(key, cached)
+    if cached is not None:
+        record_hit(_DRAFT_NS, cache_model(model))
+    return cached
+
+
+async def _adraft_cache_get(key: str, model: str) -> str | None:
+    """_draft_cache_get() with the disk lookup off the event loop."""
+    cached = _cache.get(key)
+    if cached is None:
+        cached = await llm_store.aget(key)
+        if cached is not None:
+            _cache.set(key, cached)
+    if cached is not None:
+        record_hit(_DRAFT_NS, cache_model(model))
+    return cached
+
+
+def _draft_cache_put(key: str, draft: str, model: str) -> None:
+    _cache.set(key, draft)
+    llm_store.set(key, draft, _DRAFT_NS, cache_model(model), _VERSIONS[(AGENT_ENGINE, _DRAFT_NS)])
+
+
+async def _adraft_cache_put(key: str, draft: str, model: str) -> None:
+    _cache.set(key, draft)
+    await llm_store.aset(key, draft, _DRAFT_NS, cache_model(model), _VERSIONS[(AGENT_ENGINE, _DRAFT_NS)])
 
 
 # ────────────────────── Public API ──────────────────────
 
+def _clean_body(email_body: str) -> str:
+    """
+    Validate an email body and trim it for the prompt (quoted history,
+    signature and boilerplate removed — see preprocess.py).
+    """
+    if not email_body or not email_body.strip():
+        raise ValueError("email_body cannot be empty.")
+    return preprocess_email(email_body).text
+
+
+def _analysis_only(result: TicketAnalysisWithDraft) -> TicketAnalysis:
+    """Strip the draft from a combined result."""
+    analysis = TicketAnalysis(
+        sentiment=result.sentiment,
+        intent=result.intent,
+        entities=result.entities,
+        priority=result.priority,
+        category=result.category,
+        summary=result.summary,
+    )
+    analysis._model_used = result._model_used
+    return analysis
+
+
+def _check_circuit() -> None:
+    """Fail fast while the circuit is open (no probe is due)."""
+    if groq_breaker.state == "open":
+        raise CircuitOpenError(groq_breaker.name, groq_breaker.retry_after())
+
+
+def _invoke(route: Route, namespace: str, values: dict, call, max_tokens: int):
+    """chain.invoke() for `namespace` on `route`, or the JSON-mode call with AGENT_ENGINE=native."""
+    if AGENT_ENGINE == "native":
+        return native_agent.invoke(_NATIVE_PROMPTS[namespace], route.model, max_tokens, call, **values)
+    return _ROUTE_CHAINS[route.name][namespace].invoke(values, config=call.config)
+
+
+async def _ainvoke(route: Route, namespace: str, values: dict, call, max_tokens: int):
+    """Async version of _invoke()."""
+    if AGENT_ENGINE == "native":
+        return await native_agent.ainvoke(_NATIVE_PROMPTS[namespace], route.model, max_tokens, call, **values)
+    return await _ROUTE_CHAINS[route.name][namespace].ainvoke(values, config=call.config)
+
+
+def _invoke_chain(route: Route, namespace: str, clean: str, tokens: int):
+    """
+    One structured call on `route` — circuit breaker, usage log, rate
+    limiter. Malformed output is repaired locally (json_repair.py) or
+    raises StructuredOutputError.
+    """
+    with groq_breaker.guard(), \
+            track(namespace, cache_model(route.model), tokens - _EXPECTED_OUTPUT_TOKENS[namespace]) as call:
+        limiter.acquire(route.model, tokens)
+        call.started()
+        try:
+            output = _invoke(route, namespace, {"email_body": clean}, call, route.max_tokens)
+        except groq.BadRequestError as e:
+            output = rejected_output(e)  # 400 tool_use_failed / json_validate_failed carries the generation
+        result = structured_output(output, _SCHEMAS[namespace], namespace)
+        call.set_output(result.model_dump_json())
+    return result
+
+
+async def _ainvoke_chain(route: Route, namespace: str, clean: str, tokens: int):
+    """Async version of _invoke_chain()."""
+    with groq_breaker.guard(), \
+            track(namespace, cache_model(route.model), tokens - _EXPECTED_OUTPUT_TOKENS[namespace]) as call:
+        await limiter.aacquire(route.model, tokens)
+        call.started()
+        try:
+            output = await _ainvoke(route, namespace, {"email_body": clean}, call, route.max_tokens)
+        except groq.BadRequestError as e:
+            output = rejected_output(e)
+        result = structured_output(output, _SCHEMAS[namespace], namespace)
+        call.set_output(result.model_dump_json())
+    return result
+
+
+def _call_chain(route: Route, namespace: str, clean: str, tokens: int):
+    """_invoke_chain(), retried with jittered backoff when the output cannot be repaired."""
+    return with_retries(namespace, partial(_invoke_chain, route, namespace, clean, tokens))
+
+
+async def _acall_chain(route: Route, namespace: str, clean: str, tokens: int):
+    """Async version of _call_chain()."""
+    return await awith_retries(namespace, partial(_ainvoke_chain, route, namespace, clean, tokens))
+
+
+def _hedged_attempts(route: Route, tokens: int, call, *args) -> tuple[Attempt, Attempt]:
+    """call(route, *args) as the primary attempt, and the same call on hedge_route(route) as its hedge."""
+    backup = hedge_route(route)
+    return (
+        Attempt(route.model, tokens, partial(call, route, *args)),
+        Attempt(backup.model, tokens, partial(call, backup, *args)),
+    )
+
+
+def _store(key: str, namespace: str, result: TicketAnalysis, route: Route, winner: Attempt, primary: Attempt) -> None:
+    """Cache the primary's result; a hedge's answer (maybe another model) is returned but not cached."""
+    if winner is primary:
+        _cache_put(key, namespace, result, route.model)
+    else:
+        result._model_used = winner.model
+
+
+async def _astore(key: str, namespace: str, result: TicketAnalysis, route: Route, winner: Attempt, primary: Attempt) -> None:
+    """Async version of _store()."""
+    if winner is primary:
+        await _acache_put(key, namespace, result, route.model)
+    else:
+        result._model_used = winner.model
+
+
+def _run_chain(route: Route, namespace: str, schema: type[TicketAnalysis], clean: str, key: str):
+    """Single-flight leader body: re-check the cache, then call the LLM and store."""
+    # Another leader for this key may have finished since our first lookup
+    cached = _cache_get(key, schema, route.model)
+    if cached is not None:
+        return cached
+    _check_circuit()
+    if _reducer.needed(clean):
+        clean = _reducer.reduce(clean, _RESERVED_TOKENS[AGENT_ENGINE][namespace])
+    tokens = _request_tokens(namespace, clean)
+    primary, backup = _hedged_attempts(route, tokens, _call_chain, namespace, clean, tokens)
+    result, winner = hedger.run(namespace, primary, backup)
+    _store(key, namespace, result, route, winner, primary)
+    return result
+
+
+async def _arun_chain(route: Route, namespace: str, schema: type[TicketAnalysis], clean: str, key: str):
+    """Async version of _run_chain()."""
+    cached = await _acache_get(key, schema, route.model)
+    if cached is not None:
+        return cached
+    _check_circuit()
+    if _reducer.needed(clean):
+        clean = await _reducer.areduce(clean, _RESERVED_TOKENS[AGENT_ENGINE][namespace])
+    tokens = _request_tokens(namespace, clean)
+    primary, backup = _hedged_attempts(route, tokens, _acall_chain, namespace, clean, tokens)
+    result, winner = await hedger.arun(namespace, primary, backup)
+    await _astore(key, namespace, result, route, winner, primary)
+    return result
+
+
 def analyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
     """
     Analyse a customer email AND generate a draft reply in **one** LLM call.
 
+    Concurrent callers with the same email share a single in-flight call.
+
     Returns:
         TicketAnalysisWithDraft — contains all analysis fields + draft_response.
     """
-    if not email_body or not email_body.strip():
-        raise ValueError("email_body cannot be empty.")
+    clean = _clean_body(email_body)
+    route = route_for(clean)
+    key = _cache_key(clean, _COMBINED_NS, route.model)
+
+    cached = _cache_get(key, TicketAnalysisWithDraft, route.model)
+    if cached is not None:
+        return cached
 
-    clean = email_body.strip()
-    key = _cache_key(clean)
+    return _flight.do(
+        key, _run_chain, route, _COMBINED_NS, TicketAnalysisWithDraft, clean, key,
+    )
 
-    if key in _cache:
-        return _cache[key]
 
-    result: TicketAnalysisWithDraft = combined_chain.invoke({"email_body": clean})
-    _cache[key] = result
-    return result
+async def aanalyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
+    """
+    Async version of analyze_and_draft().
+
+    Uses ``ainvoke`` so the event loop stays free while Groq is generating —
+    one worker can keep many analyses in flight without a thread each.
+    """
+    clean = _clean_body(email_body)
+    route = route_for(clean)
+    key = _cache_key(clean, _COMBINED_NS, route.model)
+
+    cached = await _acache_get(key, TicketAnalysisWithDraft, route.model)
+    if cached is not None:
+        return cached
+
+    return await _flight.ado(
+        key, _arun_chain, route, _COMBINED_NS, TicketAnalysisWithDraft, clean, key,
+    )
 
 
 def analyze_ticket(email_body: str) -> TicketAnalysis:
@@ -195,25 +769,518 @@ def analyze_ticket(email_body: str) -> TicketAnalysis:
     For endpoints that also need a draft, prefer analyze_and_draft() to
     save an API call.
     """
-    if not email_body or not email_body.strip():
-        raise ValueError("email_body cannot be empty.")
-
-    clean = email_body.strip()
-    key = _cache_key(clean)
+    clean = _clean_body(email_body)
+    route = route_for(clean)
 
     # If we already have a combined result cached, reuse the analysis part
-    if key in _cache:
-        cached = _cache[key]
-        return TicketAnalysis(
-            sentiment=cached.sentiment,
-            intent=cached.intent,
-            entities=cached.entities,
-            priority=cached.priority,
-            category=cached.category,
-            summary=cached.summary,
-        )
+    cached = _cache_get(_cache_key(clean, _COMBINED_NS, route.model), TicketAnalysisWithDraft, route.model)
+    if cached is not None:
+        return _analysis_only(cached)
+
+    key = _cache_key(clean, _ANALYSIS_NS, route.model)
+    cached = _cache_get(key, TicketAnalysis, route.model)
+    if cached is not None:
+        return cached
+
+    return _flight.do(
+        key, _run_chain, route, _ANALYSIS_NS, TicketAnalysis, clean, key,
+    )
+
+
+async def aanalyze_ticket(email_body: str) -> TicketAnalysis:
+    """Async version of analyze_ticket() (``ainvoke`` on the analysis-only chain)."""
+    clean = _clean_body(email_body)
+    route = route_for(clean)
+
+    cached = await _acache_get(_cache_key(clean, _COMBINED_NS, route.model), TicketAnalysisWithDraft, route.model)
+    if cached is not None:
+        return _analysis_only(cached)
+
+    key = _cache_key(clean, _ANALYSIS_NS, route.model)
+    cached = await _acache_get(key, TicketAnalysis, route.model)
+    if cached is not None:
+        return cached
+
+    return await _flight.ado(
+        key, _arun_chain, route, _ANALYSIS_NS, TicketAnalysis, clean, key,
+    )
+
+
+# ────────────────────── Batch API ──────────────────────
+
+def _format_batch(cleans: list[str]) -> str:
+    return "\n\n".join(
+        f"EMAIL [{i}]\n<<<\n{text}\n>>>" for i, text in enumerate(cleans)
+    )
+
+
+def _batch_tokens(cleans: list[str]) -> int:
+    return _BATCH_PROMPT_TOKENS[AGENT_ENGINE] + sum(
+        estimate_tokens(c) + _BATCH_TOKENS_PER_EMAIL for c in cleans
+    )
+
+
+def _batch_output_text(output) -> str:
+    """Serialised batch result, for the usage log's output-size estimate."""
+    parsed = output.get("parsed") if isinstance(output, dict) else None
+    return parsed.model_dump_json() if parsed is not None else ""
+
+
+def _call_batch(route: Route, chunk: list[str], tokens: int):
+    """One batched structured call on `route` (raw + parsed output)."""
+    with groq_breaker.guard(), \
+            track(_BATCH_OP, cache_model(route.model), tokens - _BATCH_TOKENS_PER_EMAIL * len(chunk)) as call:
+        limiter.acquire(route.model, tokens)
+        call.started()
+        output = _invoke(route, "batch", {"emails": _format_batch(chunk)}, call, BATCH_MAX_TOKENS)
+        call.set_output(_batch_output_text(output))
+    return output
+
+
+async def _acall_batch(route: Route, chunk: list[str], tokens: int):
+    """Async version of _call_batch()."""
+    with groq_breaker.guard(), \
+            track(_BATCH_OP, cache_model(route.model), tokens - _BATCH_TOKENS_PER_EMAIL * len(chunk)) as call:
+        await limiter.aacquire(route.model, tokens)
+        call.started()
+        output = await _ainvoke(route, "batch", {"emails": _format_batch(chunk)}, call, BATCH_MAX_TOKENS)
+        call.set_output(_batch_output_text(output))
+    return output
+
+
+def _store_batch(keys: list[str], batch: list[int], parsed: dict, results: list,
+                 route: Route, winner: Attempt, primary: Attempt) -> list[int]:
+    """Place parsed batch items into results (cached like _store()); returns the indices left without one."""
+    missing = []
+    for pos, i in enumerate(batch):
+        if pos in parsed:
+            results[i] = parsed[pos]
+            _store(keys[i], _COMBINED_NS, parsed[pos], route, winner, primary)
+        else:
+            missing.append(i)
+    return missing
+
+
+async def _astore_batch(keys: list[str], batch: list[int], parsed: dict, results: list,
+                        route: Route, winner: Attempt, primary: Attempt) -> list[int]:
+    """Async version of _store_batch()."""
+    missing = []
+    for pos, i in enumerate(batch):
+        if pos in parsed:
+            results[i] = parsed[pos]
+            await _astore(keys[i], _COMBINED_NS, parsed[pos], route, winner, primary)
+        else:
+            missing.append(i)
+    return missing
+
+
+def _parse_batch(output: dict, size: int) -> dict[int, TicketAnalysisWithDraft]:
+    """
+    Map batch positions to validated results.
+
+    Uses the parsed object when the whole response validated; otherwise
+    validates the raw tool-call items one by one (repairing broken JSON
+    and enum spelling) so only the malformed ones are lost. Out-of-range and duplicate indices are ignored.
+    """
+    parsed: BatchTicketAnalysis | None = output.get("parsed")
+    if parsed is not None:
+        raw_items = [item.model_dump() for item in parsed.items]
+    else:
+        raw_items = []
+        raw = output.get("raw")
+        calls = (getattr(raw, "tool_calls", None) or []) + (getattr(raw, "invalid_tool_calls", None) or [])
+        if isinstance(raw, str):  # native engine — the JSON-mode content itself
+            calls = [{"args": raw}]
+        for call in calls:
+            args = call.get("args") or {}
+            if isinstance(args, str):  # invalid tool call — arguments that were not valid JSON
+                try:
+                    args = repair_json(args)
+                except StructuredOutputError:
+                    continue
+            items = args.get("items") if isinstance(args, dict) else None
+            if isinstance(items, list):
+                raw_items = items
+                break
+
+    results: dict[int, TicketAnalysisWithDraft] = {}
+    for item in raw_items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        if not isinstance(index, int) or not 0 <= index < size or index in results:
+            continue
+        try:
+            results[index] = TicketAnalysisWithDraft.model_validate(
+                coerce_enums({k: v for k, v in item.items() if k != "index"}, TicketAnalysisWithDraft)
+            )
+        except ValueError:
+            continue  # malformed item — retried on its own by the caller
+    return results
+
+
+def _batch_keys(email_bodies: list[str]):
+    """Clean, route and key every email of a batch request: (cleans, keys, routes)."""
+    cleans = [_clean_body(body) for body in email_bodies]
+    routes = [route_for(clean) for clean in cleans]
+    keys = [_cache_key(clean, _COMBINED_NS, route.model) for clean, route in zip(cleans, routes)]
+    return cleans, keys, routes
+
+
+def _plan_batches(cleans: list[str], keys: list[str], routes: list[Route], results: list):
+    """
+    Split a batch request into cache hits, batchable emails and emails that
+    must go through the single-email path (too long for batching).
+
+    results holds each email's cache lookup (None = miss). Returns
+    (batches, singles) where batches is a list of (route, index list) —
+    emails only share a call with emails routed to the same model — and
+    singles is a list of indices.
+    """
+    batchable: dict[str, list[int]] = {}
+    singles: list[int] = []
+    first_index: dict[str, int] = {}
+    for i, (clean, key, route) in enumerate(zip(cleans, keys, routes)):
+        if results[i] is not None:
+            continue
+        elif key in first_index:
+            continue  # duplicate inside this batch — filled from its twin
+        elif len(clean) > BATCH_MAX_EMAIL_CHARS:
+            first_index[key] = i
+            singles.append(i)
+        else:
+            first_index[key] = i
+            batchable.setdefault(route.name, []).append(i)
+
+    batches = [
+        (routes[indices[0]], indices[start:start + BATCH_MAX_EMAILS])
+        for indices in batchable.values()
+        for start in range(0, len(indices), BATCH_MAX_EMAILS)
+    ]
+    return batches, singles
+
+
+def _fill_duplicates(keys: list[str], results: list) -> list:
+    by_key = {}
+    for key, result in zip(keys, results):
+        if result is not None:
+            by_key.setdefault(key, result)
+    return [r if r is not None else by_key.get(k) for k, r in zip(keys, results)]
 
-    return analysis_only_chain.invoke({"email_body": clean})
+
+def _raise_or_return(results: list, return_exceptions: bool) -> list:
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+    return results
+
+
+def analyze_and_draft_batch(
+    email_bodies: list[str], return_exceptions: bool = False,
+) -> list[TicketAnalysisWithDraft]:
+    """
+    Analyse + draft several emails with as few LLM calls as possible.
+
+    Short emails are sent BATCH_MAX_EMAILS at a time in one structured
+    call; long emails, cache misses left over by a malformed batch item and
+    emails whose batch call failed go through analyze_and_draft() on their
+    own. Results come back in input order.
+
+    With return_exceptions=True, per-email failures are returned in place
+    of their result (like asyncio.gather) instead of raising.
+    """
+    cleans, keys, routes = _batch_keys(email_bodies)
+    results = [_cache_get(key, TicketAnalysisWithDraft, route.model) for key, route in zip(keys, routes)]
+    batches, singles = _plan_batches(cleans, keys, routes, results)
+
+    for route, batch in batches:
+        chunk = [cleans[i] for i in batch]
+        tokens = _batch_tokens(chunk)
+        primary, backup = _hedged_attempts(route, tokens, _call_batch, chunk, tokens)
+        winner = primary
+        try:
+            output, winner = hedger.run(
+                _BATCH_OP, primary, backup, valid=lambda out: bool(_parse_batch(out, len(chunk))),
+            )
+            parsed = _parse_batch(output, len(chunk))
+        except (RateLimitExceeded, CircuitOpenError) as exc:
+            for i in batch:
+                results[i] = exc  # retrying singly would only queue again / fail fast
+            continue
+        except Exception:
+            parsed = {}  # whole batch failed — every email retried singly
+        singles.extend(_store_batch(keys, batch, parsed, results, route, winner, primary))
+
+    # Already cleaned, routed and keyed by _batch_keys() — go straight to the chain
+    for i in singles:
+        try:
+            results[i] = _flight.do(
+                keys[i], _run_chain, routes[i], _COMBINED_NS, TicketAnalysisWithDraft, cleans[i], keys[i],
+            )
+        except Exception as exc:
+            results[i] = exc
+
+    return _raise_or_return(_fill_duplicates(keys, results), return_exceptions)
+
+
+async def aanalyze_and_draft_batch(
+    email_bodies: list[str], return_exceptions: bool = False,
+) -> list[TicketAnalysisWithDraft]:
+    """Async version of analyze_and_draft_batch(); batches and singles run concurrently."""
+    cleans, keys, routes = _batch_keys(email_bodies)
+    results = list(await asyncio.gather(
+        *(_acache_get(key, TicketAnalysisWithDraft, route.model) for key, route in zip(keys, routes)),
+    ))
+    batches, singles = _plan_batches(cleans, keys, routes, results)
+
+    async def _run_batch(route: Route, batch: list[int]) -> None:
+        chunk = [cleans[i] for i in batch]
+        tokens = _batch_tokens(chunk)
+        primary, backup = _hedged_attempts(route, tokens, _acall_batch, chunk, tokens)
+        winner = primary
+        try:
+            output, winner = await hedger.arun(
+                _BATCH_OP, primary, backup, valid=lambda out: bool(_parse_batch(out, len(chunk))),
+            )
+            parsed = _parse_batch(output, len(chunk))
+        except (RateLimitExceeded, CircuitOpenError) as exc:
+            for i in batch:
+                results[i] = exc
+            return
+        except Exception:
+            parsed = {}
+        retry = await _astore_batch(keys, batch, parsed, results, route, winner, primary)
+        await asyncio.gather(*(_run_single(i) for i in retry))
+
+    async def _run_single(i: int) -> None:
+        try:
+            results[i] = await _flight.ado(
+                keys[i], _arun_chain, routes[i], _COMBINED_NS, TicketAnalysisWithDraft, cleans[i], keys[i],
+            )
+        except Exception as exc:
+            results[i] = exc
+
+    await asyncio.gather(
+        *(_run_batch(route, batch) for route, batch in batches),
+        *(_run_single(i) for i in singles),
+    )
+    return _raise_or_return(_fill_duplicates(keys, results), return_exceptions)
+
+
+def _analysis_or_error(email_body: str):
+    try:
+        return analyze_ticket(email_body)
+    except Exception as exc:
+        return exc
+
+
+async def _aanalysis_or_error(email_body: str):
+    try:
+        return await aanalyze_ticket(email_body)
+    except Exception as exc:
+        return exc
+
+
+def analyze_ticket_batch(email_bodies: list[str], return_exceptions: bool = False) -> list[TicketAnalysis]:
+    """
+    analyze_ticket() for several emails — the ingest path when drafts are
+    written lazily. There is no batched analysis-only prompt, so each email
+    is its own (cached, single-flight) call, run side by side.
+    """
+    futures = [_analysis_pool.submit(in_scope(_analysis_or_error, body)) for body in email_bodies]
+    return _raise_or_return([future.result() for future in futures], return_exceptions)
+
+
+async def aanalyze_ticket_batch(email_bodies: list[str], return_exceptions: bool = False) -> list[TicketAnalysis]:
+    """Async version of analyze_ticket_batch(); every email runs concurrently."""
+    results = await asyncio.gather(*(_aanalysis_or_error(body) for body in email_bodies))
+    return _raise_or_return(list(results), return_exceptions)
+
+
+# ────────────────────── Draft API (lazy drafts) ──────────────────────
+# With DRAFT_MODE=lazy (main.py) tickets are created from the analysis-only
+# call and the reply is written here, as plain text, when the ticket is
+# first opened — most tickets are closed without a reply or never opened,
+# and the draft is most of the combined call's output tokens.
+
+def _draft_route(analysis: TicketAnalysis) -> Route:
+    """route_for() on the finished triage: AGENT_CHEAP_ROUTES pairs go to the cheap model — never High or Fraud."""
+    priority, category = analysis.priority.value, analysis.category.value
+    if AGENT_ROUTING_ENABLED and priority != "High" and category != "Fraud" and (
+        (priority, category) in _CHEAP_PAIRS or (priority, "*") in _CHEAP_PAIRS
+    ):
+        return CHEAP_ROUTE
+    return STANDARD_ROUTE
+
+
+def _draft_values(clean: str, analysis: TicketAnalysis) -> dict:
+    """draft_prompt inputs: the triage fields + the cleaned email."""
+    entities = analysis.entities
+    return {
+        "category": analysis.category.value,
+        "priority": analysis.priority.value,
+        "customer_name": entities.customer_name or "unknown",
+        "intent": analysis.intent,
+        "transaction_id": entities.transaction_id or "none",
+        "amount": entities.amount or "none",
+        "email_body": clean,
+    }
+
+
+def _draft_text(text) -> str:
+    text = (text or "").strip()
+    if not text:
+        raise StructuredOutputError("missing_output", "the model returned an empty draft")
+    return text
+
+
+def _invoke_draft(route: Route, values: dict, tokens: int) -> str:
+    """One draft call on `route` — circuit breaker, usage log, rate limiter."""
+    with groq_breaker.guard(), \
+            track(_DRAFT_NS, cache_model(route.model), tokens - _EXPECTED_OUTPUT_TOKENS[_DRAFT_NS]) as call:
+        limiter.acquire(route.model, tokens)
+        call.started()
+        draft = _draft_text(_ROUTE_CHAINS[route.name][_DRAFT_NS].invoke(values, config=call.config))
+        call.set_output(draft)
+    return draft
+
+
+async def _ainvoke_draft(route: Route, values: dict, tokens: int) -> str:
+    """Async version of _invoke_draft()."""
+    with groq_breaker.guard(), \
+            track(_DRAFT_NS, cache_model(route.model), tokens - _EXPECTED_OUTPUT_TOKENS[_DRAFT_NS]) as call:
+        await limiter.aacquire(route.model, tokens)
+        call.started()
+        draft = _draft_text(await _ROUTE_CHAINS[route.name][_DRAFT_NS].ainvoke(values, config=call.config))
+        call.set_output(draft)
+    return draft
+
+
+def _call_draft(route: Route, values: dict, tokens: int) -> str:
+    return with_retries(_DRAFT_NS, partial(_invoke_draft, route, values, tokens))
+
+
+async def _acall_draft(route: Route, values: dict, tokens: int) -> str:
+    return await awith_retries(_DRAFT_NS, partial(_ainvoke_draft, route, values, tokens))
+
+
+def _run_draft(route: Route, values: dict, key: str) -> str:
+    """Single-flight leader body for write_draft() — same shape as _run_chain()."""
+    cached = _draft_cache_get(key, route.model)
+    if cached is not None:
+        return cached
+    _check_circuit()
+    if _reducer.needed(values["email_body"]):
+        values = {
+            **values,
+            "email_body": _reducer.reduce(values["email_body"], _RESERVED_TOKENS[AGENT_ENGINE][_DRAFT_NS]),
+        }
+    tokens = _request_tokens(_DRAFT_NS, values["email_body"])
+    primary, backup = _hedged_attempts(route, tokens, _call_draft, values, tokens)
+    draft, winner = hedger.run(_DRAFT_NS, primary, backup)
+    if winner is primary:
+        _draft_cache_put(key, draft, route.model)
+    return draft
+
+
+async def _arun_draft(route: Route, values: dict, key: str) -> str:
+    """Async version of _run_draft()."""
+    cached = await _adraft_cache_get(key, route.model)
+    if cached is not None:
+        return cached
+    _check_circuit()
+    if _reducer.needed(values["email_body"]):
+        values = {
+            **values,
+            "email_body": await _reducer.areduce(values["email_body"], _RESERVED_TOKENS[AGENT_ENGINE][_DRAFT_NS]),
+        }
+    tokens = _request_tokens(_DRAFT_NS, values["email_body"])
+    primary, backup = _hedged_attempts(route, tokens, _acall_draft, values, tokens)
+    draft, winner = await hedger.arun(_DRAFT_NS, primary, backup)
+    if winner is primary:
+        await _adraft_cache_put(key, draft, route.model)
+    return draft
+
+
+def _draft_request(email_body: str, analysis: TicketAnalysis) -> tuple[Route, dict, str]:
+    values = _draft_values(_clean_body(email_body), analysis)
+    route = _draft_route(analysis)
+    return route, values, _cache_key(json.dumps(values, sort_keys=True), _DRAFT_NS, route.model)
+
+
+def write_draft(email_body: str, analysis: TicketAnalysis) -> str:
+    """
+    Draft reply for an email that has already been analysed — one
+    plain-text LLM call, cached and coalesced like the analysis. A combined
+    result already carries its draft and is returned as is.
+
+    Raises CircuitOpenError, RateLimitExceeded or StructuredOutputError
+    (empty output after retries) like the analysis calls.
+    """
+    if isinstance(analysis, TicketAnalysisWithDraft):
+        return analysis.draft_response
+    route, values, key = _draft_request(email_body, analysis)
+    cached = _draft_cache_get(key, route.model)
+    if cached is not None:
+        return cached
+    return _flight.do(key, _run_draft, route, values, key)
+
+
+async def awrite_draft(email_body: str, analysis: TicketAnalysis) -> str:
+    """Async version of write_draft()."""
+    if isinstance(analysis, TicketAnalysisWithDraft):
+        return analysis.draft_response
+    route, values, key = _draft_request(email_body, analysis)
+    cached = await _adraft_cache_get(key, route.model)
+    if cached is not None:
+        return cached
+    return await _flight.ado(key, _arun_draft, route, values, key)
+
+
+async def astream_draft(email_body: str, analysis: TicketAnalysis, use_cache: bool = True):
+    """
+    write_draft() as an async generator of text pieces, as the model
+    produces them — for the SSE endpoint, where time to the first token is
+    what the agent waits for. A cached draft comes back in one piece;
+    use_cache=False (regenerate) skips the lookup and replaces the entry.
+
+    Streamed output cannot be taken back, so there is no single-flight,
+    hedge or retry here; the finished draft is cached like write_draft()'s.
+    """
+    if isinstance(analysis, TicketAnalysisWithDraft):
+        yield analysis.draft_response
+        return
+    route, values, key = _draft_request(email_body, analysis)
+    cached = await _adraft_cache_get(key, route.model) if use_cache else None
+    if cached is not None:
+        yield cached
+        return
+    _check_circuit()
+    if _reducer.needed(values["email_body"]):
+        values = {
+            **values,
+            "email_body": await _reducer.areduce(values["email_body"], _RESERVED_TOKENS[AGENT_ENGINE][_DRAFT_NS]),
+        }
+    tokens = _request_tokens(_DRAFT_NS, values["email_body"])
+    parts: list[str] = []
+    with groq_breaker.guard(), \
+            track(_DRAFT_NS, cache_model(route.model), tokens - _EXPECTED_OUTPUT_TOKENS[_DRAFT_NS]) as call:
+        await limiter.aacquire(route.model, tokens)
+        call.started()
+        started = time.perf_counter()
+        async for piece in _ROUTE_CHAINS[route.name][_DRAFT_NS].astream(values, config=call.config):
+            if not piece:
+                continue
+            if not parts:
+                LLM_FIRST_TOKEN_SECONDS.observe(
+                    time.perf_counter() - started, model=cache_model(route.model), operation=_DRAFT_NS,
+                )
+            parts.append(piece)
+            yield piece
+        draft = _draft_text("".join(parts))
+        call.set_output(draft)
+    await _adraft_cache_put(key, draft, route.model)
 
 
 def generate_draft_response(analysis: TicketAnalysis) -> str:
@@ -225,8 +1292,12 @@ def generate_draft_response(analysis: TicketAnalysis) -> str:
         return analysis.draft_response
 
     # Fallback: generate a template-based draft without an API call
-    customer = analysis.entities.customer_name or "Valued Customer"
-    cat = analysis.category.value
+    return _template_draft(analysis.entities.customer_name, analysis.category.value)
+
+
+def _template_draft(customer_name: str | None, cat: str) -> str:
+    """Category template reply — no API call."""
+    customer = customer_name or "Valued Customer"
 
     if cat == "Fraud":
         body = (
@@ -263,6 +1334,55 @@ def generate_draft_response(analysis: TicketAnalysis) -> str:
     return body
 
 
+# ────────────────────── Degraded mode ──────────────────────
+# Used while the Groq circuit is open: tickets are still created, with
+# priority / category from the local urgency tiers (rules, trained model),
+# entities from regexes and a category template as the draft. main.py flags
+# them needs_reanalysis and re-enriches them once the circuit closes.
+
+DEGRADED_MODEL = "degraded:rules"  # model_used for degraded results
+
+_TXN_ID = re.compile(r"\b((?:TXN|REF)[-_ ]?\d[\w-]*)\b", re.I)
+_AMOUNT = re.compile(r"[$€£₹]\s?\d[\d,]*(?:\.\d{2})?")
+_NAME = re.compile(r"(?i:my name is|regards,|thanks,|sincerely,)\s*\n?\s*([A-Z][a-z]+(?: [A-Z][a-z]+)?)")
+_FROM_NAME = re.compile(r"^From:\s*\"?([^\"<@\n]+?)\"?\s*<", re.M)
+
+_DEGRADED_SENTIMENT = {"High": "Urgent", "Medium": "Negative", "Low": "Neutral"}
+
+
+def degraded_analysis(email_body: str) -> TicketAnalysisWithDraft:
+    """
+    Best-effort analysis + draft without any LLM call. The intent and
+    summary say so, and model_used() returns DEGRADED_MODEL.
+    """
+    clean = _clean_body(email_body)
+    verdict = offline_verdict(clean)
+    category = get_parent_category(verdict["subcategory"])
+
+    txn, amount = _TXN_ID.search(clean), _AMOUNT.search(clean)
+    name = _NAME.search(clean) or _FROM_NAME.search(clean)
+    customer_name = name.group(1).strip() if name else None
+
+    body = " ".join(split_header(clean)[1].split())
+    excerpt = body[:160] + ("…" if len(body) > 160 else "")
+
+    result = TicketAnalysisWithDraft(
+        sentiment=_DEGRADED_SENTIMENT[verdict["urgency"]],
+        intent=f"{verdict['subcategory'].replace('_', ' ')} (pending AI re-analysis)",
+        entities={
+            "customer_name": customer_name,
+            "transaction_id": txn.group(1) if txn else None,
+            "amount": amount.group(0) if amount else None,
+        },
+        priority=verdict["urgency"],
+        category=category,
+        summary=f"[Auto-triaged without AI] {excerpt}",
+        draft_response=_template_draft(customer_name, category),
+    )
+    result._model_used = DEGRADED_MODEL
+    return result
+
+
 # ────────────────────── Quick test ──────────────────────
 
 if __name__ == "__main__":
@@ -0,0 +1,411 @@
+"""
+End-to-end pipeline benchmark — runs entirely offline.
+
+Drives the FastAPI app in-process (httpx ASGI transport, no network) with
+the fake LLM backend (fake_llm.py), a local SQLite database and a fake
+IMAP mailbox, and reports per scenario:
+
+  • p50 / p95 / p99 / mean / max latency and requests per second
+  • time spent in each pipeline stage, from the Server-Timing header
+    (llm_analysis, classifier, imap_fetch, mime_parse, dedup_query,
+    db_commit, db_query)
+
+  • for scenarios that call the agent: its LLM calls, prompt / completion
+    tokens per call and mean call latency, from the llm_usage table
+
+Results are written to a JSON file tagged with the git commit, so runs can
+be compared across commits (--compare previous.json).
+
+--engines langchain,native runs every scenario once per agent engine
+(AGENT_ENGINE, see native_agent.py) and reports them side by side. Offline,
+both engines get the same simulated API latency, so the comparison shows
+prompt tokens and pipeline overhead; LLM_BACKEND=groq runs against the real
+API (set GROQ_RATE_LIMITS to your quota) for end-to-end latency and
+API-reported token counts.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --requests 500 --concurrency 32 --scenarios process_ticket,tickets
+    python benchmark.py --output bench_new.json --compare bench_old.json
+    python benchmark.py --scenarios process_ticket --engines langchain,native
+
+LLM latency / error rate come from the FAKE_LLM_* variables (.env.example).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import imaplib
+import platform
+import tempfile
+import itertools
+import subprocess
+from email.message import EmailMessage
+
+# ── Offline environment — must be set before the app modules are imported ──
+_DEFAULT_DB = os.path.join(tempfile.gettempdir(), "triage_benchmark.sqlite3")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DEFAULT_DB}?check_same_thread=false")
+os.environ.setdefault("ENABLE_EMAIL_POLLING", "false")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")  # measure the pipeline, not the disk cache
+os.environ.setdefault("EMAIL_USER", "benchmark@example.com")
+os.environ.setdefault("EMAIL_PASSWORD", "unused")
+# Generous quotas so the limiter doesn't turn the run into a 30 RPM crawl;
+# set GROQ_RATE_LIMITS yourself to benchmark under the real free-tier limits.
+os.environ.setdefault(
+    "GROQ_RATE_LIMITS",
+    "llama-3.3-70b-versatile=100000:100000000,llama-3.1-8b-instant=100000:100000000",
+)
+
+import httpx  # noqa: E402
+
+from timing import parse_server_timing  # noqa: E402
+
+SCENARIOS = ("process_ticket", "fetch_emails", "tickets", "dashboard_metrics")
+ENGINES = ("langchain", "native")
+_AGENT_OPERATIONS = ("analyze_and_draft", "analyze_ticket", "analyze_and_draft_batch", "write_draft")
+
+
+# ────────────────────── Synthetic emails ──────────────────────
+
+_TEMPLATES = [
+    "I see an unauthorized charge of ${amount} on my card (TXN-{n}). I did not make this purchase, please block my card immediately.",
+    "Hello, I was charged twice for my subscription this month — ${amount} each time. Please refund the duplicate payment. Ref TXN-{n}.",
+    "My payment of ${amount} to the utility company failed but the money left my account. Can you check transaction TXN-{n}?",
+    "Could you send me my account statement for last quarter? Thanks for the help. (request {n})",
+    "Someone hacked my account and changed my email address. I'm locked out and very worried. Case {n}.",
+    "How do I update the mailing address on my account? Just a general question, no rush. Ticket {n}.",
+]
+_NAMES = ["Priya Shah", "Amit Kumar", "Sarah Lee", "John Carter", "Maria Gomez", "Wei Chen"]
+_counter = itertools.count(1)
+
+
+def make_email(rng: random.Random) -> tuple[str, str, str]:
+    """(sender, subject, body) — every call yields a unique body so dedup never hides work."""
+    n = next(_counter)
+    name = rng.choice(_NAMES)
+    body = rng.choice(_TEMPLATES).format(amount=f"{rng.randint(10, 5000)}.{rng.randint(0, 99):02d}", n=n)
+    body += f"\n\nRegards,\n{name}"
+    sender = f"{name} <{name.split()[0].lower()}{n}@example.com>"
+    return sender, f"Support request #{n}", body
+
+
+# ────────────────────── Fake IMAP mailbox ──────────────────────
+
+IMAP_LATENCY_SECONDS = 0.02  # per round trip — roughly a nearby IMAP server
+
+
+class FakeIMAP:
+    """Just enough of imaplib.IMAP4_SSL for /fetch_emails; fresh mail on every connect."""
+
+    def __init__(self, host: str = "", port: int = 0, batch: int = 5, seed: int = 0):
+        rng = random.Random(seed)
+        self._messages = {}
+        for i in range(1, batch + 1):
+            sender, subject, body = make_email(rng)
+            msg = EmailMessage()
+            msg["From"], msg["Subject"] = sender, subject
+            msg.set_content(body)
+            self._messages[str(i).encode()] = msg.as_bytes()
+
+    def _rtt(self):
+        time.sleep(IMAP_LATENCY_SECONDS)
+
+    def login(self, user, password):
+        self._rtt()
+        return "OK", [b"Logged in"]
+
+    def select(self, mailbox="INBOX"):
+        self._rtt()
+        return "OK", [str(len(self._messages)).encode()]
+
+    def search(self, charset, *criteria):
+        self._rtt()
+        return "OK", [b" ".join(self._messages)]
+
+    def fetch(self, eid, parts):
+        self._rtt()
+        return "OK", [(eid + b" (RFC822)", self._messages[eid])]
+
+    def store(self, eid, command, flags):
+        return "OK", [b""]
+
+    def close(self):
+        return "OK", [b""]
+
+    def logout(self):
+        return "BYE", [b""]
+
+
+# ────────────────────── Runner ──────────────────────
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already-sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _summarise(samples: list[tuple[float, int, dict]], wall_seconds: float) -> dict:
+    latencies = sorted(ms for ms, _, _ in samples)
+    errors = sum(1 for _, status, _ in samples if status >= 400)
+    stage_totals: dict[str, list[float]] = {}
+    for _, _, stages in samples:
+        for name, ms in stages.items():
+            stage_totals.setdefault(name, []).append(ms)
+    stages = {}
+    for name, values in sorted(stage_totals.items()):
+        values.sort()
+        stages[name] = {
+            "mean_ms": round(sum(values) / len(samples), 2),  # per request, 0 when absent
+            "p95_ms": round(percentile(values, 95), 2),
+            "share": round(sum(values) / max(sum(latencies), 1e-9), 4),
+        }
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "stages": stages,
+    }
+
+
+def _request_factory(scenario: str, args, rng: random.Random):
+    """Return a function building (method, url, kwargs) for one request."""
+    if scenario == "process_ticket":
+        def build():
+            sender, subject, body = make_email(rng)
+            return "POST", "/process_ticket", {"json": {"email_body": f"From: {sender}\nSubject: {subject}\n\n{body}"}}
+    elif scenario == "fetch_emails":
+        def build():
+            return "POST", "/fetch_emails", {"params": {"max_emails": args.fetch_batch}}
+    elif scenario == "tickets":
+        def build():
+            return "GET", "/tickets", {}
+    elif scenario == "dashboard_metrics":
+        def build():
+            return "GET", "/dashboard_metrics", {}
+    else:
+        raise ValueError(f"Unknown scenario {scenario!r} (choose from {', '.join(SCENARIOS)})")
+    return build
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args, rng: random.Random) -> dict:
+    build = _request_factory(scenario, args, rng)
+    samples: list[tuple[float, int, dict]] = []
+
+    async def one(record: bool) -> None:
+        method, url, kwargs = build()
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+            status, header = resp.status_code, resp.headers.get("server-timing", "")
+        except Exception:
+            status, header = 599, ""
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if record:
+            stages = parse_server_timing(header)
+            stages.pop("total", None)
+            samples.append((elapsed_ms, status, stages))
+
+    for _ in range(args.warmup):
+        await one(record=False)
+
+    remaining = itertools.count()
+    total = args.requests
+
+    async def worker():
+        while next(remaining) < total:
+            await one(record=True)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return _summarise(samples, time.perf_counter() - t0)
+
+
+def _usage_mark() -> int:
+    """Newest llm_usage id — rows after it belong to the next scenario."""
+    import usage
+    from sqlalchemy import func
+    from database import SessionLocal
+    from models import LLMUsage
+
+    usage.flush()
+    with SessionLocal() as db:
+        return db.query(func.max(LLMUsage.id)).scalar() or 0
+
+
+def _agent_usage(since_id: int) -> dict:
+    """Successful agent LLM calls since `since_id`: count, tokens per call, mean latency."""
+    import usage
+    from sqlalchemy import func
+    from database import SessionLocal
+    from models import LLMUsage
+
+    usage.flush()
+    with SessionLocal() as db:
+        calls, input_tokens, output_tokens, latency_ms = db.query(
+            func.count(), func.sum(LLMUsage.input_tokens), func.sum(LLMUsage.output_tokens),
+            func.avg(LLMUsage.latency_ms),
+        ).filter(
+            LLMUsage.id > since_id,
+            LLMUsage.operation.in_(_AGENT_OPERATIONS),
+            LLMUsage.cache == "miss",
+            LLMUsage.outcome == "ok",
+        ).one()
+    if not calls:
+        return {}
+    return {
+        "calls": calls,
+        "input_tokens_per_call": round(input_tokens / calls, 1),
+        "output_tokens_per_call": round(output_tokens / calls, 1),
+        "mean_call_ms": round(float(latency_ms), 1),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _print_report(results: dict, previous: dict | None) -> None:
+    print()
+    width = max([20] + [len(name) + 2 for name in results["scenarios"]])
+    print(f"{'scenario':<{width}}{'reqs':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}   (ms)")
+    for name, res in results["scenarios"].items():
+        lat = res["latency_ms"]
+        print(f"{name:<{width}}{res['requests']:>6}{res['errors']:>5}{res['rps']:>9.1f}"
+              f"{lat['p50']:>9.1f}{lat['p95']:>9.1f}{lat['p99']:>9.1f}")
+        for stage_name, st in res["stages"].items():
+            print(f"    {stage_name:<16} mean {st['mean_ms']:>8.1f} ms   p95 {st['p95_ms']:>8.1f} ms   {st['share']:>6.1%}")
+        llm = res.get("agent_llm")
+        if llm:
+            print(f"    agent LLM        {llm['calls']} calls   {llm['input_tokens_per_call']:.0f} in / "
+                  f"{llm['output_tokens_per_call']:.0f} out tokens per call   mean {llm['mean_call_ms']:.1f} ms")
+        old = (previous or {}).get("scenarios", {}).get(name)
+        if old:
+            def delta(new: float, before: float) -> str:
+                return f"{(new - before) / before:+.1%}" if before else "n/a"
+            print(f"    vs {previous['meta'].get('git_commit') or 'previous'}: "
+                  f"rps {delta(res['rps'], old['rps'])}, "
+                  f"p50 {delta(lat['p50'], old['latency_ms']['p50'])}, "
+                  f"p95 {delta(lat['p95'], old['latency_ms']['p95'])}")
+    print()
+
+
+async def main_async(args) -> dict:
+    import main as app_module  # imported late: picks up the offline environment above
+    import agent
+    import fake_llm
+
+    rng = random.Random(args.seed)
+    imap_seed = itertools.count(args.seed)
+    imaplib.IMAP4_SSL = lambda host="", port=0: FakeIMAP(host, port, batch=args.fetch_batch, seed=next(imap_seed))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "fetch_batch": args.fetch_batch,
+            "seed": args.seed,
+            "engines": args.engines,
+            "llm_backend": os.environ["LLM_BACKEND"],
+            "fake_llm": {
+                "latency_median_ms": fake_llm.FAKE_LLM_LATENCY_MEDIAN_MS,
+                "latency_sigma": fake_llm.FAKE_LLM_LATENCY_SIGMA,
+                "classifier_latency_median_ms": fake_llm.FAKE_CLASSIFIER_LATENCY_MEDIAN_MS,
+                "classifier_latency_sigma": fake_llm.FAKE_CLASSIFIER_LATENCY_SIGMA,
+                "error_rate": fake_llm.FAKE_LLM_ERROR_RATE,
+            },
+            "database": os.environ["DATABASE_URL"].split("?")[0],
+        },
+        "scenarios": {},
+    }
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with app_module.app.router.lifespan_context(app_module.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for engine in args.engines:
+                agent.AGENT_ENGINE = engine  # read per call, so the switch applies to the next request
+                for scenario in args.scenarios:
+                    name = scenario if len(args.engines) == 1 else f"{scenario}[{engine}]"
+                    print(f"▶ {name}: {args.requests} requests @ concurrency {args.concurrency}")
+                    mark = _usage_mark()
+                    result = await run_scenario(client, scenario, args, rng)
+                    llm = _agent_usage(mark)
+                    if llm:
+                        result["agent_llm"] = llm
+                    results["scenarios"][name] = result
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the triage pipeline.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated, run in order (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--fetch-batch", type=int, default=5, help="Emails in the fake mailbox per /fetch_emails call")
+    parser.add_argument("--engines", default=os.getenv("AGENT_ENGINE", "langchain"),
+                        help=f"Comma-separated agent engines to run every scenario with ({', '.join(ENGINES)})")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic emails")
+    parser.add_argument("--fresh-db", action="store_true", help="Delete the default SQLite benchmark DB first")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario!r} (choose from {', '.join(SCENARIOS)})")
+    args.engines = [e.strip().lower() for e in args.engines.split(",") if e.strip()]
+    for engine in args.engines:
+        if engine not in ENGINES:
+            parser.error(f"unknown engine {engine!r} (choose from {', '.join(ENGINES)})")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.fresh_db and os.path.exists(_DEFAULT_DB):
+        os.remove(_DEFAULT_DB)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    results = asyncio.run(main_async(args))
+    _print_report(results, previous)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
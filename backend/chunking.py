@@ -0,0 +1,259 @@
+"""
+Map-reduce path for very long emails.
+
+Forwarded statements and pasted transaction logs can run to tens of
+thousands of tokens — more than the 70B prompt comfortably holds, and
+far more than one ticket is worth in TPM budget. Emails estimated above
+CHUNKING_THRESHOLD_TOKENS are
+
+  1. split into ~CHUNK_TOKENS pieces on paragraph / line boundaries,
+  2. each piece summarised by the cheap model (map — in parallel on the
+     async path), keeping names, amounts, dates and transaction IDs,
+  3. reassembled as "section summaries" that the normal analysis + draft
+     chain runs on (reduce).
+
+TICKET_MAX_TOKENS is a hard ceiling on the estimated tokens one ticket may
+spend across all of its agent calls (map prompts + summaries + the final
+call). When an email is too long to summarise every piece within it, the
+opening and closing pieces are kept and the middle is dropped, with a note
+saying so in the reduced text.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+
+from tokens import CHARS_PER_TOKEN, estimate_tokens, estimate_prompt_tokens
+from preprocess import split_header
+from rate_limiter import limiter
+from usage import track
+from circuit_breaker import groq_breaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+CHUNKING_THRESHOLD_TOKENS = int(os.getenv("CHUNKING_THRESHOLD_TOKENS", "3000"))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1200"))
+CHUNK_SUMMARY_MAX_TOKENS = int(os.getenv("CHUNK_SUMMARY_MAX_TOKENS", "256"))
+TICKET_MAX_TOKENS = int(os.getenv("TICKET_MAX_TOKENS", "8000"))
+
+if CHUNK_TOKENS >= CHUNKING_THRESHOLD_TOKENS:
+    raise ValueError("CHUNK_TOKENS must be smaller than CHUNKING_THRESHOLD_TOKENS.")
+
+SUMMARY_SYSTEM_PROMPT = """\
+You condense one section of a long customer email sent to a bank's support team.
+
+Keep every fact a support agent would need: the customer's name, what went
+wrong, amounts, dates, merchants, transaction / reference IDs and any
+explicit request or deadline. Drop greetings, repetition and boilerplate.
+Answer with plain-text bullet points only, at most 120 words."""
+
+SUMMARY_HUMAN_PROMPT = "Section {index} of {total}:\n\n{chunk}"
+
+_SUMMARY_PROMPT_TOKENS = estimate_prompt_tokens(SUMMARY_SYSTEM_PROMPT, SUMMARY_HUMAN_PROMPT)
+
+
+@dataclass(frozen=True)
+class ChunkPlan:
+    header: str
+    chunks: list[str]    # pieces to summarise, in email order
+    positions: list[int]  # 1-based position of each piece in the full email
+    total: int           # pieces the email was split into
+    omitted: int         # pieces dropped to stay under TICKET_MAX_TOKENS
+
+
+# ────────────────────── Splitting ──────────────────────
+
+def _hard_split(text: str, max_chars: int) -> list[str]:
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def split_chunks(text: str, chunk_tokens: int = CHUNK_TOKENS) -> list[str]:
+    """Pack paragraphs (then lines, then characters) into pieces of ≤ chunk_tokens."""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    pieces: list[str] = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            pieces.extend(_hard_split(line, max_chars) if len(line) > max_chars else [line])
+
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) > max_chars and current:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def _map_cost(chunk: str) -> int:
+    return _SUMMARY_PROMPT_TOKENS + estimate_tokens(chunk) + CHUNK_SUMMARY_MAX_TOKENS
+
+
+def plan_chunks(text: str, final_reserved_tokens: int) -> ChunkPlan:
+    """
+    Split an email and pick the pieces to summarise so the whole ticket —
+    map calls plus the final call (final_reserved_tokens + the summaries)
+    — stays within TICKET_MAX_TOKENS. The first and last pieces are
+    preferred: that is where customers state the problem and sign off.
+    """
+    header, body = split_header(text)
+    chunks = split_chunks(body)
+    header_tokens = estimate_tokens(header)
+
+    order = [0, len(chunks) - 1, *range(1, len(chunks) - 1)] if len(chunks) > 1 else [0]
+    kept: list[int] = []
+    spent = final_reserved_tokens + header_tokens
+    for i in order:
+        cost = _map_cost(chunks[i]) + CHUNK_SUMMARY_MAX_TOKENS  # summary is read again by the final call
+        if spent + cost > TICKET_MAX_TOKENS:
+            continue
+        kept.append(i)
+        spent += cost
+    if not kept:
+        raise ValueError(
+            f"Email is too long to analyse within TICKET_MAX_TOKENS={TICKET_MAX_TOKENS}."
+        )
+    kept.sort()
+    return ChunkPlan(
+        header=header,
+        chunks=[chunks[i] for i in kept],
+        positions=[i + 1 for i in kept],
+        total=len(chunks),
+        omitted=len(chunks) - len(kept),
+    )
+
+
+def _compose(plan: ChunkPlan, summaries: list[str], original_tokens: int) -> str:
+    note = (
+        f"[Long email (~{original_tokens} tokens) condensed: summaries of "
+        f"{len(summaries)} of {plan.total} sections"
+        + (f"; {plan.omitted} middle section(s) omitted" if plan.omitted else "")
+        + "]"
+    )
+    sections = "\n\n".join(
+        f"Section {pos}/{plan.total}:\n{summary.strip()}"
+        for pos, summary in zip(plan.positions, summaries)
+    )
+    body = f"{note}\n\n{sections}"
+    return f"{plan.header}\n\n{body}" if plan.header else body
+
+
+def _fallback_summary(chunk: str) -> str:
+    """Used when a map call fails — the chunk's opening, at summary length."""
+    return chunk[:CHUNK_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN].strip()
+
+
+def clip(text: str, max_tokens: int = CHUNKING_THRESHOLD_TOKENS) -> str:
+    """Head + tail of text within max_tokens — for single-shot callers like the classifier."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n\n[…]\n\n{text[-half:]}"
+
+
+# ────────────────────── Map-reduce ──────────────────────
+
+class MapReducer:
+    """Reduces oversized emails with a summary chain on one (cheap) model."""
+
+    def __init__(self, chain, model: str, usage_model: str | None = None):
+        self.chain = chain
+        self.model = model
+        self.usage_model = usage_model or model  # name in the usage log ("fake:…" offline)
+        self._lock = threading.Lock()
+        self._stats = {"emails": 0, "chunks": 0, "summary_errors": 0, "truncated": 0,
+                       "original_tokens": 0, "reduced_tokens": 0}
+
+    @staticmethod
+    def needed(text: str) -> bool:
+        return estimate_tokens(text) > CHUNKING_THRESHOLD_TOKENS
+
+    def _inputs(self, plan: ChunkPlan, k: int) -> dict:
+        return {"index": plan.positions[k], "total": plan.total, "chunk": plan.chunks[k]}
+
+    def _finish(self, plan: ChunkPlan, summaries: list, text: str) -> str:
+        errors = 0
+        for k, summary in enumerate(summaries):
+            if isinstance(summary, BaseException) or not str(summary).strip():
+                errors += 1
+                summaries[k] = _fallback_summary(plan.chunks[k])
+        original_tokens = estimate_tokens(text)
+        reduced = _compose(plan, summaries, original_tokens)
+        with self._lock:
+            self._stats["emails"] += 1
+            self._stats["chunks"] += len(plan.chunks)
+            self._stats["summary_errors"] += errors
+            self._stats["truncated"] += bool(plan.omitted)
+            self._stats["original_tokens"] += original_tokens
+            self._stats["reduced_tokens"] += estimate_tokens(reduced)
+        logger.info(
+            "Reduced a %d-token email to %d tokens (%d/%d sections summarised)",
+            original_tokens, estimate_tokens(reduced), len(plan.chunks), plan.total,
+        )
+        return reduced
+
+    def reduce(self, text: str, final_reserved_tokens: int) -> str:
+        """
+        Summarise the email's pieces one by one and return the reduced text.
+        Raises CircuitOpenError as soon as the Groq circuit opens — the
+        remaining pieces are not sent, and the caller degrades.
+        """
+        plan = plan_chunks(text, final_reserved_tokens)
+        summaries: list = []
+        for k, chunk in enumerate(plan.chunks):
+            try:
+                cost = _map_cost(chunk)
+                with groq_breaker.guard(), \
+                        track("summarise_chunk", self.usage_model, cost - CHUNK_SUMMARY_MAX_TOKENS) as call:
+                    limiter.acquire(self.model, cost)
+                    call.started()
+                    summary = self.chain.invoke(self._inputs(plan, k), config=call.config)
+                    call.set_output(summary)
+                summaries.append(summary)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                summaries.append(e)
+        return self._finish(plan, summaries, text)
+
+    async def areduce(self, text: str, final_reserved_tokens: int) -> str:
+        """Async version of reduce() — the map calls run concurrently."""
+        plan = plan_chunks(text, final_reserved_tokens)
+
+        async def _summarise(k: int):
+            cost = _map_cost(plan.chunks[k])
+            with groq_breaker.guard(), \
+                    track("summarise_chunk", self.usage_model, cost - CHUNK_SUMMARY_MAX_TOKENS) as call:
+                await limiter.aacquire(self.model, cost)
+                call.started()
+                summary = await self.chain.ainvoke(self._inputs(plan, k), config=call.config)
+                call.set_output(summary)
+            return summary
+
+        summaries = await asyncio.gather(
+            *(_summarise(k) for k in range(len(plan.chunks))), return_exceptions=True,
+        )
+        for summary in summaries:
+            if isinstance(summary, CircuitOpenError):
+                raise summary  # the circuit opened mid-way — degrade instead of a partial reduction
+        return self._finish(plan, list(summaries), text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_tokens": CHUNKING_THRESHOLD_TOKENS,
+                "chunk_tokens": CHUNK_TOKENS,
+                "ticket_max_tokens": TICKET_MAX_TOKENS,
+                "model": self.model,
+                **self._stats,
+            }
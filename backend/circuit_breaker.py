@@ -0,0 +1,202 @@
+"""
+Circuit breaker around the Groq API.
+
+When Groq is slow or down every call waits for its timeout and fails, so
+ingestion stalls behind requests that cannot succeed. The breaker counts
+consecutive outage failures (timeouts, connection errors, 5xx) across all
+call sites — the agent chains, batch calls and the urgency classifier:
+
+  • closed    : calls go through; CIRCUIT_FAILURE_THRESHOLD failures in a
+                row open the circuit
+  • open      : calls fail fast with CircuitOpenError, without queueing on
+                the rate limiter; callers fall back to degraded mode (rule-
+                based triage + template drafts, see agent.degraded_analysis)
+  • half-open : after CIRCUIT_RECOVERY_SECONDS one probe call is let
+                through — success closes the circuit, failure re-opens it
+
+Quota errors (429, the local rate limiter) and bad model output are not
+outages: the API answered, so they count as a success for the breaker.
+
+LLM_BACKEND=fake goes through the same breaker (FakeLLMError counts as an
+outage), so FAKE_LLM_ERROR_RATE=1 exercises degraded mode offline.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+import httpx
+import groq
+
+from fake_llm import FakeLLMError
+from rate_limiter import RateLimitExceeded
+from metrics import CIRCUIT_TRANSITIONS, CIRCUIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open — retry in {retry_after:.0f}s.")
+
+
+def is_outage(exc: BaseException) -> bool:
+    """True for failures that mean the API is unreachable or unhealthy."""
+    if isinstance(exc, (groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)):
+        return True
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code >= 500
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError, TimeoutError, FakeLLMError))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS,
+        enabled: bool = CIRCUIT_BREAKER_ENABLED,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0        # consecutive outage failures
+        self._opened_at = 0.0
+        self._probing = False     # a half-open probe is in flight
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _transition(self, state: str) -> None:
+        # Caller holds the lock
+        if state == self._state:
+            return
+        logger.warning("Circuit '%s': %s → %s", self.name, self._state, state)
+        self._state = state
+        CIRCUIT_TRANSITIONS.inc(breaker=self.name, state=state)
+        if state == OPEN:
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            self._probing = False
+        elif state == HALF_OPEN:
+            self._probing = False
+        else:
+            self._failures = 0
+
+    def _current(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current()
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)."""
+        with self._lock:
+            if self._current() != OPEN:
+                return 0.0
+            return max(self.recovery_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Claim permission for one call. In half-open only one probe is let through."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._current()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+        CIRCUIT_REJECTED.inc(breaker=self.name)
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._transition(OPEN)
+
+    def release(self) -> None:
+        """The call ended without telling us anything (cancelled, queued out) — free the probe slot."""
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """
+        Wrap one API call:
+
+            with groq_breaker.guard():
+                limiter.acquire(model, tokens)
+                result = chain.invoke(...)
+
+        Raises CircuitOpenError up front when the circuit is open, and
+        records the call's outcome on the way out.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            yield
+        except BaseException as exc:
+            if is_outage(exc):
+                self.record_failure()
+            elif isinstance(exc, (RateLimitExceeded, asyncio.CancelledError, KeyboardInterrupt)):
+                self.release()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current()
+            retry_after = (
+                max(self.recovery_seconds - (time.monotonic() - self._opened_at), 0.0)
+                if state == OPEN else 0.0
+            )
+            return {
+                "enabled": self.enabled,
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_seconds": self.recovery_seconds,
+                "retry_after_seconds": round(retry_after, 1),
+                "times_opened": self.opened,
+                "rejected_calls": self.rejected,
+            }
+
+
+# One breaker per process for everything that talks to Groq.
+groq_breaker = CircuitBreaker("groq")
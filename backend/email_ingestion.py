@@ -22,6 +22,8 @@ import requests
 from email.header import decode_header
 from dotenv import load_dotenv
 
+from preprocess import html_to_text, preprocess_email
+
 # -------------------- Configuration --------------------
 
 load_dotenv()
@@ -33,7 +35,11 @@ IMAP_SERVER = "imap.gmail.com"
 IMAP_PORT = 993
 MAILBOX = "INBOX"
 
-API_ENDPOINT = "http://127.0.0.1:8000/process_ticket"
+API_ENDPOINT = "http://127.0.0.1:8000/process_tickets"
+API_TIMEOUT = 300  # seconds — one request carries one slice of the unread emails
+# Emails per /process_tickets request: the API analyses BATCH_MAX_EMAILS (5) ×
+# PROCESS_TICKETS_CONCURRENCY (4) at once, and accepts at most 100.
+API_BATCH_SIZE = min(int(os.getenv("INGEST_BATCH_SIZE", "20")), 100)
 POLL_INTERVAL = 10  # seconds
 
 # -------------------- Logging --------------------
@@ -89,7 +95,7 @@ def extract_body(msg: email.message.Message) -> str:
     Extract the plain-text body from an email message.
 
     Walks the MIME tree and returns the first text/plain part.
-    Falls back to text/html (stripped of tags) if no plain-text part exists.
+    Falls back to text/html (converted to text) if no plain-text part exists.
     """
     body = ""
 
@@ -114,10 +120,7 @@ def extract_body(msg: email.message.Message) -> str:
                 if payload:
                     charset = part.get_content_charset() or "utf-8"
                     html = payload.decode(charset, errors="replace")
-                    # Basic HTML tag stripping (good enough for triage)
-                    import re
-                    body = re.sub(r"<[^>]+>", " ", html)
-                    body = re.sub(r"\s+", " ", body).strip()
+                    body = html_to_text(html)
     else:
         payload = msg.get_payload(decode=True)
         if payload:
@@ -127,26 +130,31 @@ def extract_body(msg: email.message.Message) -> str:
     return body.strip()
 
 
-def send_to_api(email_body: str, subject: str, sender: str) -> dict | None:
+def compose_ticket_text(email_body: str, subject: str, sender: str) -> str:
     """
-    Send the email data to the /process_ticket API endpoint.
+    Build the text sent to the API for one email.
 
-    The API expects {"email_body": "..."} — we prepend the subject and
-    sender to give the AI more context.
+    We prepend the subject and sender to give the AI more context.
     """
-    # Compose a rich text block for the AI to analyse
-    full_text = (
+    return (
         f"From: {sender}\n"
         f"Subject: {subject}\n"
         f"\n"
         f"{email_body}"
     )
 
+
+def send_batch_to_api(email_texts: list[str]) -> dict | None:
+    """
+    Send a slice of the pending emails (at most API_BATCH_SIZE) to the
+    /process_tickets API endpoint in one request. The response has one
+    result per email, in the same order.
+    """
     try:
         resp = requests.post(
             API_ENDPOINT,
-            json={"email_body": full_text},
-            timeout=60,
+            json={"emails": email_texts},
+            timeout=API_TIMEOUT,
         )
         resp.raise_for_status()
         return resp.json()
@@ -170,7 +178,7 @@ def mark_as_read(mail: imaplib.IMAP4_SSL, email_id: bytes):
 
 
 def process_unread_emails(mail: imaplib.IMAP4_SSL):
-    """Search for UNSEEN emails, extract data, and forward to the API."""
+    """Search for UNSEEN emails, extract data, and forward them to the API in one batch."""
     status, messages = mail.search(None, "UNSEEN")
 
     if status != "OK":
@@ -184,6 +192,8 @@ def process_unread_emails(mail: imaplib.IMAP4_SSL):
 
     logger.info(f"📬 Found {len(email_ids)} unread email(s). Processing...")
 
+    # ---- Collect every unread email first ----
+    pending: list[tuple[bytes, str]] = []  # (email_id, text for the API)
     for email_id in email_ids:
         try:
             # Fetch the email
@@ -210,25 +220,58 @@ def process_unread_emails(mail: imaplib.IMAP4_SSL):
                 mark_as_read(mail, email_id)
                 continue
 
-            # Send to API
-            result = send_to_api(body, subject, sender)
+            text = compose_ticket_text(body, subject, sender)
+            # The API trims the prompt the same way (and stores the full text)
+            trimmed = preprocess_email(text, record=False)
+            if trimmed.removed:
+                logger.info(
+                    f"  ✂️  Prompt trimmed ({', '.join(trimmed.removed)}): "
+                    f"~{trimmed.tokens_saved} of {trimmed.original_tokens} tokens saved"
+                )
+            pending.append((email_id, text))
+
+        except Exception as e:
+            logger.error(f"  ❌ Error reading email ID {email_id}: {e}")
+            continue  # don't crash — move to next email
+
+    if not pending:
+        return
+
+    # ---- Send them in slices; each slice is marked read as it completes ----
+    for start in range(0, len(pending), API_BATCH_SIZE):
+        if not _process_slice(mail, pending[start:start + API_BATCH_SIZE]):
+            break  # API unavailable — the rest waits for the next cycle
+
+
+def _process_slice(mail: imaplib.IMAP4_SSL, pending: list[tuple[bytes, str]]) -> bool:
+    """Send one slice of emails to the API and mark the processed ones as read. False if the API call failed."""
+    response = send_batch_to_api([text for _, text in pending])
+    if response is None:
+        logger.warning("  ⚠️  Failed to process via API (will retry next cycle).")
+        return False  # don't mark this slice as read — retry next loop
 
-            if result:
-                ticket_id = result.get("ticket_id", "N/A")
-                priority = result.get("analysis", {}).get("priority", "N/A")
-                category = result.get("analysis", {}).get("category", "N/A")
-                logger.info(f"  ✅ Ticket created: {ticket_id[:8]}... | Priority: {priority} | Category: {category}")
+    for (email_id, _), result in zip(pending, response.get("results", [])):
+        try:
+            status = result.get("status")
+            if status == "created":
+                ticket_id = result.get("ticket_id") or "N/A"
+                logger.info(
+                    f"  ✅ Ticket created: {ticket_id[:8]}... | "
+                    f"Priority: {result.get('priority', 'N/A')} | Category: {result.get('category', 'N/A')}"
+                )
+            elif status == "duplicate":
+                logger.info("  ⏭️  Duplicate of an existing ticket — skipped.")
             else:
-                logger.warning("  ⚠️  Failed to process via API (will retry next cycle).")
+                logger.warning(f"  ⚠️  {result.get('error') or 'Processing failed'} (will retry next cycle).")
                 continue  # don't mark as read — retry next loop
 
             # Mark as read only after successful processing
             mark_as_read(mail, email_id)
-            logger.info(f"  ✔️  Marked as read.")
-
         except Exception as e:
-            logger.error(f"  ❌ Error processing email ID {email_id}: {e}")
-            continue  # don't crash — move to next email
+            logger.error(f"  ❌ Error finishing email ID {email_id}: {e}")
+
+    logger.info(f"  ✔️  {response.get('message', '')}")
+    return True
 
 
 # -------------------- Main Loop --------------------
@@ -0,0 +1,378 @@
+"""
+Offline, deterministic stand-in for the Groq LLM calls.
+
+Switch it on with LLM_BACKEND=fake. agent.py then uses the fake chains (or,
+with AGENT_ENGINE=native, fake Groq clients) and urgency_classifier.py uses
+the fake Groq client, so the whole pipeline
+(/process_ticket, /fetch_emails, /classify_urgency, ...) can be load-tested
+without an API key and without spending quota.
+
+  • Outputs are schema-valid (TicketAnalysisWithDraft, BatchTicketAnalysis,
+    UrgencyResult JSON) and derived from simple keyword rules, so the same
+    email always gets the same answer.
+  • Latency is drawn from a lognormal distribution (median + sigma), which
+    matches the long right tail of real LLM calls.
+  • A configurable fraction of calls fails with FakeLLMError.
+  • FAKE_LLM_MALFORMED_RATE of the calls return near-miss JSON instead —
+    fenced, truncated or lower-case enums, with the odd unparseable
+    refusal — to exercise json_repair.py.
+
+Fake results are cached under a "fake:" model tag (see cache_model()) so
+they can never be served by the real backend later.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from schemas import TicketAnalysis, TicketAnalysisWithDraft, BatchTicketAnalysis
+from tokens import estimate_tokens
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").strip().lower()
+FAKE_LLM = LLM_BACKEND == "fake"
+
+FAKE_LLM_LATENCY_MEDIAN_MS = float(os.getenv("FAKE_LLM_LATENCY_MEDIAN_MS", "900"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.4"))
+FAKE_CLASSIFIER_LATENCY_MEDIAN_MS = float(os.getenv("FAKE_CLASSIFIER_LATENCY_MEDIAN_MS", "250"))
+FAKE_CLASSIFIER_LATENCY_SIGMA = float(os.getenv("FAKE_CLASSIFIER_LATENCY_SIGMA", "0.3"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0.0"))
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0.0"))
+FAKE_STREAM_TOKEN_SECONDS = float(os.getenv("FAKE_STREAM_TOKEN_MS", "15")) / 1000  # between streamed words
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")  # unset → different latencies every run
+
+
+class FakeLLMError(RuntimeError):
+    """Injected failure — stands in for a Groq API / network error."""
+
+
+def cache_model(model: str) -> str:
+    """Model name to use in cache keys, tagged when the fake backend is active."""
+    return f"fake:{model}" if FAKE_LLM else model
+
+
+# ────────────────────── Latency / error model ──────────────────────
+
+class LatencyModel:
+    """Lognormal latency + random failures, shared by every fake call site."""
+
+    def __init__(
+        self,
+        median_ms: float,
+        sigma: float,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        seed: str | None = FAKE_LLM_SEED,
+        malformed_rate: float = FAKE_LLM_MALFORMED_RATE,
+    ):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple[float, bool]:
+        """Return (delay_seconds, should_fail) for one call."""
+        with self._lock:
+            delay_ms = self._rng.lognormvariate(math.log(max(self.median_ms, 0.001)), self.sigma)
+            fail = self._rng.random() < self.error_rate
+        return (delay_ms / 1000 if self.median_ms > 0 else 0.0), fail
+
+    def malformed(self) -> str | None:
+        """How to break this call's output: None, "near_miss" (repairable) or "garbage"."""
+        if self.malformed_rate <= 0:
+            return None  # leaves the seeded latency sequence untouched
+        with self._lock:
+            if self._rng.random() >= self.malformed_rate:
+                return None
+            return "garbage" if self._rng.random() < 0.25 else "near_miss"
+
+    def wait(self) -> None:
+        delay, fail = self.draw()
+        time.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure")
+
+    async def await_(self) -> None:
+        delay, fail = self.draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected fake LLM failure")
+
+
+agent_latency = LatencyModel(FAKE_LLM_LATENCY_MEDIAN_MS, FAKE_LLM_LATENCY_SIGMA)
+classifier_latency = LatencyModel(FAKE_CLASSIFIER_LATENCY_MEDIAN_MS, FAKE_CLASSIFIER_LATENCY_SIGMA)
+
+
+# ────────────────────── Keyword rules ──────────────────────
+
+_FRAUD_WORDS = re.compile(
+    r"\b(fraud|unauthori[sz]ed|stolen|hack(ed)?|breach|phishing|didn'?t make|not me)\b", re.I,
+)
+_PAYMENT_WORDS = re.compile(
+    r"\b(refund|charged|double|twice|billing|invoice|payment|declined|failed|overdraft|fee)\b", re.I,
+)
+_URGENT_WORDS = re.compile(r"\b(urgent|immediately|asap|right now|emergency)\b", re.I)
+_NEGATIVE_WORDS = re.compile(r"\b(angry|unacceptable|terrible|frustrat\w*|worst|ridiculous|upset)\b", re.I)
+_POSITIVE_WORDS = re.compile(r"\b(thanks?|thank you|great|appreciate|love)\b", re.I)
+_TXN_ID = re.compile(r"\b((?:TXN|REF)[-_ ]?\d[\w-]*)\b", re.I)
+_AMOUNT = re.compile(r"[$€£₹]\s?\d[\d,]*(\.\d{2})?")
+_NAME = re.compile(r"(?i:my name is|regards,|thanks,|sincerely,)\s*\n?\s*([A-Z][a-z]+(?: [A-Z][a-z]+)?)")
+
+
+def _analyse(text: str) -> dict:
+    """Rule-based analysis fields for one email (no draft)."""
+    if _FRAUD_WORDS.search(text):
+        priority, category, intent = "High", "Fraud", "Report unauthorized transaction"
+    elif _PAYMENT_WORDS.search(text):
+        priority, category, intent = "Medium", "Payment Issue", "Resolve payment issue"
+    else:
+        priority, category, intent = "Low", "General", "General account inquiry"
+
+    if _URGENT_WORDS.search(text):
+        sentiment = "Urgent"
+    elif _NEGATIVE_WORDS.search(text) or category == "Fraud":
+        sentiment = "Negative"
+    elif _POSITIVE_WORDS.search(text):
+        sentiment = "Positive"
+    else:
+        sentiment = "Neutral"
+
+    txn = _TXN_ID.search(text)
+    amount = _AMOUNT.search(text)
+    name = _NAME.search(text)
+    first_line = " ".join(text.split())[:120]
+    return {
+        "sentiment": sentiment,
+        "intent": intent,
+        "entities": {
+            "customer_name": name.group(1) if name else None,
+            "transaction_id": txn.group(1).upper() if txn else None,
+            "amount": amount.group(0) if amount else None,
+        },
+        "priority": priority,
+        "category": category,
+        "summary": f"{intent}: {first_line}",
+    }
+
+
+def _draft(fields: dict) -> str:
+    name = fields["entities"]["customer_name"] or "Customer"
+    return (
+        f"Dear {name},\n\n"
+        f"Thank you for contacting us about this {fields['category'].lower()} matter. "
+        f"Our team has logged your request ({fields['intent'].lower()}) and will follow up "
+        f"shortly.\n\nBest regards,\nCustomer Support Team"
+    )
+
+
+def fake_analysis(text: str) -> TicketAnalysis:
+    return TicketAnalysis.model_validate(_analyse(text))
+
+
+def fake_analysis_with_draft(text: str) -> TicketAnalysisWithDraft:
+    fields = _analyse(text)
+    return TicketAnalysisWithDraft.model_validate({**fields, "draft_response": _draft(fields)})
+
+
+_BATCH_ITEM = re.compile(r"EMAIL \[(\d+)\]\n<<<\n(.*?)\n>>>", re.S)
+
+
+def fake_batch(formatted: str) -> BatchTicketAnalysis:
+    """Answer a batch prompt built by agent._format_batch()."""
+    items = []
+    for index, text in _BATCH_ITEM.findall(formatted):
+        fields = _analyse(text)
+        items.append({"index": int(index), **fields, "draft_response": _draft(fields)})
+    return BatchTicketAnalysis.model_validate({"items": items})
+
+
+_ENUM_FIELDS = ("sentiment", "priority", "category", "urgency", "subcategory")
+_GARBAGE = "I'm sorry, I can't help with formatting that request."
+
+
+def near_miss(payload: dict, fenced: bool) -> str:
+    """
+    Almost-valid JSON as models tend to produce it: lower-case enum values,
+    and either wrapped in ``` fences with a trailing sentence (fenced) or
+    cut off before the closing brace.
+    """
+    data = {k: v.lower() if k in _ENUM_FIELDS and isinstance(v, str) else v for k, v in payload.items()}
+    text = json.dumps(data)
+    if fenced:
+        return f"```json\n{text}\n```\nLet me know if you need anything else."
+    return text[:-1]
+
+
+# ────────────────────── Fake LangChain chains ──────────────────────
+
+class FakeChain:
+    """Duck-types the `prompt | structured_llm` chains used by agent.py."""
+
+    def __init__(self, kind: str, latency: LatencyModel = agent_latency):
+        self.kind = kind  # "combined" | "analysis" | "batch" | "summary" | "draft"
+        self.latency = latency
+
+    def _answer(self, inputs: dict):
+        if self.kind == "batch":
+            # Same shape as with_structured_output(..., include_raw=True)
+            return {"raw": None, "parsed": fake_batch(inputs["emails"]), "parsing_error": None}
+        if self.kind == "summary":
+            return fake_summary(inputs["chunk"])
+        if self.kind == "draft":
+            return fake_draft(inputs)
+        if self.kind == "analysis":
+            result = fake_analysis(inputs["email_body"])
+        else:
+            result = fake_analysis_with_draft(inputs["email_body"])
+        # Same shape as with_structured_output(..., include_raw=True); a
+        # malformed answer arrives as an invalid tool call, like LangChain
+        # reports arguments that are not valid JSON
+        broken = self.latency.malformed()
+        if broken is None:
+            return {"raw": None, "parsed": result, "parsing_error": None}
+        args = _GARBAGE if broken == "garbage" else near_miss(result.model_dump(), fenced=False)
+        raw = SimpleNamespace(content="", tool_calls=[], invalid_tool_calls=[{"name": self.kind, "args": args}])
+        return {"raw": raw, "parsed": None, "parsing_error": ValueError("invalid tool call arguments")}
+
+    def invoke(self, inputs: dict, config=None):
+        self.latency.wait()
+        return self._answer(inputs)
+
+    async def ainvoke(self, inputs: dict, config=None):
+        await self.latency.await_()
+        return self._answer(inputs)
+
+    async def astream(self, inputs: dict, config=None):
+        """Text chains only: the answer word by word, the first after the drawn latency."""
+        await self.latency.await_()
+        for piece in re.findall(r"\S+\s*", self._answer(inputs)):
+            yield piece
+            await asyncio.sleep(FAKE_STREAM_TOKEN_SECONDS)
+
+
+def fake_summary(chunk: str) -> str:
+    """Chunk summary for chunking.py: the lines carrying facts, else the opening."""
+    facts = [
+        line.strip() for line in chunk.splitlines()
+        if _FRAUD_WORDS.search(line) or _PAYMENT_WORDS.search(line)
+        or _TXN_ID.search(line) or _AMOUNT.search(line)
+    ]
+    return "\n".join(facts[:8]) or chunk[:400].strip()
+
+
+def fake_draft(inputs: dict) -> str:
+    """Plain-text reply for agent.draft_prompt's inputs (triage fields + email)."""
+    name = inputs.get("customer_name")
+    return _draft({
+        "entities": {"customer_name": None if name in (None, "unknown") else name},
+        "category": inputs["category"],
+        "intent": inputs["intent"],
+    })
+
+
+def fake_chains() -> tuple[FakeChain, FakeChain, FakeChain]:
+    """(combined_chain, analysis_only_chain, batch_chain) replacements."""
+    return FakeChain("combined"), FakeChain("analysis"), FakeChain("batch")
+
+
+def fake_draft_chain() -> FakeChain:
+    """Stand-in for agent.py's draft-only text chain (lazy drafts)."""
+    return FakeChain("draft")
+
+
+def fake_summary_chain() -> FakeChain:
+    """Stand-in for chunking.py's 8B summary chain."""
+    return FakeChain("summary", classifier_latency)
+
+
+# ────────────────────── Fake Groq client ──────────────────────
+
+_SUBCATEGORY = {
+    "Fraud": ("High", "Fraud_Report"),
+    "Payment Issue": ("Medium", "Dispute_Initiation"),
+    "General": ("Low", "General_Inquiry"),
+}
+
+
+def fake_urgency_json(text: str) -> str:
+    """UrgencyResult-shaped JSON, as the 8B classifier would return it."""
+    fields = _analyse(text)
+    urgency, subcategory = _SUBCATEGORY[fields["category"]]
+    return json.dumps({
+        "urgency": urgency,
+        "subcategory": subcategory,
+        "confidence": 0.9 if urgency != "Low" else 0.7,
+        "reasoning": f"Keyword rules matched {fields['category']}.",
+    })
+
+
+def fake_agent_json(kind: str, messages: list[dict]) -> str:
+    """JSON-mode answer for native_agent.py: "combined" | "analysis" | "batch"."""
+    text = messages[-1]["content"] if messages else ""
+    if kind == "batch":
+        return fake_batch(text).model_dump_json()
+    if kind == "analysis":
+        return fake_analysis(text).model_dump_json()
+    return fake_analysis_with_draft(text).model_dump_json()
+
+
+def _urgency_answer(messages: list[dict]) -> str:
+    return fake_urgency_json(messages[-1]["content"] if messages else "")
+
+
+def _completion(model: str, messages: list[dict], answer=_urgency_answer, broken: str | None = None) -> SimpleNamespace:
+    content = answer(messages)
+    if broken == "garbage":
+        content = _GARBAGE
+    elif broken == "near_miss":
+        content = near_miss(json.loads(content), fenced=True)
+    prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+    completion_tokens = estimate_tokens(content)
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+class _Completions:
+    def __init__(self, latency: LatencyModel, answer):
+        self._latency = latency
+        self._answer = answer
+
+    def create(self, *, model: str, messages: list[dict], **kwargs):
+        self._latency.wait()
+        return _completion(model, messages, self._answer, self._latency.malformed())
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, *, model: str, messages: list[dict], **kwargs):
+        await self._latency.await_()
+        return _completion(model, messages, self._answer, self._latency.malformed())
+
+
+class FakeGroq:
+    """
+    Drop-in for groq.Groq — only chat.completions.create() is implemented.
+    answer(messages) → response content; the urgency classifier's by default.
+    """
+
+    def __init__(self, latency: LatencyModel = classifier_latency, answer=_urgency_answer):
+        self.chat = SimpleNamespace(completions=_Completions(latency, answer))
+
+
+class FakeAsyncGroq:
+    """Drop-in for groq.AsyncGroq."""
+
+    def __init__(self, latency: LatencyModel = classifier_latency, answer=_urgency_answer):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(latency, answer))
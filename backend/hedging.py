@@ -0,0 +1,250 @@
+"""
+Hedged LLM requests — tail-latency control.
+
+Most Groq calls finish in a second or two, but a few take 20–60 s and hold
+up everything queued behind them (the sequential /fetch_emails loop, a
+/process_tickets group). With HEDGING_ENABLED=true a call that has not
+returned by its hedge deadline gets a duplicate — for the agent on
+AGENT_HEDGE_ROUTE (the cheap 8B model by default), for the classifier on the
+same model — and the first valid result wins. The loser is cancelled
+(async) or abandoned and its result discarded (sync).
+
+  • Deadline : the HEDGE_PERCENTILE latency of the last HEDGE_WINDOW
+               successful calls per (operation, model), at least
+               HEDGE_MIN_DELAY_SECONDS; HEDGE_INITIAL_DELAY_SECONDS until
+               HEDGE_MIN_SAMPLES calls have been seen
+  • Budget   : a hedge is only sent if hedges stay under HEDGE_MAX_RATE of
+               the calls in the last minute (plus one, so a quiet worker can
+               still hedge its one slow call) and the backup model has
+               rate-limiter capacity within HEDGE_MAX_QUEUE_SECONDS — a
+               hedge never queues behind the traffic it is meant to beat
+
+Outcomes are counted in /metrics (triage_llm_hedges_total) and stats().
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from rate_limiter import limiter
+from metrics import LLM_HEDGES
+from timing import in_scope
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1.0"))
+HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("HEDGE_INITIAL_DELAY_SECONDS", "10"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))
+HEDGE_MAX_QUEUE_SECONDS = float(os.getenv("HEDGE_MAX_QUEUE_SECONDS", "0"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))  # threads for the sync path
+
+if not 0 < HEDGE_PERCENTILE < 1:
+    raise ValueError("HEDGE_PERCENTILE must be between 0 and 1.")
+
+
+@dataclass(frozen=True)
+class Attempt:
+    """One way to make a call: fn() (or await fn() on the async path) on `model`."""
+    model: str
+    tokens: int
+    fn: Callable[[], Any]
+
+
+def _always_valid(result: Any) -> bool:
+    return True
+
+
+class Hedger:
+    """Sends a backup request when the primary overruns its percentile deadline."""
+
+    def __init__(self, enabled: bool = HEDGING_ENABLED, max_rate: float = HEDGE_MAX_RATE):
+        self.enabled = enabled
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+        self._calls: deque[float] = deque()   # start times of hedgeable calls, last minute
+        self._hedges: deque[float] = deque()  # start times of hedges, last minute
+        self._pool: ThreadPoolExecutor | None = None
+        self._counts = {"calls": 0, "hedged": 0, "backup_won": 0, "primary_won": 0,
+                        "both_failed": 0, "skipped_budget": 0}
+
+    # ── Deadlines ──
+
+    def delay(self, operation: str, model: str) -> float:
+        """Seconds to wait for the primary before hedging."""
+        with self._lock:
+            samples = sorted(self._latencies.get((operation, model), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY_SECONDS
+        index = min(int(len(samples) * HEDGE_PERCENTILE), len(samples) - 1)
+        return max(samples[index], HEDGE_MIN_DELAY_SECONDS)
+
+    def _observe(self, operation: str, model: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.get((operation, model))
+            if window is None:
+                window = self._latencies[(operation, model)] = deque(maxlen=HEDGE_WINDOW)
+            window.append(seconds)
+
+    def _timed(self, operation: str, attempt: Attempt):
+        t0 = time.perf_counter()
+        result = attempt.fn()
+        self._observe(operation, attempt.model, time.perf_counter() - t0)
+        return result
+
+    async def _atimed(self, operation: str, attempt: Attempt):
+        t0 = time.perf_counter()
+        result = await attempt.fn()
+        self._observe(operation, attempt.model, time.perf_counter() - t0)
+        return result
+
+    # ── Budget ──
+
+    def _trim(self, now: float) -> None:
+        for window in (self._calls, self._hedges):
+            while window and window[0] <= now - 60:
+                window.popleft()
+
+    def _start_call(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._calls.append(now)
+            self._counts["calls"] += 1
+
+    def _allow_hedge(self, operation: str, backup: Attempt) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            within_rate = len(self._hedges) < self.max_rate * len(self._calls) + 1
+            if within_rate and limiter.queue_wait(backup.model, backup.tokens) <= HEDGE_MAX_QUEUE_SECONDS:
+                self._hedges.append(now)
+                self._counts["hedged"] += 1
+                return True
+            self._counts["skipped_budget"] += 1
+        LLM_HEDGES.inc(operation=operation, outcome="skipped_budget")
+        return False
+
+    def _record(self, operation: str, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+        LLM_HEDGES.inc(operation=operation, outcome=outcome)
+
+    # ── Running ──
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+            return self._pool
+
+    def run(
+        self, operation: str, primary: Attempt, backup: Attempt | None = None,
+        valid: Callable[[Any], bool] = _always_valid,
+    ) -> tuple[Any, Attempt]:
+        """
+        Call primary.fn(), hedging with backup.fn() past the deadline.
+        Returns (result, attempt that produced it). An invalid result only
+        wins if the other attempt fails too; if both raise, the primary's
+        error is raised.
+        """
+        if not self.enabled or backup is None:
+            return self._timed(operation, primary), primary
+        self._start_call()
+        pool = self._executor()
+        first = pool.submit(in_scope(self._timed, operation, primary))
+        try:
+            return first.result(timeout=self.delay(operation, primary.model)), primary
+        except FutureTimeoutError:
+            pass
+        if not self._allow_hedge(operation, backup):
+            return first.result(), primary
+
+        second = pool.submit(in_scope(self._timed, operation, backup))
+        attempts = {first: primary, second: backup}
+        pending, fallback, errors = set(attempts), None, {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    errors[attempts[future]] = future.exception()
+                elif valid(future.result()):
+                    for other in pending:
+                        other.cancel()  # only stops it if it hasn't started yet
+                    self._record(operation, "primary_won" if future is first else "backup_won")
+                    return future.result(), attempts[future]
+                elif fallback is None:
+                    fallback = (future.result(), attempts[future])
+        self._record(operation, "both_failed")
+        if fallback is not None:
+            return fallback
+        raise errors.get(primary) or errors[backup]
+
+    async def arun(
+        self, operation: str, primary: Attempt, backup: Attempt | None = None,
+        valid: Callable[[Any], bool] = _always_valid,
+    ) -> tuple[Any, Attempt]:
+        """Async version of run(); the losing attempt is cancelled."""
+        if not self.enabled or backup is None:
+            return await self._atimed(operation, primary), primary
+        self._start_call()
+        first = asyncio.ensure_future(self._atimed(operation, primary))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay(operation, primary.model))
+            if done or not self._allow_hedge(operation, backup):
+                return await first, primary
+
+            second = asyncio.ensure_future(self._atimed(operation, backup))
+            tasks.append(second)
+            attempts = {first: primary, second: backup}
+            pending, fallback, errors = set(attempts), None, {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[attempts[task]] = task.exception()
+                    elif valid(task.result()):
+                        self._record(operation, "primary_won" if task is first else "backup_won")
+                        return task.result(), attempts[task]
+                    elif fallback is None:
+                        fallback = (task.result(), attempts[task])
+            self._record(operation, "both_failed")
+            if fallback is not None:
+                return fallback
+            raise errors.get(primary) or errors[backup]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()  # a loser still queued on the rate limiter gives its quota back
+
+    def stats(self) -> dict:
+        with self._lock:
+            deadlines = {
+                f"{operation}:{model}": len(window)
+                for (operation, model), window in self._latencies.items()
+            }
+            counts = dict(self._counts)
+        return {
+            "enabled": self.enabled,
+            "percentile": HEDGE_PERCENTILE,
+            "max_rate": self.max_rate,
+            "max_queue_seconds": HEDGE_MAX_QUEUE_SECONDS,
+            **counts,
+            "hedge_rate": round(counts["hedged"] / counts["calls"], 4) if counts["calls"] else 0.0,
+            "deadlines": {
+                key: {"samples": n, "seconds": round(self.delay(*key.split(":", 1)), 3)}
+                for key, n in deadlines.items()
+            },
+        }
+
+
+# One hedger per process, shared by the agent and the classifier.
+hedger = Hedger()
@@ -0,0 +1,339 @@
+"""
+Repair layer for structured LLM output, with jittered-backoff retries.
+
+The models occasionally return output that is almost right: the JSON is
+wrapped in ``` fences or followed by a sentence of prose, truncated before
+its closing braces, has a trailing comma, or uses "high" / "payment_issue"
+where the schema wants "High" / "Payment Issue". Groq may also reject the
+output outright (400 tool_use_failed, or json_validate_failed in JSON
+mode) and hand back the generation it refused. Without this module the
+whole call was thrown away — a 500 from the agent, a Medium fallback from
+the classifier.
+
+  1. Local repair first (no API call): strip fences and surrounding text,
+     drop trailing commas, close an unterminated string and any open
+     braces / brackets, unwrap {"name": …, "arguments": {…}} tool-call
+     envelopes, and map enum values onto the schema case- and
+     separator-insensitively.
+  2. Only if that fails, the call is retried up to STRUCTURED_RETRY_ATTEMPTS
+     times with full-jitter exponential backoff (uniform between 0 and
+     min(STRUCTURED_RETRY_MAX_SECONDS, STRUCTURED_RETRY_BASE_SECONDS · 2^n)).
+
+Outcomes are counted per operation and error class (json_decode,
+validation, tool_use_failed, json_validate_failed, missing_output) —
+repaired, retried, recovered, gave_up — in repair_stats() and /metrics.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import typing
+import asyncio
+import threading
+from enum import Enum
+from typing import Any, Callable
+
+from pydantic import BaseModel, ValidationError
+
+from metrics import LLM_OUTPUT_REPAIRS
+
+STRUCTURED_RETRY_ATTEMPTS = int(os.getenv("STRUCTURED_RETRY_ATTEMPTS", "2"))  # extra calls after the first
+STRUCTURED_RETRY_BASE_SECONDS = float(os.getenv("STRUCTURED_RETRY_BASE_SECONDS", "0.5"))
+STRUCTURED_RETRY_MAX_SECONDS = float(os.getenv("STRUCTURED_RETRY_MAX_SECONDS", "8"))
+
+ERROR_CLASSES = ("json_decode", "validation", "tool_use_failed", "json_validate_failed", "missing_output")
+_REJECTION_CODES = ("tool_use_failed", "json_validate_failed")  # Groq 400s that carry the failed generation
+
+
+class StructuredOutputError(Exception):
+    """The model's output could not be parsed or repaired into the schema."""
+
+    def __init__(self, error_class: str, message: str):
+        self.error_class = error_class
+        super().__init__(f"{error_class}: {message}")
+
+
+# ────────────────────── Stats ──────────────────────
+
+_lock = threading.Lock()
+_counts: dict[str, dict[str, int]] = {
+    error: {"repaired": 0, "retried": 0, "recovered": 0, "gave_up": 0} for error in ERROR_CLASSES
+}
+
+
+def _record(operation: str, error_class: str, outcome: str) -> None:
+    with _lock:
+        _counts[error_class][outcome] += 1
+    LLM_OUTPUT_REPAIRS.inc(operation=operation, error=error_class, outcome=outcome)
+
+
+def repair_stats() -> dict:
+    with _lock:
+        return {
+            "retry_attempts": STRUCTURED_RETRY_ATTEMPTS,
+            "retry_base_seconds": STRUCTURED_RETRY_BASE_SECONDS,
+            "retry_max_seconds": STRUCTURED_RETRY_MAX_SECONDS,
+            "by_error": {error: dict(counts) for error, counts in _counts.items()},
+        }
+
+
+# ────────────────────── JSON repair ──────────────────────
+
+_FENCE_OPEN = re.compile(r"^\s*```[\w-]*\s*\n?")
+_FENCE_CLOSE = re.compile(r"\n?\s*```.*$", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def _extract_object(text: str) -> str:
+    """The first {...} object in text — up to its matching brace, or to the end if truncated."""
+    start = text.find("{")
+    if start < 0:
+        raise StructuredOutputError("json_decode", "no JSON object in the output")
+    depth, in_string, escape = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _close(text: str) -> str:
+    """Terminate an open string and close every open brace / bracket (truncated output)."""
+    stack: list[str] = []
+    in_string, escape = False, False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"  # cut off between a key and its value
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any:
+    """json.loads(), falling back to fence / prose stripping, trailing-comma removal and closing truncated output."""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+    candidate = _FENCE_OPEN.sub("", str(text or ""), count=1)
+    if "{" in candidate:
+        candidate = _extract_object(candidate)
+    else:
+        candidate = _FENCE_CLOSE.sub("", candidate)
+    candidate = _TRAILING_COMMA.sub(r"\1", candidate)
+    for attempt in (candidate, _close(candidate)):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            continue
+    raise StructuredOutputError("json_decode", f"unrepairable JSON: {str(text)[:120]!r}")
+
+
+def loads(text: str, operation: str) -> Any:
+    """repair_json() that counts a successful local repair under `operation`."""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        data = repair_json(text)
+    _record(operation, "json_decode", "repaired")
+    return data
+
+
+# ────────────────────── Schema repair ──────────────────────
+
+def _norm(value: str) -> str:
+    return re.sub(r"[\s_\-]+", "", value).lower()
+
+
+def canonical(value: Any, choices) -> Any:
+    """The choice `value` spells case- and separator-insensitively ("fraud report" → "Fraud_Report"), else value."""
+    if not isinstance(value, str):
+        return value
+    return {_norm(choice): choice for choice in choices}.get(_norm(value), value)
+
+
+def _unwrap(annotation):
+    """Optional[X] → X, list[X] → (list, X)."""
+    origin = typing.get_origin(annotation)
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if origin is list and args:
+        return list, args[0]
+    if args and origin is not None:
+        return None, args[0]
+    return None, annotation
+
+
+def coerce_enums(data: Any, schema: type[BaseModel]) -> Any:
+    """Map enum strings onto the schema's members ("payment_issue" → "Payment Issue"), recursively."""
+    if not isinstance(data, dict):
+        return data
+    out = dict(data)
+    for name, field in schema.model_fields.items():
+        if name not in out:
+            continue
+        container, inner = _unwrap(field.annotation)
+        values = out[name] if container is list and isinstance(out[name], list) else None
+        if isinstance(inner, type) and issubclass(inner, Enum):
+            fix = lambda v, enum=inner: canonical(v, [member.value for member in enum])
+        elif isinstance(inner, type) and issubclass(inner, BaseModel):
+            fix = lambda v, model=inner: coerce_enums(v, model)
+        else:
+            continue
+        out[name] = [fix(v) for v in values] if values is not None else fix(out[name])
+    return out
+
+
+def _unwrap_tool_call(data: Any) -> Any:
+    """{"name": ..., "arguments": {...}} (or "parameters") → the arguments."""
+    if isinstance(data, dict) and set(data) <= {"name", "arguments", "parameters", "type", "id"}:
+        inner = data.get("arguments", data.get("parameters"))
+        if isinstance(inner, str):
+            inner = repair_json(inner)
+        if isinstance(inner, dict):
+            return inner
+    return data
+
+
+def parse_model(payload: Any, schema: type[BaseModel]) -> BaseModel:
+    """A dict or JSON text → validated schema instance, repairing on the way."""
+    data = repair_json(payload) if isinstance(payload, str) else payload
+    data = coerce_enums(_unwrap_tool_call(data), schema)
+    try:
+        return schema.model_validate(data)
+    except ValidationError as exc:
+        raise StructuredOutputError("validation", str(exc).splitlines()[0]) from exc
+
+
+def failed_generation(exc: BaseException) -> tuple[str, str] | None:
+    """(error code, generation) for a Groq 400 tool_use_failed / json_validate_failed, else None."""
+    body = getattr(exc, "body", None)
+    error = body.get("error", body) if isinstance(body, dict) else None
+    if isinstance(error, dict) and error.get("code") in _REJECTION_CODES:
+        return error["code"], error.get("failed_generation") or ""
+    return None
+
+
+def _raw_payload(raw: Any) -> Any:
+    if isinstance(raw, str):
+        return raw or None
+    tool_calls = getattr(raw, "tool_calls", None) or []
+    if tool_calls:
+        return tool_calls[0].get("args")
+    invalid = getattr(raw, "invalid_tool_calls", None) or []
+    if invalid:
+        return invalid[0].get("args")
+    content = getattr(raw, "content", None)
+    return content if isinstance(content, str) and content.strip() else None
+
+
+def structured_output(output: Any, schema: type[BaseModel], operation: str) -> BaseModel:
+    """
+    Result of a with_structured_output(schema, include_raw=True) call (or
+    the {"raw": failed_generation} stand-in for a rejected one): the parsed
+    object, else a local repair of the raw tool call. Raises
+    StructuredOutputError when neither works.
+    """
+    if isinstance(output, schema):
+        return output
+    if output.get("parsed") is not None:
+        return output["parsed"]
+
+    raw = output.get("raw")
+    if output.get("rejected"):
+        error_class = output["rejected"]  # the Groq error code
+    elif getattr(raw, "tool_calls", None):
+        error_class = "validation"  # arguments parsed as JSON but failed the schema
+    else:
+        error_class = "json_decode"
+    payload = _raw_payload(raw)
+    if payload is None:
+        raise StructuredOutputError("missing_output", "the model returned no tool call or content")
+    try:
+        result = parse_model(payload, schema)
+    except StructuredOutputError as exc:
+        raise StructuredOutputError(error_class, str(exc)) from exc
+    _record(operation, error_class, "repaired")
+    return result
+
+
+def rejected_output(exc: BaseException) -> dict:
+    """Wrap a rejected generation for structured_output(); re-raises any other error."""
+    rejected = failed_generation(exc)
+    if rejected is None:
+        raise exc
+    code, text = rejected
+    return {"raw": text, "parsed": None, "rejected": code}
+
+
+# ────────────────────── Retries ──────────────────────
+
+def backoff(attempt: int) -> float:
+    """Full jitter: uniform(0, min(cap, base · 2^attempt)) seconds."""
+    return random.uniform(0, min(STRUCTURED_RETRY_MAX_SECONDS, STRUCTURED_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def with_retries(operation: str, fn: Callable[[], Any]) -> Any:
+    """Call fn(), retrying StructuredOutputError with jittered backoff."""
+    failed: StructuredOutputError | None = None
+    for attempt in range(STRUCTURED_RETRY_ATTEMPTS + 1):
+        try:
+            result = fn()
+        except StructuredOutputError as exc:
+            failed = exc
+            if attempt == STRUCTURED_RETRY_ATTEMPTS:
+                _record(operation, exc.error_class, "gave_up")
+                raise
+            _record(operation, exc.error_class, "retried")
+            time.sleep(backoff(attempt))
+            continue
+        if failed is not None:
+            _record(operation, failed.error_class, "recovered")
+        return result
+
+
+async def awith_retries(operation: str, fn: Callable[[], Any]) -> Any:
+    """Async version of with_retries() — fn() returns an awaitable."""
+    failed: StructuredOutputError | None = None
+    for attempt in range(STRUCTURED_RETRY_ATTEMPTS + 1):
+        try:
+            result = await fn()
+        except StructuredOutputError as exc:
+            failed = exc
+            if attempt == STRUCTURED_RETRY_ATTEMPTS:
+                _record(operation, exc.error_class, "gave_up")
+                raise
+            _record(operation, exc.error_class, "retried")
+            await asyncio.sleep(backoff(attempt))
+            continue
+        if failed is not None:
+            _record(operation, failed.error_class, "recovered")
+        return result
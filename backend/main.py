@@ -1,18 +1,48 @@
 from contextlib import asynccontextmanager
 from typing import Optional, List
-import os, re, smtplib, logging, asyncio
+import os, re, json, smtplib, logging, asyncio
+import time as _time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
-from database import engine, Base, get_db
+from database import engine, Base, get_db, SessionLocal
 from models import Ticket, TicketStatus, TicketPriority, TicketCategory
-from schemas import AnalyzeRequest, TicketAnalysis, ProcessTicketResponse
-from agent import analyze_ticket, generate_draft_response, analyze_and_draft
-from urgency_classifier import classify_urgency, get_parent_category
+from schemas import (
+    AnalyzeRequest, TicketAnalysis, ProcessTicketResponse,
+    BatchAnalyzeRequest, TicketAnalysisWithDraft,
+    ProcessTicketsRequest, ProcessTicketsItem, ProcessTicketsResponse,
+)
+from agent import (
+    analyze_ticket, generate_draft_response, analyze_and_draft,
+    aanalyze_ticket, aanalyze_and_draft, MODEL_NAME as AGENT_MODEL,
+    analyze_and_draft_batch, aanalyze_and_draft_batch, BATCH_MAX_EMAILS,
+    analyze_ticket_batch, aanalyze_ticket_batch, write_draft, awrite_draft, astream_draft,
+    model_used, routing_stats, chunking_stats, degraded_analysis, DEGRADED_MODEL,
+)
+from urgency_classifier import (
+    classify_urgency, aclassify_urgency, get_parent_category, classifier_stats,
+    request_tokens as classifier_request_tokens, MODEL as CLASSIFIER_MODEL,
+)
+from resolution_policy import policy
+from urgency_model import get_model as load_urgency_model
+from result_cache import cache_stats
+from persistent_cache import llm_store
+from single_flight import single_flight_stats
+from rate_limiter import limiter, RateLimitExceeded
+from preprocess import html_to_text, preprocess_stats
+from circuit_breaker import groq_breaker, CircuitOpenError, is_outage
+from hedging import hedger
+from json_repair import StructuredOutputError, repair_stats
+import usage
+import metrics
+import timing
+from timing import stage, timed_call, in_scope
 
 load_dotenv()
 
@@ -71,7 +101,7 @@ def send_reply_email(to_email: str, subject: str, body: str) -> bool:
         )
         msg.attach(MIMEText(html, "html"))
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+        with stage("smtp_send"), smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
             server.ehlo()
             server.starttls()
             server.ehlo()
@@ -79,9 +109,11 @@ def send_reply_email(to_email: str, subject: str, body: str) -> bool:
             server.sendmail(EMAIL_USER, to_email, msg.as_string())
 
         logger.info(f"✅ Reply sent to {to_email}")
+        metrics.SMTP_SENDS.inc(result="sent")
         return True
     except Exception as e:
         logger.error(f"❌ Failed to send email to {to_email}: {e}")
+        metrics.SMTP_SENDS.inc(result="failed")
         return False
 
 
@@ -118,8 +150,28 @@ async def lifespan(app: FastAPI):
             ))
             print("  ✅ Added is_ai_draft_edited column to tickets table.")
 
+        # 4. Add model_used column if missing
+        if "model_used" not in columns:
+            conn.execute(text(
+                "ALTER TABLE tickets ADD COLUMN model_used VARCHAR(100)"
+            ))
+            print("  ✅ Added model_used column to tickets table.")
+
+        # 5. Add needs_reanalysis column if missing
+        if "needs_reanalysis" not in columns:
+            conn.execute(text(
+                "ALTER TABLE tickets ADD COLUMN needs_reanalysis BOOLEAN NOT NULL DEFAULT FALSE"
+            ))
+            print("  ✅ Added needs_reanalysis column to tickets table.")
+
     print("✅ Database tables are ready.")
 
+    # Load the local urgency model (if one is trained) before the first email
+    await asyncio.to_thread(load_urgency_model)
+
+    # Background writer for the llm_usage table
+    usage.start()
+
     # ── Background email polling (Railway keeps the process alive) ──
     EMAIL_POLL_INTERVAL = int(os.getenv("EMAIL_POLL_INTERVAL", "300"))  # seconds (5 min)
     ENABLE_EMAIL_POLLING = os.getenv("ENABLE_EMAIL_POLLING", "true").lower() == "true"
@@ -149,6 +201,20 @@ async def lifespan(app: FastAPI):
                 logger.warning(f"📧 Background poller error (will retry): {e}")
             await asyncio.sleep(EMAIL_POLL_INTERVAL)
 
+    async def _background_reenricher():
+        """Re-analyse degraded-mode tickets whenever the Groq circuit is not open."""
+        logger.info(f"🔁 Degraded-ticket re-enrichment started (interval={REENRICH_INTERVAL_SECONDS:.0f}s)")
+        while True:
+            await asyncio.sleep(REENRICH_INTERVAL_SECONDS)
+            try:
+                summary = await _reenrich_flagged()
+                if summary["reenriched"]:
+                    logger.info(f"🔁 Re-enriched {summary['reenriched']} degraded ticket(s)")
+            except Exception as e:
+                logger.warning(f"🔁 Re-enrichment error (will retry): {e}")
+
+    reenrich_task = asyncio.create_task(_background_reenricher()) if REENRICH_ENABLED else None
+
     poll_task = None
     if ENABLE_EMAIL_POLLING:
         poll_task = asyncio.create_task(_background_email_poller())
@@ -158,13 +224,17 @@ async def lifespan(app: FastAPI):
 
     yield
 
-    # Cleanup: cancel background task on shutdown
-    if poll_task:
-        poll_task.cancel()
-        try:
-            await poll_task
-        except asyncio.CancelledError:
-            pass
+    # Cleanup: cancel background tasks on shutdown
+    for task in (poll_task, reenrich_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # Write any usage rows still buffered
+    await asyncio.to_thread(usage.stop)
 
 
 app = FastAPI(
@@ -181,14 +251,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """
+    Report per-stage durations (timing.stage) in a Server-Timing header and
+    record them, with the request latency, in the /metrics histograms.
+    """
+    stages = timing.begin()
+    t0 = _time.perf_counter()
+    response = await call_next(request)
+    total_ms = (_time.perf_counter() - t0) * 1000
+    response.headers["Server-Timing"] = timing.server_timing_header(stages, total_ms)
+
+    # Route template, not the raw path — keeps ticket IDs out of the labels
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        total_ms / 1000, method=request.method, route=route, status=str(response.status_code),
+    )
+    for name, ms in stages.items():
+        metrics.STAGE_SECONDS.observe(ms / 1000, route=route, stage=name)
+    return response
+
+
 @app.get("/")
 def root():
     return {"message": "Finance Agent is Running"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Request, pipeline-stage and LLM metrics in Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # =====================================================================
 #  ENTERPRISE DASHBOARD METRICS
 # =====================================================================
@@ -234,6 +333,9 @@ def calculate_dashboard_metrics(db: Session) -> dict:
 
     all_tickets = db.query(Ticket).order_by(Ticket.created_at.desc()).all()
     now = _dt.now(_tz.utc)
+    # SQLite (local runs, benchmark.py) hands back naive UTC timestamps
+    if all_tickets and all_tickets[0].created_at and all_tickets[0].created_at.tzinfo is None:
+        now = now.replace(tzinfo=None)
 
     _OPEN = {TicketStatus.OPEN, TicketStatus.NEW, TicketStatus.IN_PROGRESS}
     _CLOSED = {TicketStatus.RESOLVED, TicketStatus.CLOSED}
@@ -353,13 +455,118 @@ def calculate_dashboard_metrics(db: Session) -> dict:
 def dashboard_metrics(db: Session = Depends(get_db)):
     """Enterprise-grade dashboard metrics for the Finance Triage analytics page."""
     try:
-        return calculate_dashboard_metrics(db)
+        with stage("db_query"):
+            return calculate_dashboard_metrics(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Metrics calculation failed: {str(e)}")
 
 
+# =====================================================================
+#  ADMIN / OPERATIONS
+# =====================================================================
+
+@app.get("/admin/cache_stats")
+def admin_cache_stats():
+    """Size, limits and hit / miss / eviction counters of the LLM result caches."""
+    return {
+        "memory": cache_stats(),
+        "persistent": llm_store.stats(),
+        "single_flight": single_flight_stats(),
+    }
+
+
+@app.get("/admin/rate_limits")
+def admin_rate_limits():
+    """
+    Per-model Groq budgets, remaining capacity and current queue wait, plus
+    the live quota reported by Groq's x-ratelimit-* response headers.
+    """
+    return limiter.stats()
+
+
+@app.get("/admin/classifier_stats")
+def admin_classifier_stats():
+    """
+    Which urgency-classifier tier (rules / local model / LLM) answered how
+    many emails, and how often the resolution policy skipped the second
+    pass or saw it change the verdict.
+    """
+    return {**classifier_stats(), "resolution": policy.stats()}
+
+
+@app.get("/usage")
+async def llm_usage(
+    hours: int = Query(24, ge=1, le=24 * 90, description="Look-back window in hours"),
+    model: Optional[str] = Query(None, description="Only this model"),
+    db: Session = Depends(get_db),
+):
+    """
+    LLM token usage per model and per hour — calls, cache hits, failures,
+    input/output tokens and average latency / rate-limiter queue time —
+    for capacity planning against the Groq quotas in /admin/rate_limits.
+    """
+    await asyncio.to_thread(usage.flush)  # include calls still in the buffer
+    with stage("db_query"):
+        return await asyncio.to_thread(usage.usage_report, db, hours, model)
+
+
+@app.get("/admin/preprocess_stats")
+def admin_preprocess_stats():
+    """
+    How much quoted history, signature and boilerplate the preprocessing
+    stage trimmed from prompts, in estimated input tokens, and how many
+    long emails went through the chunked map-reduce path.
+    """
+    return {**preprocess_stats(), "chunking": chunking_stats()}
+
+
+@app.get("/admin/routing_stats")
+def admin_routing_stats():
+    """
+    How many emails the model router sent to each model tier, and how
+    often slow calls were hedged with a duplicate request (and which won).
+    """
+    return {**routing_stats(), "hedging": hedger.stats()}
+
+
+@app.get("/admin/repair_stats")
+def admin_repair_stats():
+    """
+    Malformed structured LLM output per error class (json_decode,
+    validation, tool_use_failed, json_validate_failed, missing_output):
+    repaired locally, retried, recovered by a retry, or given up on.
+    """
+    return repair_stats()
+
+
+@app.get("/admin/circuit_breaker")
+def admin_circuit_breaker(db: Session = Depends(get_db)):
+    """
+    State of the Groq circuit breaker and how many degraded-mode tickets
+    are still waiting for AI re-analysis.
+    """
+    with stage("db_query"):
+        pending = db.query(Ticket).filter(Ticket.needs_reanalysis.is_(True)).count()
+    return {
+        **groq_breaker.stats(),
+        "degraded_mode_enabled": DEGRADED_MODE_ENABLED,
+        "needs_reanalysis": pending,
+        "reenrich": {
+            "enabled": REENRICH_ENABLED,
+            "interval_seconds": REENRICH_INTERVAL_SECONDS,
+            "batch_size": REENRICH_BATCH_SIZE,
+        },
+    }
+
+
+@app.post("/admin/reenrich")
+async def admin_reenrich():
+    """Run one re-enrichment pass now instead of waiting for the background task."""
+    return await _reenrich_flagged()
+
+
 @app.post("/classify_urgency")
-def classify_urgency_endpoint(request: AnalyzeRequest):
+async def classify_urgency_endpoint(request: AnalyzeRequest):
     """
     Advanced multi-tier urgency classification (3 tiers × 12 sub-categories).
 
@@ -367,7 +574,7 @@ def classify_urgency_endpoint(request: AnalyzeRequest):
     Targets < 500 ms latency. Falls back to Medium on errors.
     """
     try:
-        result = classify_urgency(request.email_body)
+        result = await aclassify_urgency(request.email_body)
         return result
     except Exception as e:
         raise HTTPException(
@@ -377,7 +584,7 @@ def classify_urgency_endpoint(request: AnalyzeRequest):
 
 
 @app.post("/analyze", response_model=TicketAnalysis)
-def analyze_email(request: AnalyzeRequest):
+async def analyze_email(request: AnalyzeRequest):
     """
     Analyse a customer support email and return structured triage data.
 
@@ -385,10 +592,12 @@ def analyze_email(request: AnalyzeRequest):
     extracted entities, priority, category, and a summary.
     """
     try:
-        result = analyze_ticket(request.email_body)
+        result = await aanalyze_ticket(request.email_body)
         return result
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -396,6 +605,28 @@ def analyze_email(request: AnalyzeRequest):
         )
 
 
+@app.post("/analyze_batch", response_model=List[TicketAnalysisWithDraft])
+async def analyze_batch(request: BatchAnalyzeRequest):
+    """
+    Analyse + draft several emails with as few LLM calls as possible.
+
+    Short emails are analysed several at a time in one structured call
+    (one copy of the system prompt per batch); long or malformed items are
+    retried on their own. Results are returned in request order.
+    """
+    try:
+        return await aanalyze_and_draft_batch(request.emails)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch analysis failed: {str(e)}",
+        )
+
+
 # ---------- Map schema enums → ORM enums ----------
 
 _PRIORITY_MAP = {
@@ -411,23 +642,87 @@ _CATEGORY_MAP = {
 }
 
 
-def _resolve_priority(email_text: str, agent_priority: str, agent_category: str):
+# Each half of the two-pass pipeline gets its own deadline. The classifier
+# starts together with the agent call, so a slow classifier only delays the
+# merge by whatever is left of its budget once the agent has answered.
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "60"))
+CLASSIFIER_TIMEOUT_SECONDS = float(os.getenv("CLASSIFIER_TIMEOUT_SECONDS", "8"))
+
+# Worker threads for the classifier half of the sync (IMAP) pipeline
+_classifier_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="urgency")
+
+# While Groq is unavailable (circuit open, timeouts, 5xx) tickets are still
+# created with rule-based triage and a template draft, flagged
+# needs_reanalysis, and re-analysed by a background task once it recovers.
+DEGRADED_MODE_ENABLED = os.getenv("DEGRADED_MODE_ENABLED", "true").lower() == "true"
+REENRICH_ENABLED = os.getenv("REENRICH_ENABLED", "true").lower() == "true"
+REENRICH_INTERVAL_SECONDS = float(os.getenv("REENRICH_INTERVAL_SECONDS", "60"))
+REENRICH_BATCH_SIZE = int(os.getenv("REENRICH_BATCH_SIZE", "10"))
+
+# DRAFT_MODE=lazy: ingestion runs only the analysis call; the reply is
+# drafted the first time a ticket is opened (GET /tickets/{id}) or, for the
+# priorities in DRAFT_PREFETCH_PRIORITIES, in the background right after the
+# ticket is saved. Tickets closed without a reply never pay for one.
+DRAFT_MODE = os.getenv("DRAFT_MODE", "eager").strip().lower()
+DRAFT_PREFETCH_PRIORITIES = {
+    p.strip() for p in os.getenv("DRAFT_PREFETCH_PRIORITIES", "High").split(",") if p.strip()
+}
+
+if DRAFT_MODE not in ("eager", "lazy"):
+    raise ValueError("DRAFT_MODE must be 'eager' or 'lazy'.")
+
+# Worker threads for prefetched drafts
+_draft_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="draft")
+
+
+def _degraded_or_raise(email_text: str, exc: BaseException):
+    """
+    Degraded analysis when exc means Groq is unavailable or its output could
+    not be repaired after retries; any other error (bad input, quota) is
+    re-raised.
+    """
+    if not DEGRADED_MODE_ENABLED or not (
+        isinstance(exc, (CircuitOpenError, StructuredOutputError)) or is_outage(exc)
+    ):
+        raise exc
+    metrics.DEGRADED_ANALYSES.inc()
+    return degraded_analysis(email_text)
+
+
+def _with_degraded(texts: list[str], analyses: list) -> list:
+    """Replace outage failures in a batch result with degraded analyses."""
+    out = []
+    for text, analysis in zip(texts, analyses):
+        if isinstance(analysis, Exception):
+            try:
+                analysis = _degraded_or_raise(text, analysis)
+            except Exception:
+                pass
+        out.append(analysis)
+    return out
+
+
+def _is_degraded(analysis) -> bool:
+    return model_used(analysis) == DEGRADED_MODEL
+
+
+def _resolve_priority(agent_priority: str, agent_category: str, clf: dict | None):
     """
     Two-pass priority resolution:
       1. Agent (llama-3.3-70b) provides initial priority + category.
       2. Urgency classifier (llama-3.1-8b, 12 sub-categories) runs as a
-         fast second opinion.
+         fast second opinion when resolution_policy says it can still change
+         the outcome; its result is merged here.
 
     Rules:
+      • If the classifier failed, timed out or was skipped by the resolution
+        policy (clf is None) → keep the agent's verdict.
       • If the classifier returns a HIGHER urgency than the agent → promote.
       • If the classifier has confidence >= 0.75 → trust it outright.
       • Otherwise keep the agent's original priority.
       • Also return the classifier's subcategory + SLA for metadata.
     """
-    try:
-        clf = classify_urgency(email_text)
-    except Exception:
-        # Classifier failed — fall back to agent's judgement
+    if clf is None:
         return agent_priority, agent_category, None
 
     clf_urgency = clf["urgency"]
@@ -458,6 +753,8 @@ def _resolve_priority(email_text: str, agent_priority: str, agent_category: str)
     elif final_priority == "High" and parent_cat == "Payment Issue" and agent_category == "General":
         final_category = "Payment Issue"
 
+    policy.record_outcome((agent_priority, agent_category), (final_priority, final_category))
+
     return final_priority, final_category, {
         "subcategory": clf_subcat,
         "sla": clf_sla,
@@ -466,24 +763,203 @@ def _resolve_priority(email_text: str, agent_priority: str, agent_category: str)
     }
 
 
+async def _aclassify_or_none(email_text: str):
+    """Urgency classifier with its deadline; failures and timeouts → None."""
+    try:
+        with stage("classifier"):
+            return await asyncio.wait_for(aclassify_urgency(email_text), CLASSIFIER_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Urgency classifier exceeded {CLASSIFIER_TIMEOUT_SECONDS}s — keeping agent priority")
+    except Exception:
+        pass
+    return None
+
+
+def _second_pass_needed(analysis, email_text: str, started: bool = False) -> bool:
+    """Ask the resolution policy whether the classifier can still change this verdict."""
+    if _is_degraded(analysis):
+        return False  # the classifier needs Groq too — the verdict is redone on re-analysis
+    return policy.should_run(
+        analysis.priority.value, analysis.category.value, CLASSIFIER_MODEL,
+        tokens=0 if started else classifier_request_tokens(email_text), started=started,
+    )
+
+
+async def _aanalyse_with_classifier(email_text: str):
+    """
+    Run the agent call and — when the resolution policy says it can still
+    change the outcome — the urgency classifier.
+
+    Returns (TicketAnalysisWithDraft — TicketAnalysis with DRAFT_MODE=lazy —,
+    classifier result or None). When Groq is unavailable (circuit open, timeout, 5xx) the analysis comes from
+    degraded mode; other agent errors propagate. Classifier errors, timeouts
+    and skipped second passes give None so the agent's priority is kept.
+    In "concurrent" dispatch the classifier starts alongside the agent and
+    is cancelled if it turns out not to be needed.
+    """
+    clf_task = asyncio.create_task(_aclassify_or_none(email_text)) if policy.concurrent else None
+    try:
+        with stage("llm_analysis"):
+            analyse = aanalyze_ticket if DRAFT_MODE == "lazy" else aanalyze_and_draft
+            result = await asyncio.wait_for(analyse(email_text), ANALYSIS_TIMEOUT_SECONDS)
+    except Exception as exc:
+        if clf_task:
+            clf_task.cancel()
+        if isinstance(exc, asyncio.TimeoutError):
+            groq_breaker.record_failure()  # the cancelled call itself can't report it
+        return _degraded_or_raise(email_text, exc), None
+    except BaseException:
+        if clf_task:
+            clf_task.cancel()
+        raise
+
+    if not _second_pass_needed(result, email_text, started=clf_task is not None):
+        if clf_task:
+            clf_task.cancel()
+        return result, None
+    clf = await (clf_task or _aclassify_or_none(email_text))
+    return result, clf
+
+
+async def _aanalyse_batch_with_classifier(texts: list[str]):
+    """
+    Async batched counterpart of _aanalyse_with_classifier().
+
+    Returns [(analysis or Exception, classifier result or None), ...] in
+    input order; per-email failures never raise. Outage failures are
+    replaced by degraded analyses.
+    """
+    early = (
+        {i: asyncio.create_task(_aclassify_or_none(text)) for i, text in enumerate(texts)}
+        if policy.concurrent else {}
+    )
+    try:
+        with stage("llm_analysis"):
+            analyse = aanalyze_ticket_batch if DRAFT_MODE == "lazy" else aanalyze_and_draft_batch
+            analyses = await asyncio.wait_for(analyse(texts, return_exceptions=True), ANALYSIS_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        groq_breaker.record_failure()
+        analyses = [TimeoutError(f"Analysis timed out after {ANALYSIS_TIMEOUT_SECONDS:.0f}s")] * len(texts)
+    except BaseException:
+        for task in early.values():
+            task.cancel()
+        raise
+    analyses = _with_degraded(texts, analyses)
+
+    needed = {}
+    for i, (text, analysis) in enumerate(zip(texts, analyses)):
+        task = early.pop(i, None)
+        if isinstance(analysis, Exception) or not _second_pass_needed(analysis, text, started=task is not None):
+            if task:
+                task.cancel()
+            continue
+        needed[i] = task or asyncio.create_task(_aclassify_or_none(text))
+    clfs = dict(zip(needed, await asyncio.gather(*needed.values())))
+    return [(analysis, clfs.get(i)) for i, analysis in enumerate(analyses)]
+
+
+def _is_quota_error(exc: Exception) -> bool:
+    """True for Groq quota / rate-limit failures (ours or the API's)."""
+    err_str = str(exc).lower()
+    return (
+        isinstance(exc, RateLimitExceeded)
+        or "429" in err_str or "rate_limit" in err_str or "quota" in err_str
+    )
+
+
+def _analyse_batch_with_classifier(texts: list[str]):
+    """
+    Batched counterpart of _aanalyse_with_classifier() for the IMAP loop.
+
+    Analyses all emails through analyze_and_draft_batch() (analyze_ticket_batch()
+    with DRAFT_MODE=lazy), runs the
+    classifier on the worker pool for the emails the resolution policy
+    still needs a second opinion on (started up front in "concurrent"
+    dispatch), then collects each result within its deadline. Returns
+    [(analysis or Exception, classifier result or None), ...] in input order;
+    outage failures are replaced by degraded analyses.
+    """
+    if not texts:
+        return []
+
+    def _submit(text: str):
+        future = _classifier_pool.submit(in_scope(timed_call, "classifier", classify_urgency, text))
+        return future, _time.monotonic()
+
+    early = {i: _submit(text) for i, text in enumerate(texts)} if policy.concurrent else {}
+
+    analyse = analyze_ticket_batch if DRAFT_MODE == "lazy" else analyze_and_draft_batch
+    with stage("llm_analysis"):
+        analyses = _with_degraded(texts, analyse(texts, return_exceptions=True))
+
+    needed = {}
+    for i, (text, analysis) in enumerate(zip(texts, analyses)):
+        submitted = early.pop(i, None)
+        if isinstance(analysis, Exception) or not _second_pass_needed(analysis, text, started=submitted is not None):
+            if submitted:
+                submitted[0].cancel()  # only stops it if it hasn't started yet
+            continue
+        needed[i] = submitted or _submit(text)
+
+    outcomes = []
+    for i, analysis in enumerate(analyses):
+        clf = None
+        if i in needed:
+            future, submitted_at = needed[i]
+            remaining = CLASSIFIER_TIMEOUT_SECONDS - (_time.monotonic() - submitted_at)
+            try:
+                clf = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                logger.warning(f"Urgency classifier exceeded {CLASSIFIER_TIMEOUT_SECONDS}s — keeping agent priority")
+            except Exception:
+                pass
+        outcomes.append((analysis, clf))
+    return outcomes
+
+
+def _save_ticket(db: Session, ticket: Ticket) -> Ticket:
+    """Insert a ticket and commit (blocking — run off the event loop from async endpoints)."""
+    try:
+        with stage("db_commit"):
+            db.add(ticket)
+            db.commit()
+            db.refresh(ticket)
+    except Exception:
+        db.rollback()
+        raise
+    return ticket
+
+
 @app.post("/process_ticket", response_model=ProcessTicketResponse)
-def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
+async def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
     """
     End-to-end ticket processing pipeline:
 
     1. **Analyse** — Run AI analysis on the email (sentiment, intent, entities,
        priority, category, summary).
-    2. **Draft** — Generate a personalised email reply based on the analysis.
+    2. **Draft** — Generate a personalised email reply based on the analysis
+       (DRAFT_MODE=lazy: deferred until the ticket is opened, or prefetched
+       in the background for DRAFT_PREFETCH_PRIORITIES).
     3. **Save** — Persist the ticket with all data to the PostgreSQL database.
     4. **Return** — Send back the ticket ID, full analysis, and draft response.
     """
-    # ---- Step 1 + 2: Analyse the email AND generate draft (single LLM call) ----
+    # Stored trimmed, like /process_tickets, so the duplicate check there matches
+    email_text = request.email_body.strip()
+
+    # ---- Step 1 + 2: Analyse + draft (single LLM call), classifier alongside ----
     try:
-        result = analyze_and_draft(request.email_body)
+        result, clf = await _aanalyse_with_classifier(email_text)
         analysis = result   # TicketAnalysisWithDraft extends TicketAnalysis
-        draft = result.draft_response
+        draft = getattr(result, "draft_response", None)  # None with DRAFT_MODE=lazy
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Analysis timed out after {ANALYSIS_TIMEOUT_SECONDS:.0f}s",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -492,14 +968,14 @@ def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
 
     # ---- Step 3: Priority override via urgency classifier ----
     final_pri, final_cat, clf_meta = _resolve_priority(
-        request.email_body, analysis.priority.value, analysis.category.value,
+        analysis.priority.value, analysis.category.value, clf,
     )
 
     # ---- Step 4: Save to database ----
     try:
         ticket = Ticket(
             customer_name=analysis.entities.customer_name or "Unknown",
-            email_body=request.email_body,
+            email_body=email_text,
             status="New",
             priority=_PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM),
             category=_CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL),
@@ -509,12 +985,13 @@ def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
             transaction_id=analysis.entities.transaction_id,
             amount=analysis.entities.amount,
             draft_response=draft,
+            model_used=model_used(analysis),
+            needs_reanalysis=_is_degraded(analysis),
         )
-        db.add(ticket)
-        db.commit()
-        db.refresh(ticket)
+        ticket = await asyncio.to_thread(_save_ticket, db, ticket)
+        metrics.TICKETS_CREATED.inc(source="process_ticket", priority=final_pri, category=final_cat)
+        _prefetch_drafts([ticket])
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Database save failed: {str(e)}",
@@ -525,10 +1002,228 @@ def process_ticket(request: AnalyzeRequest, db: Session = Depends(get_db)):
         ticket_id=str(ticket.id),
         analysis=analysis,
         draft_response=draft,
-        message="Ticket processed and saved successfully.",
+        message=(
+            "AI analysis unavailable — ticket saved with rule-based triage and queued for re-analysis."
+            if ticket.needs_reanalysis else "Ticket processed and saved successfully."
+        ),
     )
 
 
+# Emails analysed at once per /process_tickets request (each group is one
+# batched agent call + its classifier calls).
+PROCESS_TICKETS_CONCURRENCY = int(os.getenv("PROCESS_TICKETS_CONCURRENCY", "4"))
+
+
+def _existing_ticket_ids(db: Session, texts: list[str]) -> dict[str, str]:
+    """email_body → ticket id for bodies that already have a ticket (one query)."""
+    if not texts:
+        return {}
+    with stage("dedup_query"):
+        rows = db.query(Ticket.email_body, Ticket.id).filter(Ticket.email_body.in_(texts)).all()
+    return {body: str(tid) for body, tid in rows}
+
+
+def _save_tickets(db: Session, tickets: list[Ticket]) -> list[Ticket]:
+    """Insert several tickets in ONE transaction (all or nothing)."""
+    try:
+        with stage("db_commit"):
+            db.add_all(tickets)
+            db.commit()
+            for ticket in tickets:
+                db.refresh(ticket)
+    except Exception:
+        db.rollback()
+        raise
+    return tickets
+
+
+@app.post("/process_tickets", response_model=ProcessTicketsResponse)
+async def process_tickets(request: ProcessTicketsRequest, db: Session = Depends(get_db)):
+    """
+    Batch version of /process_ticket.
+
+    1. **Dedup** — skip emails that repeat within the request or already
+       have a ticket (one DB query for the whole batch).
+    2. **Analyse** — batched analysis + draft with the urgency classifier
+       alongside, PROCESS_TICKETS_CONCURRENCY groups at a time.
+    3. **Save** — insert every new ticket in a single transaction.
+    4. **Return** — one result per email, including per-email errors.
+    """
+    items: list[ProcessTicketsItem | None] = [None] * len(request.emails)
+
+    # ---- Step 1: validation + dedup ----
+    texts = [(body or "").strip() for body in request.emails]
+    existing = await asyncio.to_thread(_existing_ticket_ids, db, [t for t in texts if t])
+    first_seen: dict[str, int] = {}
+    todo: list[int] = []
+    for i, text in enumerate(texts):
+        if len(text) < 10:
+            items[i] = ProcessTicketsItem(index=i, status="error", error="Email body must be at least 10 characters.")
+        elif text in existing:
+            items[i] = ProcessTicketsItem(index=i, status="duplicate", ticket_id=existing[text])
+        elif text in first_seen:
+            items[i] = ProcessTicketsItem(
+                index=i, status="duplicate", error=f"Same email as index {first_seen[text]}.",
+            )
+        else:
+            first_seen[text] = i
+            todo.append(i)
+
+    # ---- Step 2: analysis + classification, bounded concurrency ----
+    group_size = max(BATCH_MAX_EMAILS, 1)
+    groups = [todo[start:start + group_size] for start in range(0, len(todo), group_size)]
+    semaphore = asyncio.Semaphore(max(PROCESS_TICKETS_CONCURRENCY, 1))
+    outcomes: dict[int, tuple] = {}
+
+    async def _run_group(group: list[int]) -> None:
+        async with semaphore:
+            results = await _aanalyse_batch_with_classifier([texts[i] for i in group])
+        outcomes.update(zip(group, results))
+
+    await asyncio.gather(*(_run_group(group) for group in groups))
+
+    # ---- Step 3: build tickets, save in one transaction ----
+    new_tickets: list[tuple[int, Ticket, str, str]] = []
+    for i in todo:
+        analysis, clf = outcomes[i]
+        if isinstance(analysis, Exception):
+            items[i] = ProcessTicketsItem(
+                index=i, status="error", error=f"Analysis failed: {analysis or type(analysis).__name__}",
+            )
+            continue
+        final_pri, final_cat, _ = _resolve_priority(
+            analysis.priority.value, analysis.category.value, clf,
+        )
+        ticket = Ticket(
+            customer_name=analysis.entities.customer_name or "Unknown",
+            email_body=texts[i],
+            status="New",
+            priority=_PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM),
+            category=_CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL),
+            sentiment=analysis.sentiment.value,
+            intent=analysis.intent,
+            summary=analysis.summary,
+            transaction_id=analysis.entities.transaction_id,
+            amount=analysis.entities.amount,
+            draft_response=getattr(analysis, "draft_response", None),
+            model_used=model_used(analysis),
+            needs_reanalysis=_is_degraded(analysis),
+        )
+        new_tickets.append((i, ticket, final_pri, final_cat))
+
+    if new_tickets:
+        try:
+            await asyncio.to_thread(_save_tickets, db, [t for _, t, _, _ in new_tickets])
+        except Exception as e:
+            for i, _, _, _ in new_tickets:
+                items[i] = ProcessTicketsItem(index=i, status="error", error=f"Database save failed: {str(e)}")
+        else:
+            for i, ticket, final_pri, final_cat in new_tickets:
+                metrics.TICKETS_CREATED.inc(source="process_tickets", priority=final_pri, category=final_cat)
+                items[i] = ProcessTicketsItem(
+                    index=i, status="created", ticket_id=str(ticket.id),
+                    priority=final_pri, category=final_cat,
+                )
+            _prefetch_drafts([t for _, t, _, _ in new_tickets])
+
+    # ---- Step 4: per-item results ----
+    created = sum(1 for it in items if it.status == "created")
+    duplicates = sum(1 for it in items if it.status == "duplicate")
+    errors = sum(1 for it in items if it.status == "error")
+    return ProcessTicketsResponse(
+        created=created,
+        duplicates=duplicates,
+        errors=errors,
+        results=items,
+        message=f"Created {created} ticket(s), skipped {duplicates} duplicate(s), {errors} error(s).",
+    )
+
+
+# ---------- Re-enrichment of degraded-mode tickets ----------
+
+def _flagged_tickets(db: Session, limit: int) -> list[Ticket]:
+    with stage("db_query"):
+        return (
+            db.query(Ticket)
+            .filter(Ticket.needs_reanalysis.is_(True))
+            .order_by(Ticket.created_at)
+            .limit(limit)
+            .all()
+        )
+
+
+def _save_reenriched(db: Session, drafts: dict) -> None:
+    """
+    Commit re-enriched tickets. The draft is replaced with a conditional
+    UPDATE, checked against the rows as they are now: an agent may have
+    edited the draft or moved the ticket on while the analysis ran.
+    """
+    try:
+        with stage("db_commit"):
+            for ticket_id, draft in drafts.items():
+                db.query(Ticket).filter(
+                    Ticket.id == ticket_id,
+                    Ticket.is_ai_draft_edited.is_(False),
+                    Ticket.status.in_([TicketStatus.NEW, TicketStatus.OPEN]),
+                ).update({Ticket.draft_response: draft}, synchronize_session=False)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+async def _reenrich_flagged(limit: int = REENRICH_BATCH_SIZE) -> dict:
+    """
+    Re-analyse up to `limit` tickets that were triaged in degraded mode.
+
+    Skipped while the circuit is open. Analysis fields, priority and
+    category are replaced; the draft only if an agent hasn't edited it and
+    the ticket is still New / Open (with DRAFT_MODE=lazy it is cleared, to
+    be written again on the next open). Tickets whose analysis degrades again
+    stay flagged for the next pass.
+    """
+    if groq_breaker.state == "open":
+        return {"reenriched": 0, "still_flagged": None, "skipped": "circuit open"}
+
+    db = SessionLocal()
+    try:
+        tickets = await asyncio.to_thread(_flagged_tickets, db, limit)
+        if not tickets:
+            return {"reenriched": 0, "still_flagged": 0}
+
+        outcomes = await _aanalyse_batch_with_classifier([t.email_body for t in tickets])
+        done = 0
+        drafts = {}  # ticket id → new draft, written conditionally by _save_reenriched()
+        for ticket, (analysis, clf) in zip(tickets, outcomes):
+            if isinstance(analysis, Exception) or _is_degraded(analysis):
+                metrics.TICKETS_REENRICHED.inc(result="failed")
+                continue
+            final_pri, final_cat, _ = _resolve_priority(
+                analysis.priority.value, analysis.category.value, clf,
+            )
+            if analysis.entities.customer_name:
+                ticket.customer_name = analysis.entities.customer_name
+            ticket.priority = _PRIORITY_MAP.get(final_pri, TicketPriority.MEDIUM)
+            ticket.category = _CATEGORY_MAP.get(final_cat, TicketCategory.GENERAL)
+            ticket.sentiment = analysis.sentiment.value
+            ticket.intent = analysis.intent
+            ticket.summary = analysis.summary
+            ticket.transaction_id = analysis.entities.transaction_id
+            ticket.amount = analysis.entities.amount
+            drafts[ticket.id] = getattr(analysis, "draft_response", None)
+            ticket.model_used = model_used(analysis)
+            ticket.needs_reanalysis = False
+            done += 1
+            metrics.TICKETS_REENRICHED.inc(result="updated")
+
+        if done:
+            await asyncio.to_thread(_save_reenriched, db, drafts)
+            await asyncio.to_thread(_prefetch_drafts, [t for t in tickets if t.id in drafts])
+        return {"reenriched": done, "still_flagged": len(tickets) - done}
+    finally:
+        db.close()
+
+
 @app.post("/process_ticket_image")
 async def process_ticket_image():
     """OCR image processing is disabled in this deployment to reduce build size."""
@@ -559,10 +1254,126 @@ def _ticket_to_dict(ticket: Ticket) -> dict:
         "draft_response": ticket.draft_response,
         "is_read": ticket.is_read if ticket.is_read is not None else False,
         "is_ai_draft_edited": ticket.is_ai_draft_edited if ticket.is_ai_draft_edited is not None else False,
+        "model_used": ticket.model_used,
+        "needs_reanalysis": ticket.needs_reanalysis if ticket.needs_reanalysis is not None else False,
         "created_at": ticket.created_at.isoformat() if ticket.created_at else None,
     }
 
 
+def _needs_draft(ticket: Ticket) -> bool:
+    return ticket.draft_response is None and ticket.status in (
+        TicketStatus.NEW, TicketStatus.OPEN, TicketStatus.IN_PROGRESS,
+    )
+
+
+def _ticket_analysis(ticket: Ticket) -> TicketAnalysis:
+    """The stored triage of a ticket, as the agent's analysis object (input for a draft)."""
+    return TicketAnalysis(
+        sentiment=ticket.sentiment,
+        intent=ticket.intent or "",
+        entities={
+            "customer_name": ticket.customer_name if ticket.customer_name != "Unknown" else None,
+            "transaction_id": ticket.transaction_id,
+            "amount": ticket.amount,
+        },
+        priority=ticket.priority.value,
+        category=ticket.category.value,
+        summary=ticket.summary or "",
+    )
+
+
+def _can_regenerate(ticket: Ticket) -> bool:
+    return not ticket.is_ai_draft_edited and ticket.status in (TicketStatus.NEW, TicketStatus.OPEN)
+
+
+def _store_draft(db: Session, ticket: Ticket, draft: str, overwrite: bool = False) -> Ticket:
+    """
+    Persist a written draft — only into an empty draft_response, so a
+    concurrent open / prefetch wins. overwrite=True (regenerate) replaces
+    the draft instead, unless a human has edited it or the ticket moved on.
+    """
+    if overwrite:
+        condition = (
+            Ticket.is_ai_draft_edited.is_(False),
+            Ticket.status.in_([TicketStatus.NEW, TicketStatus.OPEN]),
+        )
+    else:
+        condition = (Ticket.draft_response.is_(None),)
+    try:
+        with stage("db_commit"):
+            db.query(Ticket).filter(Ticket.id == ticket.id, *condition).update(
+                {Ticket.draft_response: draft}, synchronize_session=False,
+            )
+            db.commit()
+            db.refresh(ticket)
+    except Exception:
+        db.rollback()
+        raise
+    return ticket
+
+
+def _ensure_draft(db: Session, ticket: Ticket, trigger: str) -> Ticket:
+    """
+    DRAFT_MODE=lazy: write and persist the reply for an open ticket that has
+    none yet. A failure (Groq down, quota, unusable output) is logged and
+    leaves the draft empty, so the next open tries again. A no-op in
+    eager mode.
+    """
+    if DRAFT_MODE != "lazy" or not _needs_draft(ticket):
+        return ticket
+    try:
+        with stage("llm_draft"):
+            draft = write_draft(ticket.email_body, _ticket_analysis(ticket))
+    except Exception as e:
+        metrics.LAZY_DRAFTS.inc(trigger=trigger, result="failed")
+        logger.warning(f"Lazy draft for ticket {ticket.id} failed (retried on next open): {e}")
+        return ticket
+    _store_draft(db, ticket, draft)
+    metrics.LAZY_DRAFTS.inc(trigger=trigger, result="written")
+    return ticket
+
+
+async def _aensure_draft(db: Session, ticket: Ticket, trigger: str) -> Ticket:
+    """Async version of _ensure_draft(), bounded by ANALYSIS_TIMEOUT_SECONDS."""
+    if DRAFT_MODE != "lazy" or not _needs_draft(ticket):
+        return ticket
+    try:
+        with stage("llm_draft"):
+            draft = await asyncio.wait_for(
+                awrite_draft(ticket.email_body, _ticket_analysis(ticket)), ANALYSIS_TIMEOUT_SECONDS,
+            )
+    except Exception as e:
+        if isinstance(e, asyncio.TimeoutError):
+            groq_breaker.record_failure()  # the cancelled call itself can't report it
+        metrics.LAZY_DRAFTS.inc(trigger=trigger, result="failed")
+        logger.warning(f"Lazy draft for ticket {ticket.id} failed (retried on next open): {e!r}")
+        return ticket
+    await asyncio.to_thread(_store_draft, db, ticket, draft)
+    metrics.LAZY_DRAFTS.inc(trigger=trigger, result="written")
+    return ticket
+
+
+def _prefetch_draft(ticket_id) -> None:
+    db = SessionLocal()
+    try:
+        ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+        if ticket is not None:
+            _ensure_draft(db, ticket, "prefetch")
+    except Exception as e:
+        logger.warning(f"Draft prefetch for ticket {ticket_id} failed: {e}")
+    finally:
+        db.close()
+
+
+def _prefetch_drafts(tickets: list[Ticket]) -> None:
+    """DRAFT_MODE=lazy: draft DRAFT_PREFETCH_PRIORITIES tickets in the background, before anyone opens them."""
+    if DRAFT_MODE != "lazy":
+        return
+    for ticket in tickets:
+        if ticket.draft_response is None and ticket.priority and ticket.priority.value in DRAFT_PREFETCH_PRIORITIES:
+            _draft_pool.submit(_prefetch_draft, ticket.id)
+
+
 @app.get("/tickets")
 def list_tickets(
     status: Optional[str] = Query(None, description="Filter by status: Open, New, In Progress, Resolved, Closed"),
@@ -597,17 +1408,84 @@ def list_tickets(
                     detail=f"Invalid status '{status}'. Must be one of: Open, New, In Progress, Resolved, Closed",
                 )
 
-    tickets = query.all()
+    with stage("db_query"):
+        tickets = query.all()
     return [_ticket_to_dict(t) for t in tickets]
 
 
 @app.get("/tickets/{ticket_id}")
-def get_ticket(ticket_id: str, db: Session = Depends(get_db)):
-    """Get a single ticket by ID."""
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+async def get_ticket(ticket_id: str, db: Session = Depends(get_db)):
+    """Get a single ticket by ID (DRAFT_MODE=lazy: drafting its reply on first open)."""
+    ticket = await asyncio.to_thread(lambda: db.query(Ticket).filter(Ticket.id == ticket_id).first())
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    return _ticket_to_dict(ticket)
+    return _ticket_to_dict(await _aensure_draft(db, ticket, "open"))
+
+
+def _save_streamed_draft(ticket_id, draft: str, overwrite: bool) -> str | None:
+    """_store_draft() on a session of its own — the request's may be closed once the stream ends."""
+    db = SessionLocal()
+    try:
+        ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+        return _store_draft(db, ticket, draft, overwrite).draft_response if ticket else None
+    finally:
+        db.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/tickets/{ticket_id}/draft/stream")
+async def stream_ticket_draft(
+    ticket_id: str,
+    regenerate: bool = Query(False, description="Write a fresh draft, replacing the current one"),
+    db: Session = Depends(get_db),
+):
+    """
+    Stream a ticket's draft reply as Server-Sent Events while the model
+    writes it, then save it to draft_response.
+
+    Events: `token` ({"text": ...}) for each piece as it arrives, then
+    `done` ({"draft": full text, "cached": bool}), or `error`
+    ({"detail": ...}) — the draft then stays empty for the next open. A
+    ticket that already has a draft (or is closed) gets it as one token.
+
+    regenerate=true bypasses the draft cache and overwrites the current
+    draft — unless a human has edited it or the ticket is no longer
+    New/Open, in which case the stored draft is replayed as above.
+    """
+    ticket = await asyncio.to_thread(lambda: db.query(Ticket).filter(Ticket.id == ticket_id).first())
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    regenerate = regenerate and _can_regenerate(ticket)
+    trigger = "regenerate" if regenerate else "stream"
+
+    async def _events():
+        if not regenerate and not _needs_draft(ticket):
+            if ticket.draft_response:
+                yield _sse("token", {"text": ticket.draft_response})
+            yield _sse("done", {"draft": ticket.draft_response, "cached": True})
+            return
+        parts = []
+        try:
+            async for piece in astream_draft(ticket.email_body, _ticket_analysis(ticket), use_cache=not regenerate):
+                parts.append(piece)
+                yield _sse("token", {"text": piece})
+            stored = await asyncio.to_thread(_save_streamed_draft, ticket.id, "".join(parts).strip(), regenerate)
+        except Exception as e:
+            metrics.LAZY_DRAFTS.inc(trigger=trigger, result="failed")
+            logger.warning(f"Streamed draft for ticket {ticket_id} failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+            return
+        metrics.LAZY_DRAFTS.inc(trigger=trigger, result="written")
+        # A concurrent writer may have filled the draft first — report what was stored
+        yield _sse("done", {"draft": stored, "cached": False})
+
+    return StreamingResponse(
+        _events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.put("/tickets/{ticket_id}/read")
@@ -639,11 +1517,13 @@ def approve_ticket(ticket_id: str, db: Session = Depends(get_db)):
 @app.post("/approve_ticket/{ticket_id}")
 def approve_and_close_ticket(ticket_id: str, db: Session = Depends(get_db)):
     """Approve the AI draft, send it via email, and close the ticket."""
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+    with stage("db_query"):
+        ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    ticket = _ensure_draft(db, ticket, "approve")  # approved without ever being opened
 
-    # --- Actually send the reply email ---
+    # --- Actually send the reply email (timed as smtp_send) ---
     email_sent = False
     recipient = _extract_recipient_email(ticket.email_body)
     if recipient and ticket.draft_response:
@@ -653,8 +1533,9 @@ def approve_and_close_ticket(ticket_id: str, db: Session = Depends(get_db)):
         logger.warning(f"No recipient email found in ticket {ticket_id}")
 
     ticket.status = TicketStatus.RESOLVED
-    db.commit()
-    db.refresh(ticket)
+    with stage("db_commit"):
+        db.commit()
+        db.refresh(ticket)
 
     msg = (
         f"Ticket approved, response sent to {recipient}, and resolved."
@@ -746,10 +1627,8 @@ def fetch_emails_endpoint(
                 elif ct == "text/html" and not body:
                     payload = part.get_payload(decode=True)
                     if payload:
-                        import re
                         html = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        body = re.sub(r"<[^>]+>", " ", html)
-                        body = re.sub(r"\s+", " ", body).strip()
+                        body = html_to_text(html)
         else:
             payload = msg.get_payload(decode=True)
             if payload:
@@ -758,9 +1637,10 @@ def fetch_emails_endpoint(
 
     # ── Connect to Gmail ──
     try:
-        mail = imaplib.IMAP4_SSL("imap.gmail.com", 993)
-        mail.login(EMAIL_USER, EMAIL_PASSWORD)
-        mail.select("INBOX")
+        with stage("imap_fetch"):
+            mail = imaplib.IMAP4_SSL("imap.gmail.com", 993)
+            mail.login(EMAIL_USER, EMAIL_PASSWORD)
+            mail.select("INBOX")
         print(f"  ✅ Connected to Gmail as {EMAIL_USER}")
     except Exception as e:
         print(f"  ❌ IMAP connection failed: {e}")
@@ -779,7 +1659,8 @@ def fetch_emails_endpoint(
             # Fetch emails from the last 2 days (IMAP SINCE uses date only, no time)
             since_date = (_dt.now() - _td(days=2)).strftime("%d-%b-%Y")
             search_criteria = f'(SINCE "{since_date}")'
-        status, messages = mail.search(None, search_criteria)
+        with stage("imap_fetch"):
+            status, messages = mail.search(None, search_criteria)
         print(f"  🔍 Search criteria: {search_criteria}  status: {status}")
 
         if status != "OK":
@@ -794,65 +1675,84 @@ def fetch_emails_endpoint(
         errors = []
         skipped_dupes = 0
 
+        # ── Pass 1: fetch + parse + dedup (no LLM calls yet) ──
+        pending = []   # (eid, subject, sender, full_text)
+        seen_texts = set()
         for eid in email_ids:
+            subject = "unknown"
             try:
-                st_fetch, msg_data = mail.fetch(eid, "(RFC822)")
+                with stage("imap_fetch"):
+                    st_fetch, msg_data = mail.fetch(eid, "(RFC822)")
                 if st_fetch != "OK":
                     continue
-                raw = msg_data[0][1]
-                msg = email_lib.message_from_bytes(raw)
+                with stage("mime_parse"):
+                    raw = msg_data[0][1]
+                    msg = email_lib.message_from_bytes(raw)
 
-                subject = _decode_hdr(msg.get("Subject", "(No Subject)"))
-                sender = _decode_hdr(msg.get("From", "(Unknown)"))
-                body = _extract_body(msg)
+                    subject = _decode_hdr(msg.get("Subject", "(No Subject)"))
+                    sender = _decode_hdr(msg.get("From", "(Unknown)"))
+                    body = _extract_body(msg)
 
                 if not body or len(body.strip()) < 10:
                     mail.store(eid, "+FLAGS", "\\Seen")
+                    metrics.EMAILS_FETCHED.inc(result="empty")
                     continue
 
                 full_text = f"From: {sender}\nSubject: {subject}\n\n{body}"
 
-                # ── Skip duplicates: check if an identical email_body already exists ──
-                existing = db.query(Ticket).filter(
-                    Ticket.email_body == full_text
-                ).first()
+                # ── Skip duplicates: identical email_body already saved or queued ──
+                with stage("dedup_query"):
+                    existing = full_text in seen_texts or db.query(Ticket).filter(
+                        Ticket.email_body == full_text
+                    ).first()
                 if existing:
                     skipped_dupes += 1
                     mail.store(eid, "+FLAGS", "\\Seen")
+                    metrics.EMAILS_FETCHED.inc(result="duplicate")
                     continue
 
-                print(f"  📩 Processing: {subject[:60]}")
+                seen_texts.add(full_text)
+                pending.append((eid, subject, sender, full_text))
+                print(f"  📩 Queued: {subject[:60]}")
+            except Exception as e:
+                errors.append(f"{subject}: {str(e)}")
+                metrics.EMAILS_FETCHED.inc(result="error")
+                print(f"    ❌ Error: {e}")
 
-                # ── Analyse + Draft (single LLM call) ──
-                try:
-                    combined = analyze_and_draft(full_text)
-                    analysis = combined
-                    draft = combined.draft_response
-                except Exception as ai_err:
-                    err_str = str(ai_err)
+        # ── Pass 2: batched Analyse + Draft (analysis only if DRAFT_MODE=lazy), classifier alongside ──
+        outcomes = _analyse_batch_with_classifier([p[3] for p in pending])
+
+        # ── Pass 3: merge priorities + save, in mailbox order ──
+        for (eid, subject, sender, full_text), (analysis, clf) in zip(pending, outcomes):
+            try:
+                if isinstance(analysis, Exception):
                     # Detect quota / rate-limit errors and abort early
-                    if "429" in err_str or "rate_limit" in err_str.lower() or "quota" in err_str.lower():
+                    if _is_quota_error(analysis):
                         mail.close()
                         mail.logout()
                         elapsed = round(_time.time() - _start, 1)
-                        print(f"  🚫 Groq API rate limit hit after {elapsed}s")
+                        # The limiter's quota model (fed by Groq's headers) knows when
+                        # capacity comes back — report that instead of guessing.
+                        retry_in = max(limiter.queue_wait(AGENT_MODEL), 1.0)
+                        print(f"  🚫 Groq API rate limit hit after {elapsed}s (capacity in ~{retry_in:.0f}s)")
                         return {
                             "fetched": len(results),
                             "errors": len(errors) + 1,
                             "skipped_duplicates": skipped_dupes,
                             "tickets": results,
                             "error_details": [
-                                "⚠️ Groq API rate limit reached (30 req/min). "
-                                "Please wait 1-2 minutes and try again."
+                                f"⚠️ Groq quota for {AGENT_MODEL} is exhausted. "
+                                f"Capacity returns in ~{retry_in:.0f}s."
                             ],
                             "message": f"Processed {len(results)} email(s) before hitting rate limit.",
                             "quota_error": True,
+                            "retry_after_seconds": round(retry_in, 1),
                         }
-                    raise
+                    raise analysis
 
                 # ── Priority override via urgency classifier ──
                 final_pri, final_cat, clf_meta = _resolve_priority(
-                    full_text, analysis.priority.value, analysis.category.value,
+                    analysis.priority.value, analysis.category.value, clf,
                 )
 
                 # ── Save ticket ──
@@ -867,13 +1767,19 @@ def fetch_emails_endpoint(
                     summary=analysis.summary,
                     transaction_id=analysis.entities.transaction_id,
                     amount=analysis.entities.amount,
-                    draft_response=draft,
+                    draft_response=getattr(analysis, "draft_response", None),
+                    model_used=model_used(analysis),
+                    needs_reanalysis=_is_degraded(analysis),
                 )
-                db.add(ticket)
-                db.commit()
-                db.refresh(ticket)
+                with stage("db_commit"):
+                    db.add(ticket)
+                    db.commit()
+                    db.refresh(ticket)
+                _prefetch_drafts([ticket])
 
                 mail.store(eid, "+FLAGS", "\\Seen")
+                metrics.EMAILS_FETCHED.inc(result="created")
+                metrics.TICKETS_CREATED.inc(source="fetch_emails", priority=final_pri, category=final_cat)
 
                 results.append({
                     "ticket_id": str(ticket.id),
@@ -884,7 +1790,9 @@ def fetch_emails_endpoint(
                 })
                 print(f"    ✅ Ticket {str(ticket.id)[:8]} | {final_pri} | {final_cat}  ({_time.time()-_start:.1f}s elapsed)")
             except Exception as e:
-                errors.append(f"{subject if 'subject' in dir() else 'unknown'}: {str(e)}")
+                db.rollback()
+                errors.append(f"{subject}: {str(e)}")
+                metrics.EMAILS_FETCHED.inc(result="error")
                 print(f"    ❌ Error: {e}")
                 continue
 
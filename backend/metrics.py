@@ -0,0 +1,233 @@
+"""
+In-process metrics registry, served at GET /metrics in the Prometheus text
+exposition format (version 0.0.4) — scrape it directly, no collector or
+client library needed.
+
+What feeds it:
+
+  • main.py's middleware — request latency per route / method / status,
+    and every timing.stage() the request went through (imap_fetch,
+    mime_parse, dedup_query, llm_analysis, classifier, llm_draft,
+    db_commit, smtp_send, …) as triage_stage_duration_seconds{route, stage}
+  • timing.stage() — stage failures (the with-block raised)
+  • usage.py — LLM calls, tokens and latency per model / operation
+  • agent.py — time to first token of streamed drafts
+  • hedging.py — hedged requests: which attempt won, hedges skipped for budget
+  • json_repair.py — malformed LLM output repaired locally or retried, per error class
+  • endpoints — tickets created, emails fetched, SMTP sends, lazy drafts
+  • circuit_breaker.py — Groq circuit state changes and rejected calls,
+    plus degraded-mode analyses and their later re-enrichment
+
+Metrics are cumulative since process start, like any Prometheus counter;
+each worker process exposes its own.
+"""
+
+import math
+import threading
+
+# Latency buckets in seconds — IMAP / DB stages land in the low ones, LLM
+# calls between 0.25 s and 60 s (the analysis timeout).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with _bucket / _sum / _count series."""
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple[str, ...], list] = {}  # key → [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, ([*s[0]], s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ────────────────────── Pipeline metrics ──────────────────────
+
+HTTP_REQUEST_SECONDS = histogram(
+    "triage_http_request_duration_seconds", "HTTP request latency.",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = histogram(
+    "triage_stage_duration_seconds",
+    "Time a request spent in each pipeline stage (summed per request).",
+    ("route", "stage"),
+)
+STAGE_ERRORS = counter(
+    "triage_stage_errors_total", "Pipeline stages that raised.", ("stage",),
+)
+LLM_CALLS = counter(
+    "triage_llm_calls_total", "LLM calls and the cache hits that replaced them.",
+    ("model", "operation", "cache", "outcome"),
+)
+LLM_TOKENS = counter(
+    "triage_llm_tokens_total", "LLM tokens used.", ("model", "direction"),
+)
+LLM_SECONDS = histogram(
+    "triage_llm_call_duration_seconds", "LLM API call latency (excluding rate-limiter queueing).",
+    ("model", "operation"),
+)
+LLM_FIRST_TOKEN_SECONDS = histogram(
+    "triage_llm_first_token_seconds", "Time to the first streamed token of an LLM call (excluding queueing).",
+    ("model", "operation"),
+)
+LLM_QUEUE_SECONDS = histogram(
+    "triage_llm_queue_duration_seconds", "Time LLM calls waited for rate-limit capacity.",
+    ("model",),
+)
+LLM_HEDGES = counter(
+    "triage_llm_hedges_total", "Hedged LLM requests by outcome (hedging.py).", ("operation", "outcome"),
+)
+LLM_OUTPUT_REPAIRS = counter(
+    "triage_llm_output_repairs_total", "Malformed structured LLM output by error class and outcome (json_repair.py).",
+    ("operation", "error", "outcome"),
+)
+TICKETS_CREATED = counter(
+    "triage_tickets_created_total", "Tickets created.", ("source", "priority", "category"),
+)
+EMAILS_FETCHED = counter(
+    "triage_emails_fetched_total", "Mailbox emails seen by /fetch_emails, by result.", ("result",),
+)
+LAZY_DRAFTS = counter(
+    "triage_lazy_drafts_total", "Drafts written after ingest (lazy mode, streamed or regenerated), by trigger and result.",
+    ("trigger", "result"),
+)
+SMTP_SENDS = counter(
+    "triage_smtp_sends_total", "Reply emails sent via SMTP, by result.", ("result",),
+)
+CIRCUIT_TRANSITIONS = counter(
+    "triage_circuit_transitions_total", "Circuit breaker state changes.", ("breaker", "state"),
+)
+CIRCUIT_REJECTED = counter(
+    "triage_circuit_rejected_total", "Calls failed fast because the circuit was open.", ("breaker",),
+)
+DEGRADED_ANALYSES = counter(
+    "triage_degraded_analyses_total", "Emails triaged by degraded mode (local rules + template draft).",
+)
+TICKETS_REENRICHED = counter(
+    "triage_tickets_reenriched_total", "Degraded tickets re-analysed once the circuit closed, by result.",
+    ("result",),
+)
@@ -1,7 +1,7 @@
 import uuid
 import enum
 from datetime import datetime, timezone
-from sqlalchemy import Boolean, Column, String, Text, Enum, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Text, Enum, DateTime
 from sqlalchemy.dialects.postgresql import UUID
 
 from database import Base
@@ -65,6 +65,8 @@ class Ticket(Base):
     draft_response = Column(Text, nullable=True)
     is_read = Column(Boolean, nullable=False, default=False, server_default="false")
     is_ai_draft_edited = Column(Boolean, nullable=False, default=False, server_default="false")
+    model_used = Column(String(100), nullable=True)  # LLM that wrote the analysis/draft
+    needs_reanalysis = Column(Boolean, nullable=False, default=False, server_default="false")  # degraded-mode triage
     created_at = Column(
         DateTime(timezone=True),
         nullable=False,
@@ -77,3 +79,31 @@ class Ticket(Base):
             f"status='{self.status}', priority='{self.priority}', "
             f"category='{self.category}')>"
         )
+
+
+class LLMUsage(Base):
+    """One row per LLM call (or cache hit standing in for one) — append-only."""
+    __tablename__ = "llm_usage"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        index=True,
+    )
+    operation = Column(String(50), nullable=False)   # analyze_and_draft, batch, classify_urgency, …
+    model = Column(String(100), nullable=False, index=True)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    tokens_estimated = Column(Boolean, nullable=False, default=False)  # no usage reported by the API
+    latency_ms = Column(Integer, nullable=False, default=0)
+    queue_ms = Column(Integer, nullable=False, default=0)  # rate-limiter wait before the call
+    cache = Column(String(10), nullable=False)    # hit / miss
+    outcome = Column(String(20), nullable=False)  # ok / error / rate_limited / cancelled
+
+    def __repr__(self):
+        return (
+            f"<LLMUsage(model='{self.model}', operation='{self.operation}', "
+            f"in={self.input_tokens}, out={self.output_tokens}, outcome='{self.outcome}')>"
+        )
@@ -0,0 +1,167 @@
+"""
+Native Groq JSON-mode engine for the triage agent (AGENT_ENGINE=native).
+
+The default engine sends every agent call through LangChain:
+ChatPromptTemplate | ChatGroq.with_structured_output(schema). That costs a
+tool definition carrying every field description (~300 prompt tokens per
+call) plus LangChain's per-call Python overhead (prompt formatting, runnable
+config, callback plumbing, tool-call parsing). This engine does what
+urgency_classifier.py does instead:
+
+  • Client : the native groq SDK (sync + AsyncGroq), quota headers reported
+             to the shared rate limiter like every other Groq client
+  • Format : response_format={"type": "json_object"} with the same system
+             prompt, plus a compact JSON shape of the schema (field names,
+             enum values, null-ability — no descriptions)
+  • Output : validated against the schema; anything that does not validate
+             is handed back in the include_raw shape for json_repair.py
+
+agent.py keeps everything around the call — routing, caching,
+single-flight, rate limiting, circuit breaker, hedging, retries — so the
+two engines are interchangeable per call and can be benchmarked against
+each other (benchmark.py --engines langchain,native).
+
+LLM_BACKEND=fake swaps in fake_llm.FakeGroq clients answering the same way
+the fake LangChain chains do.
+"""
+
+import os
+import json
+import typing
+from enum import Enum
+from dataclasses import dataclass
+from functools import lru_cache
+
+from groq import Groq, AsyncGroq
+from pydantic import BaseModel, ValidationError
+
+from rate_limiter import build_http_client, build_async_http_client
+from tokens import estimate_prompt_tokens
+from fake_llm import FAKE_LLM, FakeGroq, FakeAsyncGroq, agent_latency, fake_agent_json
+
+NATIVE_TIMEOUT_SECONDS = 60  # same request_timeout as the LangChain ChatGroq
+
+
+# ────────────────────── Compact schema ──────────────────────
+
+def _shape(annotation) -> typing.Any:
+    """JSON shape of one field: nested object, [item], "A|B|C" for enums, "string|null", …"""
+    origin = typing.get_origin(annotation)
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    nullable = len(args) < len(typing.get_args(annotation))
+    if origin is list and args:
+        return [_shape(args[0])]
+    if origin is not None and args:
+        annotation = args[0]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {name: _shape(field.annotation) for name, field in annotation.model_fields.items()}
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        shape = "|".join(str(member.value) for member in annotation)
+    else:
+        shape = {int: "integer", float: "number", bool: "boolean"}.get(annotation, "string")
+    return f"{shape}|null" if nullable else shape
+
+
+def compact_schema(schema: type[BaseModel]) -> str:
+    """One-line JSON skeleton of `schema`, e.g. {"priority":"High|Medium|Low","summary":"string"}."""
+    return json.dumps(_shape(schema), separators=(",", ":"))
+
+
+# ────────────────────── Prompts ──────────────────────
+
+@dataclass(frozen=True)
+class NativePrompt:
+    """System + human message for one agent operation in JSON mode."""
+    kind: str      # "combined" | "analysis" | "batch" — which fake answer to give
+    schema: type[BaseModel]
+    system: str
+    human: str     # str.format() template ({email_body} / {emails})
+
+    def messages(self, **values) -> list[dict]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.human.format(**values)},
+        ]
+
+    @property
+    def tokens(self) -> int:
+        """Estimated prompt tokens excluding the email(s) themselves."""
+        return estimate_prompt_tokens(self.system, self.human)
+
+
+def native_prompt(kind: str, system_prompt: str, human: str, schema: type[BaseModel]) -> NativePrompt:
+    """`system_prompt` with the compact JSON shape appended (JSON mode needs the word JSON in the prompt)."""
+    system = (
+        f"{system_prompt.rstrip()}\n\n"
+        f"Respond with one JSON object of exactly this shape "
+        f"(\"A|B\" = one of the listed values):\n{compact_schema(schema)}"
+    )
+    return NativePrompt(kind, schema, system, human)
+
+
+# ────────────────────── Clients ──────────────────────
+
+@lru_cache(maxsize=None)
+def _client(kind: str) -> Groq:
+    if FAKE_LLM:
+        return FakeGroq(agent_latency, answer=lambda messages: fake_agent_json(kind, messages))
+    return Groq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        timeout=NATIVE_TIMEOUT_SECONDS,
+        http_client=build_http_client(),  # reports quota headers to the limiter
+    )
+
+
+@lru_cache(maxsize=None)
+def _async_client(kind: str) -> AsyncGroq:
+    if FAKE_LLM:
+        return FakeAsyncGroq(agent_latency, answer=lambda messages: fake_agent_json(kind, messages))
+    return AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        timeout=NATIVE_TIMEOUT_SECONDS,
+        http_client=build_async_http_client(),
+    )
+
+
+# ────────────────────── Calls ──────────────────────
+
+def _request(prompt: NativePrompt, model: str, max_tokens: int, values: dict) -> dict:
+    return {
+        "model": model,
+        "messages": prompt.messages(**values),
+        "temperature": 0,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"},
+        "stream": False,
+    }
+
+
+def _output(prompt: NativePrompt, response, call) -> dict:
+    """The with_structured_output(include_raw=True) shape: parsed object, or None plus the raw text."""
+    content = response.choices[0].message.content or ""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        call.set_tokens(usage.prompt_tokens, usage.completion_tokens)
+    else:
+        call.set_output(content)
+    try:
+        parsed = prompt.schema.model_validate_json(content)
+    except ValidationError:
+        parsed = None
+    return {"raw": content, "parsed": parsed}
+
+
+def invoke(prompt: NativePrompt, model: str, max_tokens: int, call, **values) -> dict:
+    """
+    One JSON-mode completion — the native counterpart of
+    chain.invoke(values, config=call.config). Token usage is reported on
+    `call` (usage.UsageCall). API errors propagate.
+    """
+    response = _client(prompt.kind).chat.completions.create(**_request(prompt, model, max_tokens, values))
+    return _output(prompt, response, call)
+
+
+async def ainvoke(prompt: NativePrompt, model: str, max_tokens: int, call, **values) -> dict:
+    """Async version of invoke() on the AsyncGroq client."""
+    response = await _async_client(prompt.kind).chat.completions.create(**_request(prompt, model, max_tokens, values))
+    return _output(prompt, response, call)
@@ -0,0 +1,193 @@
+"""
+Persistent on-disk LLM result cache (SQLite).
+
+Sits behind the in-memory ResultCache so analyses survive restarts and
+deploys, and are shared by every uvicorn worker on the host (SQLite in WAL
+mode handles concurrent readers + writers across processes).
+
+Keys combine:
+  • the namespace      (analyze_and_draft / analyze_ticket / classify_urgency)
+  • the model name
+  • a prompt version   (hash of the prompt + output schema — any prompt
+                        change invalidates old entries automatically)
+  • the normalised email hash
+
+Values are JSON strings. The cache is best-effort: any SQLite error is
+logged and treated as a miss, never surfaced to the caller.
+
+Reads and commits can wait up to 5 s on a busy WAL file, so coroutines use
+aget() / aset(), which run them on a small dedicated thread pool instead
+of the event loop.
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("persistent_cache")
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", _DEFAULT_PATH)
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))  # 30 days
+
+_PRUNE_EVERY = 500  # writes between sweeps of expired rows
+_IO_WORKERS = 4      # threads (and SQLite connections) serving aget() / aset()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially re-wrapped copies of an email share a key."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+def prompt_version(*parts: str) -> str:
+    """Short, stable fingerprint of everything that shapes the model's answer."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+def make_key(namespace: str, model: str, version: str, text: str) -> str:
+    """Cache key shared by the in-memory and on-disk tiers."""
+    return hashlib.sha256(
+        f"{namespace}|{model}|{version}|{text_hash(text)}".encode()
+    ).hexdigest()
+
+
+class PersistentCache:
+    """SQLite-backed key → JSON store with a TTL. One connection per thread."""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._local = threading.local()
+        self._writes = 0
+        self._init_lock = threading.Lock()
+        self._initialised = False
+        self._io_pool = ThreadPoolExecutor(max_workers=_IO_WORKERS, thread_name_prefix="llm-cache")
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        with self._init_lock:
+            if not self._initialised:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "  key        TEXT PRIMARY KEY,"
+                    "  namespace  TEXT NOT NULL,"
+                    "  model      TEXT NOT NULL,"
+                    "  version    TEXT NOT NULL,"
+                    "  value      TEXT NOT NULL,"
+                    "  created_at REAL NOT NULL"
+                    ")"
+                )
+                conn.commit()
+                self._initialised = True
+        return conn
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl_seconds),
+            ).fetchone()
+        except sqlite3.Error as exc:
+            self.errors += 1
+            logger.warning("LLM cache read failed: %s", exc)
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str, namespace: str, model: str, version: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache "
+                "(key, namespace, model, version, value, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, model, version, value, time.time()),
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self.prune()
+        except sqlite3.Error as exc:
+            self.errors += 1
+            logger.warning("LLM cache write failed: %s", exc)
+
+    async def aget(self, key: str) -> str | None:
+        """get() off the event loop."""
+        if not self.enabled:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._io_pool, self.get, key)
+
+    async def aset(self, key: str, value: str, namespace: str, model: str, version: str) -> None:
+        """set() off the event loop."""
+        if not self.enabled:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            self._io_pool, self.set, key, value, namespace, model, version,
+        )
+
+    def prune(self) -> int:
+        """Delete expired rows. Returns the number removed."""
+        conn = self._conn()
+        cur = conn.execute(
+            "DELETE FROM llm_cache WHERE created_at <= ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        conn.commit()
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        stats = {
+            "enabled": self.enabled,
+            "path": self.path,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+        if self.enabled:
+            try:
+                stats["rows"] = self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            except sqlite3.Error:
+                stats["rows"] = None
+        return stats
+
+
+# One store per process; every module writes to its own namespace.
+llm_store = PersistentCache()
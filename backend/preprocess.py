@@ -0,0 +1,257 @@
+"""
+Email preprocessing — trims what the LLM doesn't need to read.
+
+Customer mail arrives with long quoted reply chains, signatures, legal
+footers and HTML leftovers. None of it changes the triage verdict, but all
+of it costs input tokens (latency + Groq TPM budget). preprocess_email()
+removes, in order:
+
+  • Quoted history : everything from the first reply header ("On … wrote:",
+                     "-----Original Message-----", an Outlook "From:/Sent:"
+                     block) down, plus any "> " quoted lines
+  • Signatures     : a short block after an RFC 3676 "-- " delimiter near
+                     the end (keeping its first line — usually the sender's
+                     name, which the agent extracts), or everything after a
+                     "Sent from my iPhone" line. A bare "--" divider inside
+                     the message is left alone
+  • Boilerplate    : trailing paragraphs, after the message itself, that
+                     read like legal notices or unsubscribe /
+                     print-the-environment footers — never the first
+                     paragraph of content, so a complaint that merely
+                     mentions unsubscribing or confidentiality survives
+
+The From:/Subject: header that the ingestion paths prepend is kept. If
+stripping would leave less than PREPROCESS_MIN_BODY_CHARS of body, the
+original text is used instead — better a long prompt than an empty one.
+
+Only the prompt is trimmed: callers still store the original email body.
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from html import unescape
+from html.parser import HTMLParser
+
+from tokens import estimate_tokens
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "true").lower() == "true"
+PREPROCESS_MIN_BODY_CHARS = int(os.getenv("PREPROCESS_MIN_BODY_CHARS", "20"))
+
+
+@dataclass(frozen=True)
+class Preprocessed:
+    text: str
+    original_tokens: int
+    tokens: int
+    removed: tuple[str, ...]  # sections stripped: "quoted", "signature", "boilerplate"
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+# ────────────────────── HTML → text ──────────────────────
+
+_BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3",
+    "h4", "h5", "h6", "hr", "section", "article", "header", "footer",
+}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text, with line breaks at block tags and "> " inside blockquotes."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: list[str] = []
+        self._line: list[str] = []
+        self._skip = 0
+        self._quote = 0
+
+    def _flush(self):
+        line = " ".join("".join(self._line).split())
+        self._line = []
+        self.lines.append(("> " * self._quote + line) if line else "")
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "blockquote":
+            self._flush()
+            self._quote += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "blockquote":
+            self._flush()
+            self._quote = max(self._quote - 1, 0)
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._line.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Readable plain text from an HTML email part (quoted blocks marked with "> ")."""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # Malformed markup — fall back to crude tag stripping
+        return " ".join(unescape(re.sub(r"<[^>]+>", " ", html)).split())
+    parser._flush()
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(parser.lines)).strip()
+
+
+# ────────────────────── Patterns ──────────────────────
+
+_HEADER_LINE = re.compile(r"^(From|Subject|To|Date):\s", re.IGNORECASE)
+
+_REPLY_HEADERS = [
+    re.compile(r"^On\s.{0,300}\bwrote:\s*$", re.IGNORECASE | re.DOTALL),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),  # Outlook separator before the quoted From:/Sent: block
+    re.compile(r"^From:\s.+\n(Sent|Date):\s", re.IGNORECASE),
+]
+
+_SIGNATURE_DELIMITER = re.compile(r"^-- $")  # matched on the raw line — a bare "--" is a divider
+_SIGNATURE_MAX_LINES = 6
+_SIGNATURE_MAX_LINE_CHARS = 80
+_MOBILE_SIGNATURE = re.compile(r"^Sent from my \w+", re.IGNORECASE)
+
+# Footer templates only — a customer may well write "I tried to unsubscribe…"
+_BOILERPLATE = re.compile(
+    r"(this (e-?mail|message|communication)( and any (attachments|files)[^.]{0,40})?"
+    r" (is|are|may be|may contain|contains) (strictly )?(confidential|privileged)"
+    r"( and| or|,)[^.]{0,80}\b(intended|privileged|recipient|addressee|disclosure)"
+    r"|intended (solely |only )?for the (use of the )?(individual|addressee|intended recipient)"
+    r"|if you (have )?received this (e-?mail|message|communication) in error"
+    r"|please consider the environment before printing"
+    r"|(click|tap) here to unsubscribe|to unsubscribe,? (click|reply|visit|email|send|update)"
+    r"|unsubscribe from (these|this|our) (e-?mails|emails|messages|mailing list|newsletter|list|communications)"
+    r"|(has been|was) scanned for viruses)",
+    re.IGNORECASE,
+)
+_GREETING = re.compile(r"^(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^\n]{0,60}$", re.IGNORECASE)
+
+
+# ────────────────────── Stripping ──────────────────────
+
+def split_header(text: str) -> tuple[str, str]:
+    """Separate the "From: …\\nSubject: …" block the ingestion paths prepend."""
+    head, sep, rest = text.partition("\n\n")
+    if sep and head.strip() and all(_HEADER_LINE.match(line) for line in head.splitlines()):
+        return head, rest
+    return "", text
+
+
+def _strip_quoted(lines: list[str]) -> tuple[list[str], bool]:
+    for i, line in enumerate(lines):
+        # Reply headers wrap over two lines in Gmail ("On Mon, … <x@y.com>\nwrote:")
+        window = line.strip() + ("\n" + lines[i + 1].strip() if i + 1 < len(lines) else "")
+        for pattern in _REPLY_HEADERS:
+            if pattern.match(line.strip()) or pattern.match(window):
+                if any(l.strip() for l in lines[:i]):
+                    return lines[:i], True
+    kept = [line for line in lines if not line.lstrip().startswith(">")]
+    return kept, len(kept) != len(lines)
+
+
+def _strip_signature(lines: list[str]) -> tuple[list[str], bool]:
+    for i, line in enumerate(lines):
+        if _MOBILE_SIGNATURE.match(line.strip()):
+            return lines[:i], True
+        if _SIGNATURE_DELIMITER.match(line) and i > 0:
+            block = [l for l in lines[i + 1:] if l.strip()]
+            if len(block) > _SIGNATURE_MAX_LINES or any(len(l) > _SIGNATURE_MAX_LINE_CHARS for l in block):
+                continue  # too much follows for a signature — part of the message
+            return lines[:i] + block[:1], True
+    return lines, False
+
+
+def _strip_boilerplate(body: str) -> tuple[str, bool]:
+    paragraphs = [p for p in re.split(r"\n\s*\n", body) if p.strip()]
+    # The first paragraph that isn't a greeting is the message — never a footer
+    first = next((i for i, p in enumerate(paragraphs) if not _GREETING.match(p.strip())), len(paragraphs))
+    end = len(paragraphs)
+    while end > first + 1 and _BOILERPLATE.search(" ".join(paragraphs[end - 1].split())):
+        end -= 1
+    return "\n\n".join(paragraphs[:end]), end != len(paragraphs)
+
+
+# ────────────────────── Stats ──────────────────────
+
+_lock = threading.Lock()
+_stats = {"emails": 0, "trimmed": 0, "original_tokens": 0, "tokens": 0}
+_removed_counts = {"quoted": 0, "signature": 0, "boilerplate": 0}
+
+
+def _record(result: Preprocessed) -> None:
+    with _lock:
+        _stats["emails"] += 1
+        _stats["trimmed"] += bool(result.removed)
+        _stats["original_tokens"] += result.original_tokens
+        _stats["tokens"] += result.tokens
+        for section in result.removed:
+            _removed_counts[section] += 1
+
+
+def preprocess_stats() -> dict:
+    """Emails seen, how many were trimmed and the input tokens saved."""
+    with _lock:
+        saved = _stats["original_tokens"] - _stats["tokens"]
+        return {
+            "enabled": PREPROCESS_ENABLED,
+            **_stats,
+            "tokens_saved": saved,
+            "saved_share": round(saved / _stats["original_tokens"], 4) if _stats["original_tokens"] else 0.0,
+            "removed": dict(_removed_counts),
+        }
+
+
+# ────────────────────── Public API ──────────────────────
+
+def preprocess_email(text: str, record: bool = True) -> Preprocessed:
+    """
+    Strip quoted history, signatures and boilerplate from an email for
+    prompting. record=False skips the stats (for a second look at an email
+    that was already counted).
+    """
+    text = (text or "").replace("\r\n", "\n").strip()
+    original_tokens = estimate_tokens(text)
+    if not PREPROCESS_ENABLED or not text:
+        return Preprocessed(text, original_tokens, original_tokens, ())
+
+    header, body = split_header(text)
+    removed = []
+
+    lines = body.split("\n")  # unstripped: the "-- " delimiter's trailing space matters
+    lines, hit = _strip_quoted(lines)
+    if hit:
+        removed.append("quoted")
+    lines, hit = _strip_signature(lines)
+    if hit:
+        removed.append("signature")
+    lines = [line.rstrip() for line in lines]
+    stripped, hit = _strip_boilerplate("\n".join(lines))
+    if hit:
+        removed.append("boilerplate")
+    stripped = re.sub(r"\n{3,}", "\n\n", stripped).strip()
+
+    if not removed or len(stripped) < PREPROCESS_MIN_BODY_CHARS:
+        result = Preprocessed(text, original_tokens, original_tokens, ())
+    else:
+        trimmed = f"{header}\n\n{stripped}" if header else stripped
+        result = Preprocessed(trimmed, original_tokens, estimate_tokens(trimmed), tuple(removed))
+    if record:
+        _record(result)
+    return result
@@ -0,0 +1,361 @@
+"""
+Process-wide token-bucket rate limiter for all Groq traffic.
+
+Both the LangChain ChatGroq calls in agent.py and the native Groq client in
+urgency_classifier.py reserve capacity here before each request, so the
+process stays inside Groq's per-model budgets proactively instead of
+reacting to 429s.
+
+Each model has two buckets:
+  • requests per minute (RPM)
+  • tokens per minute   (TPM — prompt estimate + expected completion)
+
+Reservations are taken immediately and may drive a bucket negative; the
+caller then sleeps until its share has refilled. That keeps the queue FIFO
+and works the same for threads (time.sleep) and coroutines (asyncio.sleep).
+A cancelled async waiter gives its reservation back.
+
+Limits default to the Groq free tier and can be overridden with
+GROQ_RATE_LIMITS="model=rpm:tpm,other-model=rpm:tpm".
+
+Adaptive throttling
+  Groq reports the live quota on every response (x-ratelimit-* headers,
+  retry-after on 429). The httpx clients from build_http_client() /
+  build_async_http_client() feed those headers into observe(), which
+  keeps a per-model quota model in sync with the server:
+    • remaining tokens lower than we assumed  → drain the TPM bucket (slow down)
+    • remaining tokens higher than we assumed → move halfway up (speed up)
+    • server TPM limit differs from config    → adopt the server's limit
+    • few daily requests left                 → pace them over the reset window
+    • retry-after                             → pause the model until then
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+
+import httpx
+
+logger = logging.getLogger("rate_limiter")
+
+# model → (requests per minute, tokens per minute)
+DEFAULT_LIMITS: dict[str, tuple[int, int]] = {
+    "llama-3.3-70b-versatile": (30, 12_000),
+    "llama-3.1-8b-instant": (30, 6_000),
+}
+FALLBACK_LIMITS = (30, 6_000)  # models not listed above
+
+# Callers never queue longer than this; beyond it the request fails fast.
+MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "120"))
+
+
+def _parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """Parse "model=rpm:tpm,model=rpm:tpm" (bad entries are logged and skipped)."""
+    limits: dict[str, tuple[int, int]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, budget = item.split("=", 1)
+            rpm, tpm = budget.split(":", 1)
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning("Ignoring malformed GROQ_RATE_LIMITS entry: %r", item)
+    return limits
+
+
+class RateLimitExceeded(Exception):
+    """The wait for capacity would exceed MAX_WAIT_SECONDS."""
+
+
+class TokenBucket:
+    """Continuous-refill bucket; level may go negative to represent queued debt."""
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds  # units per second
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` could be taken (0 if available now). Call refill() first."""
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+def parse_reset(value: str | None) -> float | None:
+    """Parse Groq reset durations like "7.66s", "2m59.56s", "1h2m" or "120ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(num) * units[unit] for num, unit in parts)
+
+
+def _int_header(headers, name: str) -> int | None:
+    value = headers.get(name)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiting = 0
+        self.granted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+        # Live quota model, from the last response's x-ratelimit-* headers
+        self.server_limit_requests: int | None = None      # per day on Groq
+        self.server_remaining_requests: int | None = None
+        self.server_limit_tokens: int | None = None        # per minute
+        self.server_remaining_tokens: int | None = None
+        self.requests_reset_at: float | None = None
+        self.tokens_reset_at: float | None = None
+        self.paused_until = 0.0
+        self.next_paced_at = 0.0
+        self.observed = 0
+        self.throttled = 0   # 429s seen
+        self.last_observed_at: float | None = None
+
+    def pacing_interval(self, now: float) -> float:
+        """Minimum spacing between requests while the daily request quota runs low."""
+        remaining = self.server_remaining_requests
+        if remaining is None or self.requests_reset_at is None:
+            return 0.0
+        if remaining >= self.requests.capacity:
+            return 0.0  # more than a minute's worth left — RPM bucket governs
+        window = max(self.requests_reset_at - now, 0.0)
+        return window / max(remaining, 1)
+
+
+class RateLimiter:
+    """Per-model RPM + TPM buckets shared by every Groq caller in the process."""
+
+    def __init__(self, limits: dict[str, tuple[int, int]] | None = None, max_wait: float = MAX_WAIT_SECONDS):
+        self._limits = dict(DEFAULT_LIMITS)
+        self._limits.update(limits or {})
+        self._models: dict[str, _ModelLimiter] = {}
+        self._lock = threading.Lock()
+        self.max_wait = max_wait
+
+    def _model(self, model: str) -> _ModelLimiter:
+        state = self._models.get(model)
+        if state is None:
+            state = _ModelLimiter(*self._limits.get(model, FALLBACK_LIMITS))
+            self._models[model] = state
+        return state
+
+    def _reserve(self, model: str, tokens: int) -> float:
+        """Reserve one request + `tokens`; return how long the caller must wait."""
+        with self._lock:
+            state = self._model(model)
+            now = time.monotonic()
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            wait = max(
+                state.requests.wait_for(1),
+                state.tokens.wait_for(tokens),
+                state.paused_until - now,
+                state.next_paced_at - now,
+            )
+            if wait > self.max_wait:
+                state.rejected += 1
+                raise RateLimitExceeded(
+                    f"Groq rate limit for {model}: next slot in {wait:.0f}s "
+                    f"(max queue wait {self.max_wait:.0f}s)"
+                )
+            state.requests.take(1)
+            state.tokens.take(tokens)
+            interval = state.pacing_interval(now)
+            if interval:
+                state.next_paced_at = max(state.next_paced_at, now) + interval
+            state.granted += 1
+            if wait > 0:
+                state.queued += 1
+                state.total_wait += wait
+            return wait
+
+    def _release(self, model: str, tokens: int) -> None:
+        with self._lock:
+            state = self._model(model)
+            state.requests.give_back(1)
+            state.tokens.give_back(tokens)
+            state.granted -= 1
+
+    def _set_waiting(self, model: str, delta: int) -> None:
+        with self._lock:
+            self._model(model).waiting += delta
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Block until `model` has capacity for one request of ~`tokens`. Returns seconds waited."""
+        wait = self._reserve(model, tokens)
+        if wait > 0:
+            self._set_waiting(model, 1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._set_waiting(model, -1)
+        return wait
+
+    async def aacquire(self, model: str, tokens: int) -> float:
+        """Async version of acquire(); a cancelled waiter returns its reservation."""
+        wait = self._reserve(model, tokens)
+        if wait > 0:
+            self._set_waiting(model, 1)
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._release(model, tokens)
+                raise
+            finally:
+                self._set_waiting(model, -1)
+        return wait
+
+    def queue_wait(self, model: str, tokens: int = 0) -> float:
+        """Seconds a request for `model` issued now would wait for capacity."""
+        with self._lock:
+            state = self._model(model)
+            now = time.monotonic()
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            return max(
+                state.requests.wait_for(1),
+                state.tokens.wait_for(tokens),
+                state.paused_until - now,
+                state.next_paced_at - now,
+            )
+
+    def observe(self, model: str, headers, status_code: int = 200) -> None:
+        """Update the live quota model for `model` from a Groq response's headers."""
+        remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+        remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        limit_tokens = _int_header(headers, "x-ratelimit-limit-tokens")
+        limit_requests = _int_header(headers, "x-ratelimit-limit-requests")
+        reset_tokens = parse_reset(headers.get("x-ratelimit-reset-tokens"))
+        reset_requests = parse_reset(headers.get("x-ratelimit-reset-requests"))
+        retry_after = parse_reset(headers.get("retry-after"))
+
+        with self._lock:
+            state = self._model(model)
+            now = time.monotonic()
+            state.tokens.refill(now)
+            state.observed += 1
+            state.last_observed_at = time.time()
+
+            if limit_tokens and limit_tokens != int(state.tokens.capacity):
+                # Adopt the server's real TPM budget (e.g. a paid tier)
+                state.tokens.capacity = float(limit_tokens)
+                state.tokens.rate = limit_tokens / 60.0
+            if remaining_tokens is not None:
+                state.server_remaining_tokens = remaining_tokens
+                if remaining_tokens < state.tokens.level:
+                    state.tokens.level = float(remaining_tokens)
+                else:
+                    # Our estimates were pessimistic. Only close half the gap:
+                    # reservations still in flight haven't reached the server yet.
+                    state.tokens.level += (remaining_tokens - state.tokens.level) / 2
+            if limit_tokens is not None:
+                state.server_limit_tokens = limit_tokens
+            if limit_requests is not None:
+                state.server_limit_requests = limit_requests
+            if remaining_requests is not None:
+                state.server_remaining_requests = remaining_requests
+            if reset_tokens is not None:
+                state.tokens_reset_at = now + reset_tokens
+            if reset_requests is not None:
+                state.requests_reset_at = now + reset_requests
+
+            if status_code == 429:
+                state.throttled += 1
+                pause = retry_after if retry_after is not None else (reset_tokens or 1.0)
+                state.paused_until = max(state.paused_until, now + pause)
+                logger.warning("Groq 429 for %s — pausing dispatch for %.1fs", model, pause)
+
+    def stats(self) -> dict[str, dict]:
+        out = {}
+        for model in list(self._models):
+            wait = self.queue_wait(model)
+            with self._lock:
+                state = self._models[model]
+                out[model] = {
+                    "rpm_limit": int(state.requests.capacity),
+                    "tpm_limit": int(state.tokens.capacity),
+                    "requests_available": round(state.requests.level, 2),
+                    "tokens_available": round(state.tokens.level),
+                    "queue_wait_seconds": round(wait, 2),
+                    "waiting": state.waiting,
+                    "granted": state.granted,
+                    "queued": state.queued,
+                    "rejected": state.rejected,
+                    "avg_queue_wait_seconds": round(state.total_wait / state.queued, 2) if state.queued else 0.0,
+                    "server": {
+                        "limit_requests": state.server_limit_requests,
+                        "remaining_requests": state.server_remaining_requests,
+                        "limit_tokens": state.server_limit_tokens,
+                        "remaining_tokens": state.server_remaining_tokens,
+                        "paused_for_seconds": round(max(state.paused_until - time.monotonic(), 0.0), 2),
+                        "pacing_interval_seconds": round(state.pacing_interval(time.monotonic()), 2),
+                        "responses_observed": state.observed,
+                        "throttled_429": state.throttled,
+                        "last_observed_at": state.last_observed_at,
+                    },
+                }
+        return out
+
+
+# Process-wide instance — every Groq caller goes through this one.
+limiter = RateLimiter(_parse_limits(os.getenv("GROQ_RATE_LIMITS", "")))
+
+
+# ─────────── httpx clients that report Groq quota headers ───────────
+
+def _request_model(request: httpx.Request) -> str | None:
+    """Model name from a chat-completions request body."""
+    try:
+        return json.loads(request.content or b"{}").get("model")
+    except (ValueError, AttributeError, httpx.RequestNotRead):
+        return None
+
+
+def _observe_response(response: httpx.Response) -> None:
+    model = _request_model(response.request)
+    if model and any(h.startswith("x-ratelimit-") or h == "retry-after" for h in response.headers):
+        limiter.observe(model, response.headers, response.status_code)
+
+
+async def _aobserve_response(response: httpx.Response) -> None:
+    _observe_response(response)
+
+
+def build_http_client(**kwargs) -> httpx.Client:
+    """httpx.Client for Groq / ChatGroq that feeds rate-limit headers to the limiter."""
+    return httpx.Client(event_hooks={"response": [_observe_response]}, **kwargs)
+
+
+def build_async_http_client(**kwargs) -> httpx.AsyncClient:
+    """Async counterpart of build_http_client()."""
+    return httpx.AsyncClient(event_hooks={"response": [_aobserve_response]}, **kwargs)
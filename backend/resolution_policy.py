@@ -0,0 +1,145 @@
+"""
+Resolution policy — decides whether the second-opinion urgency classifier
+is worth running for a given agent verdict.
+
+_resolve_priority() in main.py can only change the agent's verdict by
+promoting the priority, trusting a ≥0.75-confidence classifier outright,
+or upgrading the category of a High ticket to Fraud / Payment Issue. A
+High/Fraud verdict leaves nothing to promote or upgrade — only a confident
+classifier demoting it, which we don't want on the small model's word for
+a fraud report — so by default that is the one verdict we skip. Other High
+verdicts still run: the classifier may re-categorise them as Fraud.
+
+  • Skip rules  : RESOLUTION_SKIP_RULES="High:Fraud" — comma-separated
+                  priority:category pairs, * matches anything
+  • Cost budget : skip when the classifier model's rate-limit queue is
+                  longer than RESOLUTION_MAX_QUEUE_SECONDS, or when more
+                  than RESOLUTION_MAX_CALLS_PER_MIN second passes already
+                  ran in the last minute (0 = no cap). Checked before a
+                  call is started.
+  • Dispatch    : RESOLUTION_DISPATCH=concurrent (default) starts the
+                  classifier alongside the agent, keeping its latency off
+                  the critical path, and cancels it when the policy says
+                  skip — a cancelled call that was still queued gives its
+                  quota back. "on_demand" runs it after the agent, only
+                  when needed (fewer calls, slower tickets).
+
+stats() counts how often the second pass ran, was skipped (and why), and
+was decisive (changed the final priority or category).
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+from rate_limiter import limiter
+
+RESOLUTION_SKIP_RULES = os.getenv("RESOLUTION_SKIP_RULES", "High:Fraud")
+RESOLUTION_MAX_QUEUE_SECONDS = float(os.getenv("RESOLUTION_MAX_QUEUE_SECONDS", "5"))
+RESOLUTION_MAX_CALLS_PER_MIN = int(os.getenv("RESOLUTION_MAX_CALLS_PER_MIN", "0"))
+RESOLUTION_DISPATCH = os.getenv("RESOLUTION_DISPATCH", "concurrent").strip().lower()
+
+if RESOLUTION_DISPATCH not in ("on_demand", "concurrent"):
+    raise ValueError("RESOLUTION_DISPATCH must be 'on_demand' or 'concurrent'.")
+
+
+def _parse_rules(spec: str) -> list[tuple[str, str]]:
+    """'High:*, Medium:Fraud' → [("High", "*"), ("Medium", "Fraud")]."""
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        priority, _, category = item.partition(":")
+        rules.append((priority.strip() or "*", category.strip() or "*"))
+    return rules
+
+
+class ResolutionPolicy:
+    """Config-driven gate in front of the second-opinion classifier."""
+
+    def __init__(
+        self,
+        skip_rules: str = RESOLUTION_SKIP_RULES,
+        max_queue_seconds: float = RESOLUTION_MAX_QUEUE_SECONDS,
+        max_calls_per_min: int = RESOLUTION_MAX_CALLS_PER_MIN,
+        dispatch: str = RESOLUTION_DISPATCH,
+    ):
+        self.skip_rules = _parse_rules(skip_rules)
+        self.max_queue_seconds = max_queue_seconds
+        self.max_calls_per_min = max_calls_per_min
+        self.dispatch = dispatch
+        self._recent: deque[float] = deque()  # start times of second passes in the last minute
+        self._lock = threading.Lock()
+
+        self.considered = 0
+        self.ran = 0
+        self.skipped = {"rule": 0, "queue": 0, "calls_per_min": 0}
+        self.decisive = 0
+
+    @property
+    def concurrent(self) -> bool:
+        return self.dispatch == "concurrent"
+
+    def _matches_skip_rule(self, priority: str, category: str) -> bool:
+        return any(
+            rule_pri in ("*", priority) and rule_cat in ("*", category)
+            for rule_pri, rule_cat in self.skip_rules
+        )
+
+    def should_run(
+        self, agent_priority: str, agent_category: str, model: str,
+        tokens: int = 0, started: bool = False,
+    ) -> bool:
+        """
+        Decide (and count) whether the classifier should run for this
+        agent verdict. model/tokens describe the classifier call, for the
+        rate-limit queue check. started=True means the call is already in
+        flight (concurrent dispatch): its cost is committed, so only the
+        skip rules apply.
+        """
+        with self._lock:
+            self.considered += 1
+            if self._matches_skip_rule(agent_priority, agent_category):
+                self.skipped["rule"] += 1
+                return False
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            if not started:
+                if limiter.queue_wait(model, tokens) > self.max_queue_seconds:
+                    self.skipped["queue"] += 1
+                    return False
+                if self.max_calls_per_min and len(self._recent) >= self.max_calls_per_min:
+                    self.skipped["calls_per_min"] += 1
+                    return False
+            self._recent.append(now)
+            self.ran += 1
+            return True
+
+    def record_outcome(self, agent: tuple[str, str], final: tuple[str, str]) -> None:
+        """Count a second pass that changed the final (priority, category)."""
+        if agent != final:
+            with self._lock:
+                self.decisive += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            skipped = sum(self.skipped.values())
+            return {
+                "dispatch": self.dispatch,
+                "skip_rules": [f"{p}:{c}" for p, c in self.skip_rules],
+                "max_queue_seconds": self.max_queue_seconds,
+                "max_calls_per_min": self.max_calls_per_min,
+                "considered": self.considered,
+                "ran": self.ran,
+                "skipped": dict(self.skipped),
+                "skip_rate": round(skipped / self.considered, 4) if self.considered else 0.0,
+                "decisive": self.decisive,
+                "decisive_rate": round(self.decisive / self.ran, 4) if self.ran else 0.0,
+            }
+
+
+# One policy per process, shared by every endpoint.
+policy = ResolutionPolicy()
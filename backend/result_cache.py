@@ -0,0 +1,139 @@
+"""
+Bounded in-memory result cache shared by agent.py and urgency_classifier.py.
+
+Replaces the plain ``dict`` caches that grew forever in long-running
+processes:
+  • LRU eviction once either limit is hit (entries or approximate bytes)
+  • Per-entry TTL (expired entries are dropped lazily on access)
+  • Hit / miss / eviction / expiry counters, readable via cache_stats()
+
+Limits default to the RESULT_CACHE_* environment variables and can be
+overridden per cache.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # 16 MB
+DEFAULT_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+def approx_size(value: Any) -> int:
+    """
+    Approximate the memory cost of a cached value in bytes.
+
+    Uses the serialised size for Pydantic models and JSON-able values — a
+    stable proxy that is cheap to compute and the same across processes.
+    """
+    if hasattr(value, "model_dump_json"):
+        return len(value.model_dump_json().encode())
+    try:
+        return len(json.dumps(value, default=str).encode())
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache bounded by entry count and bytes."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        ttl_seconds: float | None = None,
+        sizeof: Callable[[Any], int] = approx_size,
+    ):
+        self.name = name
+        self.max_entries = max_entries if max_entries is not None else DEFAULT_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else DEFAULT_TTL_SECONDS
+        self._sizeof = sizeof
+
+        # key → (value, size_bytes, expires_at)
+        self._data: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        _REGISTRY[name] = self
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value (and mark it recently used), or default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        """Store a value, evicting least-recently-used entries to stay in bounds."""
+        size = self._sizeof(value)
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]  # dropped even if the new value can't be kept — never serve it stale
+            if size > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._data[key] = (value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str, size: int) -> None:
+        del self._data[key]
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_REGISTRY: dict[str, ResultCache] = {}
+
+
+def cache_stats() -> dict[str, dict]:
+    """Counters for every cache created in this process, keyed by cache name."""
+    return {name: cache.stats() for name, cache in _REGISTRY.items()}
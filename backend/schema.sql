@@ -23,6 +23,8 @@ CREATE TABLE IF NOT EXISTS tickets (
     draft_response TEXT,
     is_read       BOOLEAN         NOT NULL DEFAULT FALSE,
     is_ai_draft_edited BOOLEAN    NOT NULL DEFAULT FALSE,
+    model_used    VARCHAR(100),
+    needs_reanalysis BOOLEAN   NOT NULL DEFAULT FALSE,
     created_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
 );
 
@@ -31,3 +33,21 @@ CREATE INDEX IF NOT EXISTS idx_tickets_status     ON tickets (status);
 CREATE INDEX IF NOT EXISTS idx_tickets_priority   ON tickets (priority);
 CREATE INDEX IF NOT EXISTS idx_tickets_category   ON tickets (category);
 CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at DESC);
+
+-- LLM usage log (append-only, one row per call or cache hit)
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id               BIGSERIAL       PRIMARY KEY,
+    created_at       TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    operation        VARCHAR(50)     NOT NULL,
+    model            VARCHAR(100)    NOT NULL,
+    input_tokens     INTEGER         NOT NULL DEFAULT 0,
+    output_tokens    INTEGER         NOT NULL DEFAULT 0,
+    tokens_estimated BOOLEAN         NOT NULL DEFAULT FALSE,
+    latency_ms       INTEGER         NOT NULL DEFAULT 0,
+    queue_ms         INTEGER         NOT NULL DEFAULT 0,
+    cache            VARCHAR(10)     NOT NULL,
+    outcome          VARCHAR(20)     NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage (created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_model      ON llm_usage (model);
@@ -6,7 +6,7 @@ These schemas serve two purposes:
 2. FastAPI request / response models — automatic validation & OpenAPI docs.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from enum import Enum
 from typing import Optional
 
@@ -83,6 +83,10 @@ class TicketAnalysis(BaseModel):
         description="A concise 1–2 sentence summary of the email for the support agent.",
     )
 
+    # Which LLM produced this result (set by agent.py's router). Private, so
+    # it is not part of the structured-output schema or the API response.
+    _model_used: Optional[str] = PrivateAttr(default=None)
+
 
 class TicketAnalysisWithDraft(TicketAnalysis):
     """
@@ -105,6 +109,24 @@ class TicketAnalysisWithDraft(TicketAnalysis):
     )
 
 
+class BatchTicketItem(TicketAnalysisWithDraft):
+    """One email's analysis + draft inside a batched response."""
+    index: int = Field(
+        description="0-based position of the email in the batch this item answers.",
+    )
+
+
+class BatchTicketAnalysis(BaseModel):
+    """
+    Several short emails analysed in one LLM call. Each item carries the
+    index of the email it belongs to, so results are matched by position
+    even if the model reorders or skips items.
+    """
+    items: list[BatchTicketItem] = Field(
+        description="Exactly one item per input email, each with its index.",
+    )
+
+
 # -------------------- API Request / Response Bodies --------------------
 
 class AnalyzeRequest(BaseModel):
@@ -123,6 +145,16 @@ class AnalyzeRequest(BaseModel):
     )
 
 
+class BatchAnalyzeRequest(BaseModel):
+    """POST body for the /analyze_batch endpoint."""
+    emails: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=50,
+        description="Raw email texts to analyse; results are returned in the same order.",
+    )
+
+
 class ProcessTicketResponse(BaseModel):
     """Full response from the /process_ticket endpoint."""
     ticket_id: str = Field(
@@ -131,8 +163,9 @@ class ProcessTicketResponse(BaseModel):
     analysis: TicketAnalysis = Field(
         description="Structured analysis of the email.",
     )
-    draft_response: str = Field(
-        description="AI-generated email reply draft.",
+    draft_response: Optional[str] = Field(
+        default=None,
+        description="AI-generated email reply draft (None with DRAFT_MODE=lazy — written when the ticket is opened).",
     )
     extracted_text: Optional[str] = Field(
         default=None,
@@ -142,3 +175,38 @@ class ProcessTicketResponse(BaseModel):
         default="Ticket processed and saved successfully.",
         description="Status message.",
     )
+
+
+class ProcessTicketsRequest(BaseModel):
+    """POST body for the /process_tickets batch endpoint."""
+    emails: list[str] = Field(
+        ...,
+        min_length=1,
+        max_length=100,
+        description=(
+            "Raw email texts to turn into tickets. Each email is validated on "
+            "its own, so one bad email does not fail the batch."
+        ),
+    )
+
+
+class ProcessTicketsItem(BaseModel):
+    """Per-email outcome of /process_tickets (same order as the request)."""
+    index: int = Field(description="Position of the email in the request.")
+    status: str = Field(description="'created', 'duplicate' or 'error'.")
+    ticket_id: Optional[str] = Field(
+        default=None,
+        description="UUID of the new ticket, or of the existing one for duplicates.",
+    )
+    priority: Optional[str] = Field(default=None, description="Final priority (created tickets).")
+    category: Optional[str] = Field(default=None, description="Final category (created tickets).")
+    error: Optional[str] = Field(default=None, description="Why this email failed (status='error').")
+
+
+class ProcessTicketsResponse(BaseModel):
+    """Full response from the /process_tickets endpoint."""
+    created: int = Field(description="Number of tickets created.")
+    duplicates: int = Field(description="Emails skipped because an identical ticket exists.")
+    errors: int = Field(description="Emails that could not be processed.")
+    results: list[ProcessTicketsItem] = Field(description="One entry per email, in request order.")
+    message: str = Field(description="Status message.")
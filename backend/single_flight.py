@@ -0,0 +1,116 @@
+"""
+Single-flight coalescing of identical in-flight LLM calls.
+
+When the background poller, the dashboard's "Fetch New Emails" button and
+email_ingestion.py see the same message at the same time, every caller
+misses the result cache until the first call returns. SingleFlight lets
+the first caller for a key (the leader) make the call while everyone else
+with the same key waits for — and shares — its result.
+
+Sync callers (threads) and async callers (event loop) coalesce on the same
+key, so a threadpool endpoint and an async endpoint never duplicate a call.
+Errors are shared too: if the leader fails, its waiters see the same error.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+
+class _LeaderCancelled(Exception):
+    """The leading async call was cancelled — waiters should retry themselves."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+        _REGISTRY[name] = self
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        """Return (future, is_leader) for key."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+            self.calls += 1
+            return fut, True
+
+    def _leave(self, key: str, fut: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) once per key across all concurrent callers (blocking)."""
+        while True:
+            fut, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return fut.result()
+            except _LeaderCancelled:
+                continue
+
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._leave(key, fut)
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Async version of do(): await fn(*args) once per key."""
+        while True:
+            fut, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shield() so a cancelled waiter doesn't cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(fut))
+            except _LeaderCancelled:
+                continue
+
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            fut.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._leave(key, fut)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+            }
+
+
+_REGISTRY: dict[str, SingleFlight] = {}
+
+
+def single_flight_stats() -> dict[str, dict]:
+    """Counters for every SingleFlight group in this process, keyed by name."""
+    return {name: group.stats() for name, group in _REGISTRY.items()}
@@ -0,0 +1,102 @@
+"""Regression tests: preprocessing must never strip the customer's own request."""
+from preprocess import preprocess_email
+
+
+def _text(email: str) -> str:
+    return preprocess_email(email, record=False).text
+
+
+def test_unsubscribe_complaint_is_kept():
+    email = (
+        "Hi team,\n\n"
+        "I tried to unsubscribe from your premium plan last month but I was still "
+        "charged $49.99 on my card (TXN-5531). Please refund it.\n\n"
+        "Thanks,\nJohn Smith"
+    )
+    assert "$49.99" in _text(email)
+    assert "TXN-5531" in _text(email)
+
+
+def test_confidential_fraud_report_is_kept():
+    email = (
+        "Hi,\n\n"
+        "This message is confidential: I see an unauthorized $900 transaction on my "
+        "account that I never made. Please block my card.\n\n"
+        "Regards,\nAnna Lee"
+    )
+    assert "unauthorized $900" in _text(email)
+
+
+def test_only_paragraph_is_never_boilerplate():
+    email = (
+        "This email is confidential and intended only for your fraud team: "
+        "someone used my card for $1,200 at an online store."
+    )
+    assert "$1,200" in _text(email)
+
+
+def test_trailing_footer_is_removed():
+    email = (
+        "Hello,\n\n"
+        "My refund for order 4411 has not arrived after two weeks.\n\n"
+        "Thanks,\nRavi\n\n"
+        "This email and any attachments are confidential and intended solely for "
+        "the use of the individual to whom they are addressed.\n\n"
+        "Please consider the environment before printing this email."
+    )
+    result = preprocess_email(email, record=False)
+    assert "refund for order 4411" in result.text
+    assert "Ravi" in result.text
+    assert "confidential" not in result.text
+    assert "environment" not in result.text
+    assert "boilerplate" in result.removed
+
+
+def test_footer_wording_mid_email_is_kept():
+    email = (
+        "Hi,\n\n"
+        "Your newsletter says: to unsubscribe, click the link below.\n\n"
+        "I did, and you charged me $15 anyway. Please refund it.\n\n"
+        "Thanks,\nMaria"
+    )
+    assert "to unsubscribe" in _text(email)
+    assert "$15" in _text(email)
+
+
+def test_bare_dash_divider_is_not_a_signature():
+    email = (
+        "Hi,\n\nThese charges on my statement are not mine:\n"
+        "TXN-1001  $120.00\n--\nTXN-1002  $75.50\n--\nTXN-1003  $310.00\n\n"
+        "Please reverse them.\nPriya"
+    )
+    text = _text(email)
+    assert "TXN-1002" in text
+    assert "TXN-1003" in text
+    assert "Please reverse them." in text
+
+
+def test_long_block_after_delimiter_is_kept():
+    email = (
+        "Hi,\n\nMy card was declined twice today.\n-- \n"
+        + "\n".join(f"Attempt {n}: declined at 10:0{n} for $2{n}.00 at the grocery store" for n in range(8))
+    )
+    assert "Attempt 7" in _text(email)
+
+
+def test_rfc_signature_is_stripped_keeping_name():
+    email = (
+        "Hello,\n\nI was charged twice for order 7781 and need one refunded.\n\n"
+        "-- \nDavid Chen\nSenior Analyst, Acme Corp\n+1 555 0100\nwww.acme.example"
+    )
+    result = preprocess_email(email, record=False)
+    assert "charged twice for order 7781" in result.text
+    assert "David Chen" in result.text
+    assert "Senior Analyst" not in result.text
+    assert "signature" in result.removed
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,96 @@
+"""
+Per-request stage timing, reported as a Server-Timing response header.
+
+main.py's middleware opens a timing scope for every request; code on the
+request path wraps its expensive steps in stage("name"). The totals come
+back to the client as
+
+    Server-Timing: llm_analysis;dur=912.4, classifier;dur=233.0, db_commit;dur=4.1, total;dur=921.7
+
+so the benchmark (and browser dev tools) can see where the time went
+without any extra endpoint. Stages that run concurrently overlap — each
+one records its own wall time. The same totals feed the per-stage
+histograms on GET /metrics (metrics.py).
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Awaitable, TypeVar
+
+from metrics import STAGE_ERRORS
+
+T = TypeVar("T")
+
+# Stage name → accumulated milliseconds for the current request. The dict is
+# shared (not copied) by tasks and worker threads spawned from the request,
+# so their stages land in the same totals.
+_stages: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "stage_timings", default=None,
+)
+
+
+def begin() -> dict[str, float]:
+    """Start a fresh timing scope for the current request."""
+    stages: dict[str, float] = {}
+    _stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str):
+    """Add the wall time of the with-block to the current request's stage totals."""
+    stages = _stages.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+async def timed(name: str, awaitable: Awaitable[T]) -> T:
+    """Await something inside stage(name) — handy for create_task()."""
+    with stage(name):
+        return await awaitable
+
+
+def timed_call(name: str, fn, *args):
+    """Call fn(*args) inside stage(name)."""
+    with stage(name):
+        return fn(*args)
+
+
+def in_scope(fn, *args):
+    """
+    Bind fn(*args) to the current request's timing scope, for
+    executor.submit() — plain thread pools don't carry contextvars over.
+    """
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args)
+
+
+def server_timing_header(stages: dict[str, float], total_ms: float | None = None) -> str:
+    parts = [f"{name};dur={ms:.1f}" for name, ms in stages.items()]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def parse_server_timing(header: str) -> dict[str, float]:
+    """Inverse of server_timing_header() — name → milliseconds."""
+    stages: dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    stages[name] = stages.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return stages
+
@@ -0,0 +1,22 @@
+"""
+Cheap token-count estimates for Groq / Llama prompts.
+
+Llama 3 tokenisers average ~4 characters per token on English prose. The
+estimate is only used for budgeting (rate limiting, cost accounting), so
+a fast heuristic beats loading a real tokenizer.
+"""
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers / separators per chat message
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated token count of a piece of text (never less than 1 for non-empty text)."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(*messages: str) -> int:
+    """Estimated prompt tokens for a list of chat message contents."""
+    return sum(estimate_tokens(m) + MESSAGE_OVERHEAD_TOKENS for m in messages)
@@ -3,11 +3,24 @@ Advanced multi-tier email urgency classifier using the native Groq client.
 
 Architecture:
   • Model    : llama-3.1-8b-instant (fastest inference on Groq)
-  • Client   : Native groq SDK — zero LangChain overhead
+  • Client   : Native groq SDK — zero LangChain overhead (sync + AsyncGroq)
   • Temp     : 0.0 — deterministic, no sampling jitter
   • Tokens   : max_tokens=512 — room for detailed sub-category reasoning
-  • Caching  : SHA-256 in-memory dedup avoids redundant API calls
-  • Fallback : Graceful degradation to "Medium" on any API/timeout error
+  • Caching  : bounded LRU+TTL in memory, backed by a persistent SQLite store
+               shared across workers (keyed by email hash + model + prompt version)
+  • Dedup    : single-flight — identical in-flight requests share one call
+  • Limits   : shared per-model RPM/TPM token buckets (rate_limiter.py) —
+               requests queue for capacity instead of hitting 429s, and
+               Groq's x-ratelimit-* headers keep the buckets in sync
+  • Hedging  : optional duplicate request past the p95 deadline (hedging.py)
+  • Repair   : near-miss JSON fixed locally, else retried with jittered
+               backoff (json_repair.py)
+  • Fallback : Graceful degradation to "Medium" on any API/timeout error;
+               fails fast while the Groq circuit is open (circuit_breaker.py)
+  • Fast path: local weighted-phrase rules (urgency_rules.py), then a
+               model trained on past tickets (urgency_model.py); the LLM
+               only sees what neither is confident about
+  • Offline  : LLM_BACKEND=fake swaps in fake_llm.FakeGroq for load tests
 
 Taxonomy (3 urgency tiers × 11 sub-categories):
   HIGH   → Security_Breach, Fraud_Report, Transaction_Failure_Critical,
@@ -22,13 +35,28 @@ Author: Senior AI Engineer — HFT-grade classification pipeline
 import os
 import json
 import time
-import hashlib
 import logging
+from functools import partial
 from typing import TypedDict, Literal
 
-from groq import Groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
 
+from result_cache import ResultCache
+from persistent_cache import llm_store, make_key, prompt_version
+from single_flight import SingleFlight
+from rate_limiter import limiter, build_http_client, build_async_http_client
+from tokens import estimate_tokens, estimate_prompt_tokens
+from fake_llm import FAKE_LLM, FakeGroq, FakeAsyncGroq, cache_model
+from preprocess import preprocess_email
+from chunking import clip
+from usage import track, record_hit
+from circuit_breaker import groq_breaker
+from hedging import hedger, Attempt
+from json_repair import StructuredOutputError, loads as repair_loads, canonical, with_retries, awith_retries
+from urgency_rules import RulesClassifier, URGENCY_RULES_ENABLED, URGENCY_RULES_MIN_CONFIDENCE
+import urgency_model
+
 load_dotenv()
 
 logger = logging.getLogger("urgency_classifier")
@@ -40,6 +68,7 @@ MODEL = "llama-3.1-8b-instant"
 TEMPERATURE = 0.0
 MAX_TOKENS = 512
 TIMEOUT_SECONDS = 10  # hard deadline for the API call
+EXPECTED_OUTPUT_TOKENS = 120  # typical JSON verdict, for rate-limit budgeting
 
 # ─────────────────── Taxonomy ───────────────────
 
@@ -132,21 +161,47 @@ for _urg, _meta in URGENCY_TAXONOMY.items():
 # ─────────────────── Groq Client (singleton) ───────────────────
 
 _client: Groq | None = None
+_async_client: AsyncGroq | None = None
+
+
+def _require_api_key() -> None:
+    if not GROQ_API_KEY:
+        raise RuntimeError(
+            "GROQ_API_KEY is not set. "
+            "Add it to your .env file: GROQ_API_KEY=gsk_..."
+        )
 
 
 def _get_client() -> Groq:
     """Lazy-initialise the Groq client (one TCP pool for the process)."""
     global _client
+    if _client is None and FAKE_LLM:
+        _client = FakeGroq()
     if _client is None:
-        if not GROQ_API_KEY:
-            raise RuntimeError(
-                "GROQ_API_KEY is not set. "
-                "Add it to your .env file: GROQ_API_KEY=gsk_..."
-            )
-        _client = Groq(api_key=GROQ_API_KEY, timeout=TIMEOUT_SECONDS)
+        _require_api_key()
+        _client = Groq(
+            api_key=GROQ_API_KEY,
+            timeout=TIMEOUT_SECONDS,
+            http_client=build_http_client(),  # reports quota headers to the limiter
+        )
     return _client
 
 
+def _get_async_client() -> AsyncGroq:
+    """Lazy-initialise the AsyncGroq client used by aclassify_urgency()."""
+    global _async_client
+    if _async_client is None and FAKE_LLM:
+        _async_client = FakeAsyncGroq()
+    if _async_client is None:
+        _require_api_key()
+        _async_client = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            timeout=TIMEOUT_SECONDS,
+            http_client=build_async_http_client(),
+        )
+    return _async_client
+
+
 # ─────────────────── System Prompt ───────────────────
 
 def _build_system_prompt() -> str:
@@ -214,13 +269,57 @@ class UrgencyResult(TypedDict):
     sla: str            # "Immediate" | "24 hours" | "48 hours"
 
 
-# ─────────────────── In-memory Cache ───────────────────
+# ─────────────────── Result Cache ───────────────────
+# In-memory LRU + TTL first, then the persistent store shared by all workers.
+# Fallback results (API / parse errors) are never cached.
+
+_cache = ResultCache("urgency_classifier")
 
-_cache: dict[str, UrgencyResult] = {}
+# Concurrent callers classifying the same email share one API call.
+_flight = SingleFlight("urgency_classifier")
+
+_CACHE_NS = "classify_urgency"
+_USER_TEMPLATE = "Classify this customer email:\n\n{email}"
+_PROMPT_VERSION = prompt_version(SYSTEM_PROMPT, _USER_TEMPLATE)
 
 
 def _cache_key(text: str) -> str:
-    return hashlib.sha256(text.strip().encode()).hexdigest()
+    return make_key(_CACHE_NS, cache_model(MODEL), _PROMPT_VERSION, text.strip())
+
+
+def _cache_get(key: str) -> UrgencyResult | None:
+    cached = _cache.get(key)
+    if cached is None:
+        stored = llm_store.get(key)
+        if stored is not None:
+            cached = UrgencyResult(**json.loads(stored))
+            _cache.set(key, cached)
+    if cached is not None:
+        record_hit(_CACHE_NS, cache_model(MODEL))
+    return cached
+
+
+def _cache_put(key: str, result: UrgencyResult) -> None:
+    _cache.set(key, result)
+    llm_store.set(key, json.dumps(result), _CACHE_NS, cache_model(MODEL), _PROMPT_VERSION)
+
+
+async def _acache_get(key: str) -> UrgencyResult | None:
+    """_cache_get() with the disk lookup off the event loop."""
+    cached = _cache.get(key)
+    if cached is None:
+        stored = await llm_store.aget(key)
+        if stored is not None:
+            cached = UrgencyResult(**json.loads(stored))
+            _cache.set(key, cached)
+    if cached is not None:
+        record_hit(_CACHE_NS, cache_model(MODEL))
+    return cached
+
+
+async def _acache_put(key: str, result: UrgencyResult) -> None:
+    _cache.set(key, result)
+    await llm_store.aset(key, json.dumps(result), _CACHE_NS, cache_model(MODEL), _PROMPT_VERSION)
 
 
 # ─────────────────── Fallback ───────────────────
@@ -237,25 +336,20 @@ _FALLBACK: UrgencyResult = {
 def _parse_response(raw: str) -> UrgencyResult:
     """
     Parse the LLM response into a validated UrgencyResult.
-    Strips any stray markdown fences the model might add.
+    Markdown fences, trailing prose and truncated JSON are repaired locally
+    (json_repair.py); StructuredOutputError if that is not enough.
     """
-    text = raw.strip()
-    # Strip ```json ... ``` wrapper if the model ignores instructions
-    if text.startswith("```"):
-        text = text.split("\n", 1)[-1]
-    if text.endswith("```"):
-        text = text.rsplit("```", 1)[0]
-    text = text.strip()
-
-    data = json.loads(text)
-
-    # Validate urgency
-    urgency = data.get("urgency", "Medium")
+    data = repair_loads(raw.strip(), _CACHE_NS)
+    if not isinstance(data, dict):
+        raise StructuredOutputError("validation", f"expected a JSON object, got {type(data).__name__}")
+
+    # Validate urgency — "high" / "HIGH" count as High
+    urgency = canonical(data.get("urgency", "Medium"), ("High", "Medium", "Low"))
     if urgency not in ("High", "Medium", "Low"):
         urgency = "Medium"
 
     # Validate subcategory — cross-check against taxonomy
-    subcategory = data.get("subcategory", "")
+    subcategory = canonical(data.get("subcategory", ""), _VALID_SUBCATEGORIES)
     if subcategory not in _VALID_SUBCATEGORIES:
         # Try to infer from urgency level — pick first subcategory
         tier_subcats = list(URGENCY_TAXONOMY[urgency]["subcategories"].keys())
@@ -285,61 +379,296 @@ def _parse_response(raw: str) -> UrgencyResult:
     )
 
 
+# ─────────────────── Local fast path ───────────────────
+
+_rules = RulesClassifier(URGENCY_TAXONOMY)
+
+# Which tier answered each classify_urgency() call (cache hits count as "llm")
+_tier_counts = {"rules": 0, "model": 0, "llm": 0}
+
+
+def _rules_result(clean: str, count: bool = True) -> UrgencyResult | None:
+    """Rule-based verdict if it is confident enough to skip the LLM."""
+    if not URGENCY_RULES_ENABLED:
+        return None
+    verdict = _rules.classify(clean)
+    if verdict is None or verdict.confidence < URGENCY_RULES_MIN_CONFIDENCE:
+        return None
+    if count:
+        _tier_counts["rules"] += 1
+    return UrgencyResult(
+        urgency=verdict.urgency,
+        subcategory=verdict.subcategory,
+        confidence=verdict.confidence,
+        reasoning=f"Rule match: {', '.join(verdict.matched[:3])}.",
+        sla=URGENCY_TAXONOMY[verdict.urgency]["sla"],
+    )
+
+
+def _model_result(clean: str, count: bool = True) -> UrgencyResult | None:
+    """Local model verdict if one is trained and confident enough."""
+    try:
+        verdict = urgency_model.predict(clean)
+    except Exception as exc:
+        logger.warning("Urgency model prediction failed: %s", exc)
+        return None
+    if verdict is None or verdict.confidence < urgency_model.URGENCY_MODEL_MIN_CONFIDENCE:
+        return None
+    if count:
+        _tier_counts["model"] += 1
+    return UrgencyResult(
+        urgency=verdict.urgency,
+        subcategory=verdict.subcategory,
+        confidence=verdict.confidence,
+        reasoning=f"Local model {verdict.version} ({verdict.confidence:.0%} {verdict.urgency}).",
+        sla=URGENCY_TAXONOMY[verdict.urgency]["sla"],
+    )
+
+
+def _local_result(clean: str) -> UrgencyResult | None:
+    """Rules first, then the trained model — None means ask the LLM."""
+    return _rules_result(clean) or _model_result(clean)
+
+
+def local_verdict(email_text: str) -> UrgencyResult | None:
+    """
+    Confident local (rules / trained model) verdict without calling the
+    LLM or counting towards classifier_stats() — used by agent.py's model
+    router as a pre-classification.
+    """
+    clean = (email_text or "").strip()
+    if not clean:
+        return None
+    return _rules_result(clean, count=False) or _model_result(clean, count=False)
+
+
+def offline_verdict(email_text: str) -> UrgencyResult:
+    """
+    Best local guess at any confidence — rules, then the trained model,
+    then the Medium fallback. Never calls the LLM; used by agent.py's
+    degraded mode while the Groq circuit is open.
+    """
+    clean = (email_text or "").strip()
+    verdict = _rules.classify(clean) if clean else None
+    source = "Rule match (degraded mode)"
+    if verdict is None and clean:
+        try:
+            verdict = urgency_model.predict(clean)
+            source = "Local model (degraded mode)"
+        except Exception as exc:
+            logger.warning("Urgency model prediction failed: %s", exc)
+    if verdict is None:
+        return {**_FALLBACK, "reasoning": "LLM unavailable and no local match — defaulted to Medium."}
+    return UrgencyResult(
+        urgency=verdict.urgency,
+        subcategory=verdict.subcategory,
+        confidence=verdict.confidence,
+        reasoning=f"{source}, {verdict.confidence:.0%} confidence.",
+        sla=URGENCY_TAXONOMY[verdict.urgency]["sla"],
+    )
+
+
+def classifier_stats() -> dict:
+    """How many classifications each tier answered, plus the local tiers' settings."""
+    total = sum(_tier_counts.values())
+    return {
+        "tiers": dict(_tier_counts),
+        "llm_share": round(_tier_counts["llm"] / total, 4) if total else 0.0,
+        "rules_enabled": URGENCY_RULES_ENABLED,
+        "rules_min_confidence": URGENCY_RULES_MIN_CONFIDENCE,
+        "model": urgency_model.model_info(),
+    }
+
+
 # ─────────────────── Public API ───────────────────
 
+_PROMPT_TOKENS = estimate_prompt_tokens(SYSTEM_PROMPT, _USER_TEMPLATE)
+
+
+def _request_tokens(clean: str) -> int:
+    return _PROMPT_TOKENS + estimate_tokens(clean) + EXPECTED_OUTPUT_TOKENS
+
+
+def request_tokens(email_text: str) -> int:
+    """Estimated tokens of an LLM classifier call for this email (resolution policy's queue check)."""
+    return _request_tokens(clip(preprocess_email(email_text or "", record=False).text))
+
+
+def _build_messages(clean: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": _USER_TEMPLATE.format(email=clean)},
+    ]
+
+
+def _error_result(exc: Exception) -> UrgencyResult:
+    """Map an API / parse failure to the Medium fallback."""
+    if isinstance(exc, StructuredOutputError):
+        logger.warning("Urgency classifier JSON parse error: %s", exc)
+        return {**_FALLBACK, "reasoning": f"JSON parse error — defaulted to Medium. ({exc})"}
+    logger.warning("Urgency classifier API error: %s", exc)
+    return {**_FALLBACK, "reasoning": f"API error — defaulted to Medium. ({type(exc).__name__})"}
+
+
+def _log_result(result: UrgencyResult, t0: float) -> None:
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    logger.info(
+        "Urgency classified in %.0f ms → %s / %s (%.2f)",
+        elapsed_ms, result["urgency"], result["subcategory"], result["confidence"],
+    )
+
+
+def _record_usage(call, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        call.set_tokens(usage.prompt_tokens, usage.completion_tokens)
+    else:
+        call.set_output(response.choices[0].message.content or "")
+
+
+def _request(clean: str, tokens: int) -> UrgencyResult:
+    """One classifier call, accounted in the usage log. Raises on API / parse errors."""
+    with track(_CACHE_NS, cache_model(MODEL), tokens - EXPECTED_OUTPUT_TOKENS) as call:
+        client = _get_client()
+        with groq_breaker.guard():
+            limiter.acquire(MODEL, tokens)
+            call.started()
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=_build_messages(clean),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                stream=False,
+            )
+        _record_usage(call, response)
+        return _parse_response(response.choices[0].message.content or "")
+
+
+async def _arequest(clean: str, tokens: int) -> UrgencyResult:
+    """Async version of _request() on the AsyncGroq client."""
+    with track(_CACHE_NS, cache_model(MODEL), tokens - EXPECTED_OUTPUT_TOKENS) as call:
+        client = _get_async_client()
+        with groq_breaker.guard():
+            await limiter.aacquire(MODEL, tokens)
+            call.started()
+            response = await client.chat.completions.create(
+                model=MODEL,
+                messages=_build_messages(clean),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                stream=False,
+            )
+        _record_usage(call, response)
+        return _parse_response(response.choices[0].message.content or "")
+
+
+def _call_classifier(clean: str, key: str) -> UrgencyResult:
+    """Single-flight leader body: re-check the cache, then call Groq (hedged when enabled)."""
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    t0 = time.perf_counter()
+    tokens = _request_tokens(clean)
+    # Already on the smallest model — a hedge is the same request again.
+    # Output that json_repair cannot fix is re-requested with backoff.
+    attempt = Attempt(MODEL, tokens, partial(with_retries, _CACHE_NS, partial(_request, clean, tokens)))
+    try:
+        result, _ = hedger.run(_CACHE_NS, attempt, attempt)
+    except Exception as exc:
+        result = _error_result(exc)
+        _log_result(result, t0)
+        return result
+
+    _log_result(result, t0)
+
+    # ── Cache store ──
+    _cache_put(key, result)
+    return result
+
+
+async def _acall_classifier(clean: str, key: str) -> UrgencyResult:
+    """Async version of _call_classifier() on the AsyncGroq client."""
+    cached = await _acache_get(key)
+    if cached is not None:
+        return cached
+
+    t0 = time.perf_counter()
+    tokens = _request_tokens(clean)
+    attempt = Attempt(MODEL, tokens, partial(awith_retries, _CACHE_NS, partial(_arequest, clean, tokens)))
+    try:
+        result, _ = await hedger.arun(_CACHE_NS, attempt, attempt)
+    except Exception as exc:
+        result = _error_result(exc)
+        _log_result(result, t0)
+        return result
+
+    _log_result(result, t0)
+
+    await _acache_put(key, result)
+    return result
+
+
 def classify_urgency(email_text: str) -> UrgencyResult:
     """
     Classify the urgency of a finance support email.
 
     Returns a dict with keys: urgency, subcategory, confidence, reasoning, sla.
     Uses 3-tier taxonomy with 12 sub-categories for precise triage.
+    Confident local verdicts (rules, then the trained model) return
+    without calling the LLM.
     Falls back to Medium urgency on any error.
     """
     if not email_text or not email_text.strip():
         return {**_FALLBACK, "reasoning": "Empty email body — defaulted to Medium."}
 
-    clean = email_text.strip()
+    # Trimmed like the agent's prompt (already counted there); huge bodies keep head + tail
+    clean = clip(preprocess_email(email_text, record=False).text)
+
+    # ── Obvious cases → local rules / model, no API call ──
+    fast = _local_result(clean)
+    if fast is not None:
+        return fast
+    _tier_counts["llm"] += 1
+
     key = _cache_key(clean)
 
     # ── Cache hit → instant return ──
-    if key in _cache:
+    cached = _cache_get(key)
+    if cached is not None:
         logger.debug("Urgency cache hit for key=%s", key[:12])
-        return _cache[key]
+        return cached
 
-    # ── API call ──
-    t0 = time.perf_counter()
-    try:
-        client = _get_client()
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Classify this customer email:\n\n{clean}"},
-            ],
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            stream=False,
-        )
-        raw = response.choices[0].message.content or ""
-        result = _parse_response(raw)
+    # ── API call (shared with any concurrent caller for the same email) ──
+    return _flight.do(key, _call_classifier, clean, key)
 
-    except json.JSONDecodeError as exc:
-        logger.warning("Urgency classifier JSON parse error: %s", exc)
-        result = {**_FALLBACK, "reasoning": f"JSON parse error — defaulted to Medium. ({exc})"}
 
-    except Exception as exc:
-        logger.warning("Urgency classifier API error: %s", exc)
-        result = {**_FALLBACK, "reasoning": f"API error — defaulted to Medium. ({type(exc).__name__})"}
+async def aclassify_urgency(email_text: str) -> UrgencyResult:
+    """
+    Async version of classify_urgency() on the AsyncGroq client.
 
-    elapsed_ms = (time.perf_counter() - t0) * 1000
-    logger.info(
-        "Urgency classified in %.0f ms → %s / %s (%.2f)",
-        elapsed_ms, result["urgency"], result["subcategory"], result["confidence"],
-    )
+    Same local fast path, cache, single-flight group, parsing and Medium
+    fallback as the sync path.
+    """
+    if not email_text or not email_text.strip():
+        return {**_FALLBACK, "reasoning": "Empty email body — defaulted to Medium."}
 
-    # ── Cache store ──
-    _cache[key] = result
-    return result
+    # Trimmed like the agent's prompt (already counted there); huge bodies keep head + tail
+    clean = clip(preprocess_email(email_text, record=False).text)
+
+    fast = _local_result(clean)
+    if fast is not None:
+        return fast
+    _tier_counts["llm"] += 1
+
+    key = _cache_key(clean)
+
+    cached = await _acache_get(key)
+    if cached is not None:
+        logger.debug("Urgency cache hit for key=%s", key[:12])
+        return cached
+
+    return await _flight.ado(key, _acall_classifier, clean, key)
 
 
 # ─────────────────── Helper: Map subcategory → parent category ───────────────────
@@ -0,0 +1,339 @@
+"""
+Locally trained urgency model — learned from historical tickets.
+
+The tickets table already holds the final priority + category of every
+email we have processed. This module turns that history into a tiny
+linear classifier that answers in well under a millisecond on CPU:
+
+  • Features : hashing vectorizer over lower-cased unigrams + bigrams
+               (2^URGENCY_MODEL_DIM_BITS buckets, sublinear TF, L2-normalised)
+               — no vocabulary to store or keep in sync
+  • Model    : multinomial logistic regression over the 9 joint
+               priority|category labels, trained with full-batch gradient
+               descent in NumPy
+  • Runtime  : classify_urgency() asks the rules first, then this model,
+               and calls Groq only below URGENCY_MODEL_MIN_CONFIDENCE
+
+Artefacts are versioned on disk:
+
+    <URGENCY_MODEL_DIR>/urgency-20260118T101500.npz
+    <URGENCY_MODEL_DIR>/LATEST          ← name of the artefact to serve
+
+and loaded lazily on first use (main.py warms it up at startup).
+
+Train / retrain:
+    python urgency_model.py train
+    python urgency_model.py train --epochs 300 --closed-only
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+logger = logging.getLogger("urgency_model")
+
+_DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts", "urgency_model")
+
+URGENCY_MODEL_ENABLED = os.getenv("URGENCY_MODEL_ENABLED", "true").lower() == "true"
+URGENCY_MODEL_DIR = os.getenv("URGENCY_MODEL_DIR", _DEFAULT_DIR)
+URGENCY_MODEL_MIN_CONFIDENCE = float(os.getenv("URGENCY_MODEL_MIN_CONFIDENCE", "0.9"))
+URGENCY_MODEL_DIM_BITS = int(os.getenv("URGENCY_MODEL_DIM_BITS", "16"))
+
+PRIORITIES = ("High", "Medium", "Low")
+CATEGORIES = ("Fraud", "Payment Issue", "General")
+LABELS = tuple(f"{p}|{c}" for p in PRIORITIES for c in CATEGORIES)
+
+# Tickets carry priority + category, not the classifier's sub-category, so
+# each joint label maps to a sub-category under the label's own category —
+# callers derive the category back from it (get_parent_category()). Same
+# urgency tier where the taxonomy has one for that category, else the
+# nearest: Fraud only has High sub-categories, General none.
+LABEL_SUBCATEGORY = {
+    "High|Fraud": "Fraud_Report",
+    "High|Payment Issue": "Transaction_Failure_Critical",
+    "High|General": "Feature_Malfunction",
+    "Medium|Fraud": "Fraud_Report",
+    "Medium|Payment Issue": "Dispute_Initiation",
+    "Medium|General": "Feature_Malfunction",
+    "Low|Fraud": "Fraud_Report",
+    "Low|Payment Issue": "Dispute_Initiation",
+    "Low|General": "General_Inquiry",
+}
+
+_TOKEN = re.compile(r"[a-z0-9$']+")
+
+
+# ────────────────────── Features ──────────────────────
+
+def featurize(text: str, dim_bits: int) -> tuple[np.ndarray, np.ndarray]:
+    """Hashed unigram + bigram features → (bucket indices, L2-normalised weights)."""
+    tokens = _TOKEN.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    mask = (1 << dim_bits) - 1
+    buckets = np.fromiter((zlib.crc32(g.encode()) & mask for g in grams), dtype=np.int64, count=len(grams))
+    idx, counts = np.unique(buckets, return_counts=True)
+    values = 1.0 + np.log(counts.astype(np.float32))  # sublinear TF
+    values /= np.linalg.norm(values)
+    return idx, values.astype(np.float32)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    z = logits - logits.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+@dataclass(frozen=True)
+class ModelVerdict:
+    urgency: str
+    subcategory: str
+    confidence: float
+    version: str
+
+
+class UrgencyModel:
+    """Linear softmax classifier over hashed text features."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, dim_bits: int, version: str, meta: dict | None = None):
+        self.weights = weights      # (2**dim_bits, len(LABELS)) float32
+        self.bias = bias            # (len(LABELS),) float32
+        self.dim_bits = dim_bits
+        self.version = version
+        self.meta = meta or {}
+
+    def probabilities(self, text: str) -> np.ndarray:
+        idx, values = featurize(text, self.dim_bits)
+        return _softmax(values @ self.weights[idx] + self.bias)
+
+    def predict(self, text: str) -> ModelVerdict:
+        """
+        Urgency = most probable priority (summed over categories); its
+        probability is the confidence. The sub-category comes from the
+        most probable category within that priority.
+        """
+        probs = self.probabilities(text).reshape(len(PRIORITIES), len(CATEGORIES))
+        by_priority = probs.sum(axis=1)
+        p = int(by_priority.argmax())
+        c = int(probs[p].argmax())
+        label = f"{PRIORITIES[p]}|{CATEGORIES[c]}"
+        return ModelVerdict(
+            urgency=PRIORITIES[p],
+            subcategory=LABEL_SUBCATEGORY[label],
+            confidence=round(float(by_priority[p]), 3),
+            version=self.version,
+        )
+
+    # ── Persistence ──
+
+    def save(self, directory: str = URGENCY_MODEL_DIR) -> str:
+        """Write a new versioned artefact and point LATEST at it. Returns its path."""
+        os.makedirs(directory, exist_ok=True)
+        filename = f"urgency-{self.version}.npz"
+        path = os.path.join(directory, filename)
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            dim_bits=np.array(self.dim_bits),
+            labels=np.array(LABELS),
+            meta=np.array(json.dumps(self.meta)),
+        )
+        latest_tmp = os.path.join(directory, "LATEST.tmp")
+        with open(latest_tmp, "w") as f:
+            f.write(filename)
+        os.replace(latest_tmp, os.path.join(directory, "LATEST"))  # atomic switch
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "UrgencyModel":
+        with np.load(path) as data:
+            if tuple(data["labels"].tolist()) != LABELS:
+                raise ValueError(f"{path} was trained for different labels")
+            version = os.path.basename(path).removeprefix("urgency-").removesuffix(".npz")
+            return cls(
+                weights=data["weights"].astype(np.float32),
+                bias=data["bias"].astype(np.float32),
+                dim_bits=int(data["dim_bits"]),
+                version=version,
+                meta=json.loads(str(data["meta"])),
+            )
+
+
+# ────────────────────── Runtime (lazy singleton) ──────────────────────
+
+_model: UrgencyModel | None = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_model() -> UrgencyModel | None:
+    """The artefact named in LATEST, loaded on first call. None if there is none."""
+    global _model, _loaded
+    if _loaded or not URGENCY_MODEL_ENABLED:
+        return _model
+    with _load_lock:
+        if not _loaded:
+            latest = os.path.join(URGENCY_MODEL_DIR, "LATEST")
+            try:
+                with open(latest) as f:
+                    _model = UrgencyModel.load(os.path.join(URGENCY_MODEL_DIR, f.read().strip()))
+                logger.info("Urgency model %s loaded", _model.version)
+            except FileNotFoundError:
+                logger.info("No urgency model in %s — using rules + LLM only", URGENCY_MODEL_DIR)
+            except Exception as exc:
+                logger.warning("Urgency model failed to load (%s) — using rules + LLM only", exc)
+            _loaded = True
+    return _model
+
+
+def predict(text: str) -> ModelVerdict | None:
+    """Model verdict for an email, or None when no model is available."""
+    model = get_model()
+    return model.predict(text) if model is not None else None
+
+
+def model_info() -> dict:
+    return {
+        "enabled": URGENCY_MODEL_ENABLED,
+        "loaded": _model is not None,
+        "version": _model.version if _model else None,
+        "min_confidence": URGENCY_MODEL_MIN_CONFIDENCE,
+        "trained_on": _model.meta.get("examples") if _model else None,
+        "holdout_accuracy": _model.meta.get("holdout_priority_accuracy") if _model else None,
+    }
+
+
+# ────────────────────── Training ──────────────────────
+
+def train(
+    texts: list[str],
+    labels: list[str],
+    dim_bits: int = URGENCY_MODEL_DIM_BITS,
+    epochs: int = 200,
+    learning_rate: float = 2.0,
+    l2: float = 1e-4,
+    holdout: float = 0.1,
+    seed: int = 0,
+) -> UrgencyModel:
+    """Fit the softmax regression; holds out a slice to report accuracy."""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(texts))
+    n_holdout = int(len(texts) * holdout)
+    test_ids, train_ids = order[:n_holdout], order[n_holdout:]
+
+    # Sparse design matrix in CSR-like arrays
+    rows, cols, vals = [], [], []
+    for r, i in enumerate(train_ids):
+        idx, values = featurize(texts[i], dim_bits)
+        rows.append(np.full(len(idx), r, dtype=np.int64))
+        cols.append(idx)
+        vals.append(values)
+    rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+    label_index = {label: k for k, label in enumerate(LABELS)}
+    y = np.zeros((len(train_ids), len(LABELS)), dtype=np.float32)
+    y[np.arange(len(train_ids)), [label_index[labels[i]] for i in train_ids]] = 1.0
+
+    weights = np.zeros((1 << dim_bits, len(LABELS)), dtype=np.float32)
+    bias = np.zeros(len(LABELS), dtype=np.float32)
+    n = len(train_ids)
+
+    for _ in range(epochs):
+        logits = np.zeros((n, len(LABELS)), dtype=np.float32)
+        np.add.at(logits, rows, vals[:, None] * weights[cols])
+        error = (_softmax(logits + bias) - y) / n
+        grad = np.zeros_like(weights)
+        np.add.at(grad, cols, vals[:, None] * error[rows])
+        weights -= learning_rate * (grad + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+
+    version = time.strftime("%Y%m%dT%H%M%S")
+    model = UrgencyModel(weights, bias, dim_bits, version)
+
+    meta = {"examples": int(n), "epochs": epochs, "dim_bits": dim_bits}
+    if n_holdout:
+        hits = sum(model.predict(texts[i]).urgency == labels[i].split("|")[0] for i in test_ids)
+        meta["holdout_examples"] = int(n_holdout)
+        meta["holdout_priority_accuracy"] = round(hits / n_holdout, 4)
+    model.meta = meta
+    return model
+
+
+# agent.DEGRADED_MODEL — not imported, so training doesn't load LangChain
+_DEGRADED_MODEL = "degraded:rules"
+
+
+def _load_training_data(closed_only: bool) -> tuple[list[str], list[str]]:
+    """
+    Labelled (email, priority|category) pairs from the tickets table.
+    Degraded-mode tickets are left out: their labels came from the rules
+    (or from this model), and learning from them would feed the model its
+    own guesses. Bodies go through the same preprocess_email() + clip() as
+    the classifier's input at serve time.
+    """
+    from sqlalchemy import or_
+    from database import SessionLocal
+    from models import Ticket, TicketStatus
+    from preprocess import preprocess_email
+    from chunking import clip
+
+    db = SessionLocal()
+    try:
+        query = db.query(Ticket.email_body, Ticket.priority, Ticket.category).filter(
+            Ticket.needs_reanalysis.is_(False),
+            or_(Ticket.model_used.is_(None), Ticket.model_used != _DEGRADED_MODEL),
+        )
+        if closed_only:
+            query = query.filter(Ticket.status.in_([TicketStatus.RESOLVED, TicketStatus.CLOSED]))
+        rows = query.all()
+    finally:
+        db.close()
+    texts = [clip(preprocess_email(body, record=False).text) for body, _, _ in rows]
+    labels = [f"{priority.value}|{category.value}" for _, priority, category in rows]
+    return texts, labels
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train the local urgency model from the tickets table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    t = sub.add_parser("train", help="Train a new model version and make it LATEST")
+    t.add_argument("--epochs", type=int, default=200)
+    t.add_argument("--learning-rate", type=float, default=2.0)
+    t.add_argument("--l2", type=float, default=1e-4)
+    t.add_argument("--dim-bits", type=int, default=URGENCY_MODEL_DIM_BITS)
+    t.add_argument("--min-examples", type=int, default=200, help="Refuse to train on fewer tickets")
+    t.add_argument("--closed-only", action="store_true", help="Only learn from Resolved/Closed tickets")
+    t.add_argument("--output-dir", default=URGENCY_MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    texts, labels = _load_training_data(args.closed_only)
+    if len(texts) < args.min_examples:
+        print(f"❌ Only {len(texts)} labelled ticket(s) — need at least {args.min_examples}.")
+        return 1
+
+    print(f"🧠 Training on {len(texts)} ticket(s)...")
+    t0 = time.perf_counter()
+    model = train(
+        texts, labels,
+        dim_bits=args.dim_bits, epochs=args.epochs,
+        learning_rate=args.learning_rate, l2=args.l2,
+    )
+    path = model.save(args.output_dir)
+    print(f"✅ Saved {path} in {time.perf_counter() - t0:.1f}s")
+    print(f"   {json.dumps(model.meta)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
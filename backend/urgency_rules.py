@@ -0,0 +1,191 @@
+"""
+Local rule-based pre-classifier for email urgency.
+
+Plenty of emails say exactly what they are ("my card was stolen", "please
+add dark mode"). Sending those to llama-3.1-8b-instant costs a request, a
+few hundred tokens and ~300 ms for an answer we could read off the text.
+
+  • Weighted phrases per taxonomy sub-category — hand-picked strong signals
+    plus the short example phrases already written in URGENCY_TAXONOMY
+  • One compiled, case-insensitive regex over all phrases (longest first)
+  • Confidence = logistic curve over the evidence: the winning
+    sub-category's score minus the best competing urgency tier's score.
+    Conflicting signals ("double charged" → Billing_Error or
+    Dispute_Initiation) pull confidence down so the LLM decides.
+
+classify_urgency() only trusts the result at or above
+URGENCY_RULES_MIN_CONFIDENCE; anything less falls through to the LLM.
+"""
+
+import os
+import re
+import math
+from dataclasses import dataclass
+
+URGENCY_RULES_ENABLED = os.getenv("URGENCY_RULES_ENABLED", "true").lower() == "true"
+URGENCY_RULES_MIN_CONFIDENCE = float(os.getenv("URGENCY_RULES_MIN_CONFIDENCE", "0.85"))
+
+# Logistic calibration: confidence = 1 / (1 + exp(-(SLOPE * evidence + OFFSET))).
+# Hand-tuned so one strong phrase (weight 3) with no competing signal lands
+# at ~0.88 and a single weak phrase or any cross-tier conflict stays well
+# below the default threshold.
+RULES_SLOPE = 1.5
+RULES_OFFSET = -2.5
+RULES_MAX_CONFIDENCE = 0.99
+_SAME_TIER_PENALTY = 0.5  # a rival sub-category in the same tier only blurs the sub-category
+
+# Strong signals, weight ≈ how much the phrase alone should move us.
+PHRASE_WEIGHTS: dict[str, dict[str, float]] = {
+    "Security_Breach": {
+        "hacked": 3, "account compromised": 3, "account has been compromised": 3,
+        "unauthorized login": 3, "unauthorised login": 3, "suspicious login": 2.5,
+        "someone logged into": 2.5, "login from an unknown": 2, "otp i didn't request": 3,
+        "otp i did not request": 3, "password was changed": 2.5, "password changed without": 3,
+        "phishing": 2,
+    },
+    "Fraud_Report": {
+        "stolen card": 3, "card was stolen": 3, "card stolen": 3, "card has been stolen": 3,
+        "was stolen": 2.5,
+        "unauthorized charge": 3, "unauthorized charges": 3, "unauthorised charge": 3,
+        "unauthorized transaction": 3, "unauthorized transactions": 3,
+        "unauthorized purchase": 3, "unauthorized purchases": 3,
+        "unrecognized transaction": 2.5, "unrecognised transaction": 2.5,
+        "don't recognize": 2, "do not recognize": 2, "identity theft": 3, "cloned": 2.5,
+        "fraudulent": 2.5, "fraud": 2, "i did not make": 2, "i didn't make": 2,
+    },
+    "Transaction_Failure_Critical": {
+        "money deducted": 2, "money was deducted": 2, "amount debited": 2,
+        "money was debited": 2, "transfer failed": 2, "payment failed": 1.5,
+        "salary": 1, "refund not received": 3, "haven't received my refund": 3,
+        "have not received my refund": 3, "refund not credited": 3,
+        "payment stuck": 2.5, "stuck in limbo": 2.5,
+    },
+    "Account_Lockout": {
+        "locked out": 2.5, "account locked": 2.5, "account is locked": 2.5,
+        "account frozen": 2.5, "account is frozen": 2.5, "frozen account": 2.5,
+        "can't access my funds": 2.5, "cannot access my funds": 2.5,
+        "can't access my money": 2.5, "rent is due": 1.5,
+    },
+    "Billing_Error": {
+        "cancelled subscription": 2, "canceled subscription": 2, "after i cancelled": 2.5,
+        "after cancelling": 2.5, "still being charged": 2.5, "still charged": 2,
+        "incorrect fee": 2, "wrong fee": 2, "double charged": 1.5, "charged twice": 1.5,
+    },
+    "Dispute_Initiation": {
+        "dispute": 2.5, "chargeback": 3, "overcharged": 2, "overcharge": 2,
+        "double charged": 1.5, "charged twice": 1.5,
+    },
+    "Feature_Malfunction": {
+        "app crashes": 2.5, "keeps crashing": 2.5, "crashing": 2, "not working": 1.5,
+        "error message": 1.5, "bug": 2, "can't download": 2, "won't load": 2,
+    },
+    "KYC_Compliance": {
+        "kyc": 3, "document rejected": 2.5, "documents rejected": 2.5,
+        "verification pending": 2.5, "id verification": 2.5, "verify my identity": 2,
+        "compliance hold": 3, "passport": 1.5,
+    },
+    "General_Inquiry": {
+        "interest rate": 2.5, "interest rates": 2.5, "how do i": 1.5, "how can i": 1.5,
+        "eligible": 2, "eligibility": 2, "do you support": 2,
+    },
+    "Statement_Request": {
+        "account statement": 2.5, "bank statement": 2.5, "tax certificate": 3,
+        "transaction history": 2.5, "audit": 1.5,
+    },
+    "Feedback_Feature_Request": {
+        "dark mode": 3, "feature request": 3, "suggestion": 2, "would be great if": 2,
+        "feedback": 2, "love the app": 2.5, "compliment": 2.5,
+    },
+    "Status_Check": {
+        "card delivery": 2.5, "when will my card arrive": 3, "application status": 2.5,
+        "status of my": 2, "track my": 1.5, "refund processing": 2,
+    },
+}
+
+TAXONOMY_PHRASE_WEIGHT = 1.0
+_MAX_TAXONOMY_PHRASE_WORDS = 4
+
+
+@dataclass(frozen=True)
+class RulesVerdict:
+    urgency: str
+    subcategory: str
+    confidence: float
+    matched: tuple[str, ...]
+
+
+def _taxonomy_phrases(taxonomy: dict) -> dict[str, list[str]]:
+    """Short example phrases from the taxonomy descriptions, per sub-category."""
+    phrases: dict[str, list[str]] = {}
+    for meta in taxonomy.values():
+        for subcat, description in meta["subcategories"].items():
+            text = description.split("NOTE:")[0]
+            text = re.sub(r"\([^)]*\)", " ", text)
+            found = []
+            for part in re.split(r"[,.]", text):
+                phrase = " ".join(part.lower().split())
+                if phrase.startswith("or "):
+                    phrase = phrase[3:]
+                if phrase and len(phrase.split()) <= _MAX_TAXONOMY_PHRASE_WORDS:
+                    found.append(phrase)
+            phrases[subcat] = found
+    return phrases
+
+
+class RulesClassifier:
+    """Weighted phrase matcher compiled into a single regex."""
+
+    def __init__(self, taxonomy: dict):
+        self._tier = {
+            subcat: urgency
+            for urgency, meta in taxonomy.items()
+            for subcat in meta["subcategories"]
+        }
+        self._tier_rank = {urgency: rank for rank, urgency in enumerate(taxonomy)}  # High first
+
+        # phrase → [(subcategory, weight), ...]
+        self._phrases: dict[str, list[tuple[str, float]]] = {}
+        for subcat, weights in PHRASE_WEIGHTS.items():
+            for phrase, weight in weights.items():
+                self._phrases.setdefault(phrase.lower(), []).append((subcat, float(weight)))
+        for subcat, phrases in _taxonomy_phrases(taxonomy).items():
+            for phrase in phrases:
+                targets = self._phrases.setdefault(phrase, [])
+                if all(s != subcat for s, _ in targets):
+                    targets.append((subcat, TAXONOMY_PHRASE_WEIGHT))
+
+        alternation = "|".join(
+            r"\s+".join(re.escape(word) for word in phrase.split())
+            for phrase in sorted(self._phrases, key=len, reverse=True)
+        )
+        self._pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+
+    def classify(self, text: str) -> RulesVerdict | None:
+        """Best sub-category with a calibrated confidence, or None if nothing matched."""
+        matched = {" ".join(m.group().lower().split()) for m in self._pattern.finditer(text)}
+        if not matched:
+            return None
+
+        scores: dict[str, float] = {}
+        for phrase in matched:
+            for subcat, weight in self._phrases.get(phrase, ()):
+                scores[subcat] = scores.get(subcat, 0.0) + weight
+
+        # Highest score wins; ties go to the more urgent tier (same rule as the LLM prompt)
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], self._tier_rank[self._tier[item[0]]]),
+        )
+        best, best_score = ranked[0]
+        urgency = self._tier[best]
+        other_tier = max((s for sc, s in ranked[1:] if self._tier[sc] != urgency), default=0.0)
+        same_tier = max((s for sc, s in ranked[1:] if self._tier[sc] == urgency), default=0.0)
+
+        evidence = best_score - other_tier - _SAME_TIER_PENALTY * same_tier
+        confidence = 1 / (1 + math.exp(-(RULES_SLOPE * evidence + RULES_OFFSET)))
+        return RulesVerdict(
+            urgency=urgency,
+            subcategory=best,
+            confidence=round(min(confidence, RULES_MAX_CONFIDENCE), 3),
+            matched=tuple(sorted(p for p in matched if any(s == best for s, _ in self._phrases[p]))),
+        )
@@ -0,0 +1,309 @@
+"""
+Token and latency accounting for every LLM call.
+
+Each agent / classifier / summary call — and each cache hit that stood in
+for one — becomes a row in the append-only llm_usage table:
+
+    model, operation, input/output tokens, latency, rate-limiter queue
+    time, cache hit|miss, outcome (ok / error / rate_limited / cancelled / circuit_open)
+
+Token counts come from the API's usage block (LangChain callback for the
+agent chains, response.usage for the native Groq client). When a backend
+doesn't report usage (LLM_BACKEND=fake, failed calls) the tokens.py
+estimates are stored instead and tokens_estimated is set.
+
+Rows are buffered in memory and written in one INSERT by a background
+thread every USAGE_FLUSH_SECONDS, so accounting never adds a database
+round trip to the request path. usage_report() aggregates the table per
+hour and per model for GET /usage.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from rate_limiter import RateLimitExceeded
+from circuit_breaker import CircuitOpenError
+from tokens import estimate_tokens
+from metrics import LLM_CALLS, LLM_TOKENS, LLM_SECONDS, LLM_QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+USAGE_TRACKING_ENABLED = os.getenv("USAGE_TRACKING_ENABLED", "true").lower() == "true"
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+USAGE_BUFFER_MAX = int(os.getenv("USAGE_BUFFER_MAX", "10000"))
+
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, RateLimitExceeded) or "429" in str(exc) or "rate_limit" in str(exc).lower():
+        return "rate_limited"
+    if isinstance(exc, (asyncio.CancelledError, asyncio.TimeoutError, TimeoutError)):
+        return "cancelled"
+    return "error"
+
+
+# ────────────────────── Per-call tracking ──────────────────────
+
+class _TokenHandler(BaseCallbackHandler):
+    """Picks the usage block out of LangChain's on_llm_end."""
+
+    def __init__(self, call: "UsageCall"):
+        self.call = call
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            self.call.set_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            return
+        for generations in response.generations:
+            for generation in generations:
+                meta = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if meta:
+                    self.call.set_tokens(meta.get("input_tokens", 0), meta.get("output_tokens", 0))
+                    return
+
+
+class UsageCall:
+    """Mutable record for one call, filled in by the caller inside track()."""
+
+    def __init__(self, operation: str, model: str, estimated_input: int):
+        self.operation = operation
+        self.model = model
+        self.estimated_input = estimated_input
+        self.input_tokens: int | None = None
+        self.output_tokens: int | None = None
+        self.estimated_output = 0
+        self.outcome = "ok"
+        self._t0 = time.perf_counter()
+        self._started: float | None = None
+
+    @property
+    def config(self) -> dict:
+        """LangChain invoke() config that reports the call's token usage here."""
+        return {"callbacks": [_TokenHandler(self)]}
+
+    def started(self) -> None:
+        """Mark the end of the rate-limiter wait (the API call starts now)."""
+        self._started = time.perf_counter()
+
+    def set_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        # Batched / retried chains can report several generations — add them up
+        self.input_tokens = (self.input_tokens or 0) + int(input_tokens or 0)
+        self.output_tokens = (self.output_tokens or 0) + int(output_tokens or 0)
+
+    def set_output(self, text: str) -> None:
+        """Fallback output size when the API reported no usage."""
+        self.estimated_output = estimate_tokens(text)
+
+    def fail(self, exc: BaseException) -> None:
+        self.outcome = _outcome(exc)
+
+    def row(self) -> dict:
+        end = time.perf_counter()
+        started = self._started if self._started is not None else end
+        reported = self.input_tokens is not None
+        return {
+            "created_at": datetime.now(timezone.utc),
+            "operation": self.operation,
+            "model": self.model,
+            "input_tokens": self.input_tokens if reported else (self.estimated_input if self._started else 0),
+            "output_tokens": self.output_tokens if reported else self.estimated_output,
+            "tokens_estimated": not reported,
+            "latency_ms": round((end - started) * 1000),
+            "queue_ms": round((started - self._t0) * 1000),
+            "cache": "miss",
+            "outcome": self.outcome,
+        }
+
+
+@contextmanager
+def track(operation: str, model: str, estimated_input: int):
+    """
+    Account for one LLM call:
+
+        with track("classify_urgency", MODEL, tokens) as call:
+            limiter.acquire(...)
+            call.started()
+            response = client.chat.completions.create(...)
+            call.set_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+
+    Exceptions propagate after the outcome is recorded.
+    """
+    call = UsageCall(operation, model, estimated_input)
+    try:
+        yield call
+    except BaseException as exc:
+        call.fail(exc)
+        raise
+    finally:
+        _emit(call.row())
+
+
+def record_hit(operation: str, model: str) -> None:
+    """A cache hit that saved an LLM call — zero tokens, counted for the hit rate."""
+    _emit({
+        "created_at": datetime.now(timezone.utc),
+        "operation": operation,
+        "model": model,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "tokens_estimated": False,
+        "latency_ms": 0,
+        "queue_ms": 0,
+        "cache": "hit",
+        "outcome": "ok",
+    })
+
+
+# ────────────────────── Buffered writer ──────────────────────
+
+class UsageRecorder:
+    """In-memory buffer flushed to llm_usage by a background thread."""
+
+    def __init__(self, flush_seconds: float = USAGE_FLUSH_SECONDS, max_buffer: int = USAGE_BUFFER_MAX):
+        self.flush_seconds = flush_seconds
+        self._buffer: deque[dict] = deque(maxlen=max_buffer)  # oldest rows dropped if the DB is down
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, row: dict) -> None:
+        if not USAGE_TRACKING_ENABLED:
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._buffer)
+                self._buffer.clear()
+            if not rows:
+                return 0
+            from sqlalchemy import insert
+            from database import SessionLocal
+            from models import LLMUsage
+            try:
+                with SessionLocal() as db:
+                    db.execute(insert(LLMUsage), rows)
+                    db.commit()
+            except Exception as e:
+                logger.warning("Could not write %d usage row(s), will retry: %s", len(rows), e)
+                with self._lock:
+                    self._buffer.extendleft(reversed(rows))
+                return 0
+            self.written += len(rows)
+            return len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def start(self) -> None:
+        if USAGE_TRACKING_ENABLED and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write what is left."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=self.flush_seconds + 5)
+            self._thread = None
+        self.flush()
+
+
+# One recorder per process, shared by every LLM call site.
+_recorder = UsageRecorder()
+
+
+def _emit(row: dict) -> None:
+    """Update the /metrics counters and queue the row for llm_usage."""
+    model, operation = row["model"], row["operation"]
+    LLM_CALLS.inc(model=model, operation=operation, cache=row["cache"], outcome=row["outcome"])
+    if row["cache"] == "miss":
+        LLM_TOKENS.inc(row["input_tokens"], model=model, direction="input")
+        LLM_TOKENS.inc(row["output_tokens"], model=model, direction="output")
+        LLM_SECONDS.observe(row["latency_ms"] / 1000, model=model, operation=operation)
+        LLM_QUEUE_SECONDS.observe(row["queue_ms"] / 1000, model=model)
+    _recorder.add(row)
+start = _recorder.start
+stop = _recorder.stop
+flush = _recorder.flush
+
+
+# ────────────────────── Reporting ──────────────────────
+
+def usage_report(db, hours: int = 24, model: str | None = None) -> dict:
+    """Totals per model and per (hour, model) over the last `hours` hours."""
+    from sqlalchemy import func, case
+    from models import LLMUsage
+
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    if db.get_bind().dialect.name == "postgresql":
+        hour = func.date_trunc("hour", LLMUsage.created_at)
+    else:
+        hour = func.strftime("%Y-%m-%dT%H:00:00", LLMUsage.created_at)
+
+    measures = (
+        func.count().label("calls"),
+        func.sum(case((LLMUsage.cache == "hit", 1), else_=0)).label("cache_hits"),
+        func.sum(case((LLMUsage.outcome != "ok", 1), else_=0)).label("failures"),
+        func.sum(LLMUsage.input_tokens).label("input_tokens"),
+        func.sum(LLMUsage.output_tokens).label("output_tokens"),
+        func.avg(case((LLMUsage.cache == "miss", LLMUsage.latency_ms))).label("avg_latency_ms"),
+        func.avg(case((LLMUsage.cache == "miss", LLMUsage.queue_ms))).label("avg_queue_ms"),
+    )
+
+    def _query(*group_by):
+        query = db.query(*group_by, *measures).filter(LLMUsage.created_at >= since)
+        if model:
+            query = query.filter(LLMUsage.model == model)
+        return query.group_by(*group_by).order_by(*group_by).all()
+
+    def _measures(row) -> dict:
+        input_tokens, output_tokens = int(row.input_tokens or 0), int(row.output_tokens or 0)
+        return {
+            "calls": row.calls,
+            "cache_hits": int(row.cache_hits or 0),
+            "failures": int(row.failures or 0),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "avg_latency_ms": round(float(row.avg_latency_ms), 1) if row.avg_latency_ms is not None else None,
+            "avg_queue_ms": round(float(row.avg_queue_ms), 1) if row.avg_queue_ms is not None else None,
+        }
+
+    per_model = {row.model: _measures(row) for row in _query(LLMUsage.model)}
+    per_hour = [
+        {
+            "hour": value.isoformat() if hasattr(value, "isoformat") else str(value),
+            "model": row.model,
+            **_measures(row),
+        }
+        for row in _query(hour.label("hour"), LLMUsage.model)
+        for value in (row.hour,)
+    ]
+    return {
+        "since": since.isoformat(),
+        "hours": hours,
+        "per_model": per_model,
+        "per_hour": per_hour,
+        "recorder": {"buffered": len(_recorder._buffer), "written": _recorder.written, "dropped": _recorder.dropped},
+    }
@@ -11,6 +11,7 @@ from streamlit_autorefresh import st_autorefresh
 import requests
 import re
 import os
+import json
 import time as _time
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -223,6 +224,44 @@ def _fetch_tickets(status: str = "All"):
         return []
 
 
+def _api_get_ticket(tid: str):
+    try:
+        r = requests.get(f"{API}/tickets/{tid}", timeout=60)
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        return None
+
+
+def _stream_draft(tid: str, regenerate: bool = False):
+    """Yield draft text from the SSE endpoint as the model writes it."""
+    params = {"regenerate": "true"} if regenerate else None
+    with requests.get(f"{API}/tickets/{tid}/draft/stream", params=params, stream=True, timeout=(5, 60)) as r:
+        r.raise_for_status()
+        event = None
+        for line in r.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "token":
+                yield json.loads(line[len("data: "):])["text"]
+            elif line.startswith("data: ") and event == "error":
+                raise RuntimeError(json.loads(line[len("data: "):])["detail"])
+
+
+def _render_draft_stream(tid: str, regenerate: bool = False):
+    """Show a streamed draft token by token; returns the full text (the stored draft on failure)."""
+    box, text = st.empty(), ""
+    try:
+        for piece in _stream_draft(tid, regenerate):
+            text += piece
+            box.text(text + "▌")
+    except Exception:
+        box.empty()
+        return (_api_get_ticket(tid) or {}).get("draft_response")
+    box.empty()
+    return text.strip() or None
+
+
 def _api_approve(tid: str):
     try:
         r = requests.post(f"{API}/approve_ticket/{tid}", timeout=30)
@@ -474,12 +513,18 @@ def _render_detail(ticket: dict, key_prefix: str = "d"):
     st.markdown(f"**{icon('file-text', '#4f46e5', 15)} Summary:** {ticket.get('summary', 'N/A')}", unsafe_allow_html=True)
 
     st.markdown(section_header("edit-3", "Draft Response"), unsafe_allow_html=True)
+    # Lazy drafts (DRAFT_MODE=lazy): stream the reply in as the backend writes it
+    if st.session_state.pop(f"regen_{kp}_{tid}", False):
+        ticket["draft_response"] = _render_draft_stream(tid, regenerate=True)
+        st.session_state.pop(f"draft_{kp}_{tid}", None)  # let the text area take the new draft
+    elif ticket.get("draft_response") is None and _st in ("New", "Open", "In Progress"):
+        ticket["draft_response"] = _render_draft_stream(tid)
     draft = st.text_area(
-        "draft", value=ticket.get("draft_response", ""),
+        "draft", value=ticket.get("draft_response") or "",
         height=170, key=f"draft_{kp}_{tid}", label_visibility="collapsed",
     )
     if _st in ("New", "Open", "In Progress"):
-        b1, b2, b3 = st.columns([1, 1, 1])
+        b1, b2, b3, b4 = st.columns([1, 1, 1, 1])
         with b1:
             if st.button("Approve & Send", key=f"ap_{kp}_{tid}", type="primary", use_container_width=True):
                 with st.spinner("Sending email…"):
@@ -493,13 +538,21 @@ def _render_detail(ticket: dict, key_prefix: str = "d"):
                     st.session_state.sel = None
                     st.rerun()
         with b2:
+            # The backend keeps human-edited drafts and drafts of approved tickets
+            if st.button(
+                "Regenerate Draft", key=f"rg_{kp}_{tid}", use_container_width=True,
+                disabled=bool(ticket.get("is_ai_draft_edited")) or _st == "In Progress",
+            ):
+                st.session_state[f"regen_{kp}_{tid}"] = True
+                st.rerun()
+        with b3:
             if st.button("Close Ticket", key=f"cl_{kp}_{tid}", use_container_width=True):
                 with st.spinner("Closing…"):
                     if _api_close(tid):
                         st.warning("Ticket closed without reply.")
                         st.session_state.sel = None
                         st.rerun()
-        with b3:
+        with b4:
             if st.button("← Back to list", key=f"bk_{kp}_{tid}", use_container_width=True):
                 st.session_state.sel = None
                 st.rerun()
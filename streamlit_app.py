@@ -43,6 +43,8 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from enum import Enum as PyEnum
 
+from preprocess import html_to_text, preprocess_email
+
 # ═══════════════════════════════════════════════════════
 #  LOAD SECRETS  (Streamlit Cloud uses st.secrets, local uses .env)
 # ═══════════════════════════════════════════════════════
@@ -304,7 +306,8 @@ def analyze_and_draft(email_body: str) -> TicketAnalysisWithDraft:
     if not email_body or not email_body.strip():
         raise ValueError("email_body cannot be empty.")
 
-    clean = email_body.strip()
+    # Trim quoted history / signature / boilerplate from the prompt only
+    clean = preprocess_email(email_body).text
     key = hashlib.sha256(clean.encode()).hexdigest()
 
     cache = st.session_state.analysis_cache
@@ -412,8 +415,7 @@ def fetch_emails_from_gmail(include_read: bool = False, max_emails: int = 5) ->
                     payload = part.get_payload(decode=True)
                     if payload:
                         html = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
-                        body = re.sub(r"<[^>]+>", " ", html)
-                        body = re.sub(r"\s+", " ", body).strip()
+                        body = html_to_text(html)
         else:
             payload = msg.get_payload(decode=True)
             if payload: